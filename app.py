@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
-from io import BytesIO
 from main import enrichir_sirens  # votre fonction refactorée
+from export_excel import TYPE_MIME_EXCEL, excel_en_octets
+from limiteur import limiteur_partage
 
 st.title("Enrichissement des SIREN")
 st.markdown("Importez votre CSV et récupérez un fichier Excel enrichi.")
@@ -11,9 +12,9 @@ if uploaded:
     df = pd.read_csv(uploaded, sep=';', dtype=str)
     if st.button("Lancer l'enrichissement"):
         with st.spinner("Traitement en cours…"):
-            df_out = enrichir_sirens(df, verbose=False)  
-            buffer = BytesIO()
-            df_out.to_excel(buffer, index=False, engine='openpyxl')
-            buffer.seek(0)
+            # Limiteur du processus : les sessions simultanées se partagent le quota de l'API
+            df_out = enrichir_sirens(df, verbose=False, limiteur=limiteur_partage())
+            contenu_excel = excel_en_octets(df_out)
         st.success("Terminé ! Téléchargez votre fichier ci-dessous.")
-        st.download_button("Télécharger le fichier enrichi", buffer, file_name="avec_sirens.xlsx")
+        st.download_button("Télécharger le fichier enrichi", contenu_excel, file_name="avec_sirens.xlsx",
+                           mime=TYPE_MIME_EXCEL)
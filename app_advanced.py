@@ -1,8 +1,67 @@
+import hashlib
+from io import BytesIO
+
 import streamlit as st
 import pandas as pd
-from io import BytesIO
-import time
-from main import enrichir_sirens, valider_dataframe
+from main import enrichir_sirens, masque_siren_renseigne, valider_dataframe
+from cache_recherche import cache_memoire_partage
+from export_excel import TYPE_MIME_EXCEL, LimiteExcelDepassee, excel_en_octets
+from limiteur import DEBIT_MAX_API, limiteur_partage
+from travaux import ANNULE, ECHEC, TERMINE, registre_partage
+
+# Lignes enrichies avant publication d'un résultat partiel
+TAILLE_BLOC_TRAVAIL = 500
+
+# Registre du processus : les travaux survivent aux réexécutions du script
+registre = registre_partage()
+
+# Résultats partagés par toutes les sessions : une entreprise recherchée par
+# deux utilisateurs en même temps ne coûte qu'un appel API
+memoire_recherches = cache_memoire_partage()
+
+# Mémoïsation entre réexécutions : fichiers lus et exports conservés, bornés
+# en nombre et en durée (partagés par les sessions, clés = empreinte du contenu)
+CACHE_MAX_FICHIERS = 4
+CACHE_MAX_EXPORTS = 8
+CACHE_DUREE = 3600
+
+def empreinte_contenu(contenu: bytes) -> str:
+    """Empreinte du fichier importé, clé des caches ci-dessous"""
+    return hashlib.blake2b(contenu, digest_size=16).hexdigest()
+
+# Arguments préfixés par « _ » : exclus du hachage de Streamlit, la clé est
+# l'empreinte (hacher le contenu ou le DataFrame à chaque réexécution coûterait
+# presque autant que le recalcul)
+@st.cache_data(max_entries=CACHE_MAX_FICHIERS, ttl=CACHE_DUREE, show_spinner="Lecture du fichier…")
+def charger_fichier(empreinte: str, separateur: str, encodage: str, _contenu: bytes):
+    """
+    Lecture, validation et statistiques d'un fichier importé, calculées une
+    fois par (contenu, séparateur, encodage)
+
+    Returns:
+        (DataFrame validé, masque des lignes dont le SIREN est renseigné)
+    """
+    df = valider_dataframe(pd.read_csv(BytesIO(_contenu), sep=separateur, encoding=encodage, dtype=str))
+    return df, masque_siren_renseigne(df)
+
+@st.cache_data(max_entries=CACHE_MAX_EXPORTS, ttl=CACHE_DUREE, show_spinner="Préparation du fichier…")
+def exporter(cle: str, format_export: str, separateur: str, encodage: str, _df: pd.DataFrame):
+    """
+    Contenu téléchargeable de `_df` ("excel" ou "csv"), construit une fois
+    par `cle` (identifiant des données) et paramètres ; None si les données
+    dépassent une feuille Excel
+    """
+    if format_export == "excel":
+        try:
+            return excel_en_octets(_df)
+        except LimiteExcelDepassee:
+            return None
+    return _df.to_csv(sep=separateur, index=False).encode(encodage, errors="replace")
+
+def vider_caches():
+    """Invalidation explicite des fichiers lus et des exports"""
+    charger_fichier.clear()
+    exporter.clear()
 
 # Configuration de la page
 st.set_page_config(
@@ -48,17 +107,78 @@ with st.sidebar:
     mode_verbose = st.checkbox(
         "Mode détaillé",
         value=False,
-        help="Afficher les détails du traitement (plus lent)"
+        help="Afficher le détail de chaque recherche dans la console du serveur (plus lent)"
     )
     
-    delai_api = st.slider(
-        "Délai entre requêtes (sec)",
+    # Limiteur unique pour tout le processus : le quota de l'API est partagé
+    # par toutes les sessions Streamlit ouvertes
+    limiteur_api = limiteur_partage()
+    debit_api = st.slider(
+        "Débit API (requêtes/sec)",
         min_value=0.5,
-        max_value=3.0,
-        value=1.0,
-        step=0.1,
-        help="Temps d'attente entre chaque appel API"
+        max_value=DEBIT_MAX_API,
+        value=float(limiteur_api.debit_nominal),
+        step=0.5,
+        help="Quota d'appels API par seconde, partagé par toutes les sessions de l'application "
+             "(abaissé automatiquement en cas de réponses 429)"
     )
+    if debit_api != limiteur_api.debit_nominal:
+        limiteur_api.modifier_debit(debit_api)
+    
+    st.subheader("Cache")
+    st.button("🗑️ Vider le cache", on_click=vider_caches,
+              help="Oublie les fichiers lus et les exports préparés (relus au prochain affichage)")
+
+@st.fragment(run_every=1.0)
+def suivre_travail():
+    """
+    Progression du travail d'enrichissement de la session, rafraîchie chaque
+    seconde sans réexécuter le script ; à la fin du travail, son résultat
+    (après annulation, toutes les lignes, dont celles non traitées) est
+    placé dans la session
+    """
+    travail = registre.obtenir(st.session_state.get('travail_id', ''))
+    if travail is None:
+        return
+    etat = travail.etat_courant()
+    st.progress(etat['fraction'], text=f"{etat['lignes_traitees']} / {etat['lignes_total']} lignes")
+    
+    if etat['etat'] == ECHEC:
+        st.error(f"❌ Erreur lors de l'enrichissement : {etat['erreur']}")
+        return
+    if etat['etat'] not in (TERMINE, ANNULE):
+        reste = f", reste environ {etat['eta_s']:.0f} s" if etat['eta_s'] is not None else ""
+        st.info(f"⏳ Enrichissement en cours ({etat['duree_s']:.0f} s écoulées{reste})")
+        partiel = travail.resultat_partiel()
+        if len(partiel):
+            st.caption("Dernières lignes enrichies")
+            st.dataframe(partiel.tail(10), use_container_width=True, hide_index=True)
+        return
+    
+    lignes = travail.metriques.resume()['lignes']
+    if etat['etat'] == TERMINE:
+        st.success("✅ Enrichissement terminé !")
+    else:
+        st.warning(f"⏹️ Enrichissement annulé : {etat['lignes_traitees']} ligne(s) enrichie(s) ; "
+                   f"les autres sont conservées telles quelles (statut « non traité »)")
+    col_stat1, col_stat2, col_stat3, col_stat4 = st.columns(4)
+    with col_stat1:
+        st.metric("Temps", f"{etat['duree_s']:.1f}s")
+    with col_stat2:
+        st.metric("Nouveaux SIRENs", lignes['trouvees'])
+    with col_stat3:
+        taux_succes = lignes['trouvees'] / lignes['a_enrichir'] * 100 if lignes['a_enrichir'] else 0
+        st.metric("Taux de succès", f"{taux_succes:.1f}%")
+    with col_stat4:
+        st.metric("Lignes traitées", lignes['traitees'])
+    
+    # Résultat placé une seule fois dans la session, puis réexécution
+    # complète pour afficher les téléchargements
+    if st.session_state.get('travail_recupere') != travail.identifiant:
+        st.session_state['travail_recupere'] = travail.identifiant
+        st.session_state['df_enrichi'] = travail.resultat_complet()
+        st.session_state['enrichissement_effectue'] = True
+        st.rerun()
 
 # Zone principale
 col1, col2 = st.columns([2, 1])
@@ -81,21 +201,16 @@ with col2:
 # Traitement du fichier uploadé
 if uploaded_file:
     try:
-        # Lecture du fichier
-        df = pd.read_csv(
-            uploaded_file, 
-            sep=separateur, 
-            encoding=encodage,
-            dtype=str
-        )
-        
-        # Validation basique
-        df_validated = valider_dataframe(df)
+        # Lecture, validation et statistiques : recalculées seulement si le
+        # contenu du fichier ou les paramètres de lecture changent
+        contenu_fichier = uploaded_file.getvalue()
+        empreinte = empreinte_contenu(contenu_fichier)
+        df_validated, siren_renseigne = charger_fichier(empreinte, separateur, encodage, contenu_fichier)
         
         # Affichage des statistiques
         with metric_container:
             total_lignes = len(df_validated)
-            sirens_existants = df_validated['Num Siren'].notna().sum()
+            sirens_existants = int(siren_renseigne.sum())
             sirens_manquants = total_lignes - sirens_existants
             
             st.metric("Total lignes", total_lignes)
@@ -123,11 +238,7 @@ if uploaded_file:
                 st.info(f"Affichage des 10 premières lignes sur {len(df_validated)} total")
         
         with tab2:
-            sirens_manquants_df = df_validated[
-                df_validated['Num Siren'].isna() | 
-                (df_validated['Num Siren'] == '') |
-                (df_validated['Num Siren'] == '0')
-            ]
+            sirens_manquants_df = df_validated[~siren_renseigne]
             if not sirens_manquants_df.empty:
                 st.dataframe(sirens_manquants_df, use_container_width=True, hide_index=True)
                 st.info(f"{len(sirens_manquants_df)} ligne(s) sans SIREN")
@@ -135,11 +246,7 @@ if uploaded_file:
                 st.success("Aucun SIREN manquant !")
         
         with tab3:
-            sirens_existants_df = df_validated[
-                df_validated['Num Siren'].notna() & 
-                (df_validated['Num Siren'] != '') &
-                (df_validated['Num Siren'] != '0')
-            ]
+            sirens_existants_df = df_validated[siren_renseigne]
             if not sirens_existants_df.empty:
                 st.dataframe(sirens_existants_df, use_container_width=True, hide_index=True)
                 st.info(f"{len(sirens_existants_df)} ligne(s) avec SIREN")
@@ -153,57 +260,18 @@ if uploaded_file:
             col_btn1, col_btn2, col_btn3 = st.columns(3)
             
             with col_btn1:
-                if st.button("🎯 Lancer l'enrichissement", type="primary", use_container_width=True):
-                    # Progress bar et statistiques en temps réel
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    stats_container = st.container()
-                    
-                    start_time = time.time()
-                    
-                    try:
-                        with st.spinner("Enrichissement en cours..."):
-                            # Modification temporaire du délai dans main.py si nécessaire
-                            import main
-                            original_sleep = main.sleep
-                            main.sleep = lambda x: time.sleep(delai_api)
-                            
-                            df_enrichi = enrichir_sirens(df_validated, verbose=mode_verbose)
-                            
-                            # Restaurer la fonction sleep originale
-                            main.sleep = original_sleep
-                        
-                        # Calcul des résultats
-                        end_time = time.time()
-                        temps_traitement = end_time - start_time
-                        
-                        nouveaux_sirens = df_enrichi['Num Siren'].notna().sum() - sirens_existants
-                        taux_succes = (nouveaux_sirens / sirens_manquants) * 100 if sirens_manquants > 0 else 0
-                        
-                        # Affichage des résultats
-                        progress_bar.progress(1.0)
-                        status_text.success("✅ Enrichissement terminé !")
-                        
-                        with stats_container:
-                            col_stat1, col_stat2, col_stat3, col_stat4 = st.columns(4)
-                            with col_stat1:
-                                st.metric("Temps", f"{temps_traitement:.1f}s")
-                            with col_stat2:
-                                st.metric("Nouveaux SIRENs", nouveaux_sirens)
-                            with col_stat3:
-                                st.metric("Taux de succès", f"{taux_succes:.1f}%")
-                            with col_stat4:
-                                st.metric("Total SIRENs", df_enrichi['Num Siren'].notna().sum())
-                        
-                        # Stockage dans la session
-                        st.session_state['df_enrichi'] = df_enrichi
-                        st.session_state['enrichissement_effectue'] = True
-                        
-                        st.balloons()
-                        
-                    except Exception as e:
-                        st.error(f"❌ Erreur lors de l'enrichissement : {str(e)}")
-                        st.exception(e)
+                travail_actif = registre.obtenir(st.session_state.get('travail_id', ''))
+                en_cours = travail_actif is not None and not travail_actif.fini
+                if st.button("🎯 Lancer l'enrichissement", type="primary", use_container_width=True,
+                             disabled=en_cours):
+                    # Enrichissement en arrière-plan : il survit aux réexécutions du script
+                    st.session_state['travail_id'] = registre.soumettre(
+                        df_validated, taille_bloc=TAILLE_BLOC_TRAVAIL, limiteur=limiteur_api,
+                        memoire=memoire_recherches, verbose=mode_verbose
+                    )
+                    st.session_state['enrichissement_effectue'] = False
+                if en_cours and st.button("⏹️ Annuler", use_container_width=True):
+                    registre.annuler(travail_actif.identifiant)
             
             with col_btn2:
                 if st.button("📊 Test (5 lignes)", use_container_width=True):
@@ -212,7 +280,9 @@ if uploaded_file:
                     
                     try:
                         with st.spinner("Test en cours..."):
-                            df_test_enrichi = enrichir_sirens(df_test, verbose=True)
+                            df_test_enrichi = enrichir_sirens(df_test, verbose=True,
+                                                              limiteur=limiteur_api,
+                                                              memoire=memoire_recherches)
                         
                         st.success("✅ Test terminé !")
                         st.dataframe(df_test_enrichi, use_container_width=True, hide_index=True)
@@ -228,22 +298,24 @@ if uploaded_file:
                     mime="text/csv",
                     use_container_width=True
                 )
+            
+            suivre_travail()
         
         else:
             st.info("ℹ️ Aucun enrichissement nécessaire - tous les SIRENs sont déjà renseignés")
             
             # Bouton pour télécharger quand même
-            buffer = BytesIO()
-            df_validated.to_excel(buffer, index=False, engine='openpyxl')
-            buffer.seek(0)
-            
-            st.download_button(
-                "📥 Télécharger en Excel",
-                data=buffer,
-                file_name="donnees_completes.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
+            contenu_excel = exporter(f"original:{empreinte}", "excel", separateur, encodage, df_validated)
+            if contenu_excel is not None:
+                st.download_button(
+                    "📥 Télécharger en Excel",
+                    data=contenu_excel,
+                    file_name="donnees_completes.xlsx",
+                    mime=TYPE_MIME_EXCEL,
+                    use_container_width=True
+                )
+            else:
+                st.warning("⚠️ Trop de lignes pour une feuille Excel : utilisez le fichier CSV d'origine")
         
         # Section de téléchargement si enrichissement effectué
         if st.session_state.get('enrichissement_effectue', False) and 'df_enrichi' in st.session_state:
@@ -254,22 +326,23 @@ if uploaded_file:
             col_dl1, col_dl2 = st.columns(2)
             
             with col_dl1:
-                # Excel
-                buffer_excel = BytesIO()
-                df_enrichi.to_excel(buffer_excel, index=False, engine='openpyxl')
-                buffer_excel.seek(0)
-                
-                st.download_button(
-                    "📊 Télécharger Excel",
-                    data=buffer_excel,
-                    file_name="donnees_enrichies.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+                # Excel, construit une fois par enrichissement
+                cle_enrichi = f"enrichi:{st.session_state.get('travail_recupere')}"
+                contenu_excel = exporter(cle_enrichi, "excel", separateur, encodage, df_enrichi)
+                if contenu_excel is not None:
+                    st.download_button(
+                        "📊 Télécharger Excel",
+                        data=contenu_excel,
+                        file_name="donnees_enrichies.xlsx",
+                        mime=TYPE_MIME_EXCEL,
+                        use_container_width=True
+                    )
+                else:
+                    st.warning("⚠️ Trop de lignes pour une feuille Excel (1 048 576 max) : téléchargez le CSV")
             
             with col_dl2:
-                # CSV
-                csv_enrichi = df_enrichi.to_csv(sep=separateur, index=False, encoding=encodage)
+                # CSV, dans l'encodage du fichier importé
+                csv_enrichi = exporter(cle_enrichi, "csv", separateur, encodage, df_enrichi)
                 
                 st.download_button(
                     "📄 Télécharger CSV",
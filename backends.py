@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Sources de recherche SIREN interchangeables (backends).
+
+Un backend répond à `rechercher(nom, code_postal)` par un `ResultatRecherche`
+(ou None si aucune entreprise ne correspond) et lève une exception en cas
+d'échec. Les backends se composent pour interroger la source la plus rapide
+d'abord, par exemple :
+
+    BackendCache(cache, BackendCascade([BackendIndex(index), BackendAPI()]))
+
+L'API gouvernementale (`main.BackendAPI`) reste la source par défaut
+d'`enrichir_sirens`.
+"""
+
+from time import monotonic
+from typing import List, Optional, Protocol, Sequence, Tuple, Union
+
+from cache_recherche import ABSENT, AttenteExpiree
+
+class DelaiDepasse(TimeoutError):
+    """
+    Le budget de temps de l'enrichissement est épuisé : la recherche n'a pas
+    été tentée (ou a été abandonnée) et reste à faire
+    """
+
+class ResultatRecherche:
+    """
+    Résultat d'une recherche : SIREN trouvé, source qui l'a fourni, score de
+    confiance de la correspondance de nom (entre 0 et 1, None si la source
+    n'en fournit pas) et informations sur l'entreprise retenue, lorsque la
+    source les connaît
+    """
+
+    __slots__ = ("siren", "source", "score", "nom", "code_postal", "code_naf", "adresse")
+
+    # Champs conservés par les caches et journaux (la source est celle de la lecture)
+    CHAMPS_MEMORISES = ("siren", "score", "nom", "code_postal", "code_naf", "adresse")
+
+    def __init__(self, siren: str, source: str, score: Optional[float] = None,
+                 nom: Optional[str] = None, code_postal: Optional[str] = None,
+                 code_naf: Optional[str] = None, adresse: Optional[str] = None):
+        self.siren = siren
+        self.source = source
+        self.score = score
+        self.nom = nom
+        self.code_postal = code_postal
+        self.code_naf = code_naf
+        self.adresse = adresse
+
+    def en_dict(self) -> dict:
+        """Forme JSON compacte, sans les champs vides ni la source"""
+        return {champ: getattr(self, champ) for champ in self.CHAMPS_MEMORISES
+                if getattr(self, champ) is not None}
+
+    @classmethod
+    def depuis_memoire(cls, valeur, source: str) -> Optional["ResultatRecherche"]:
+        """
+        Reconstruit un résultat lu dans un cache ou un journal : dictionnaire
+        (`en_dict`), SIREN seul (entrées antérieures) ou None
+        """
+        if isinstance(valeur, dict):
+            valeur = dict(valeur)
+            siren = valeur.pop("siren", None)
+            return cls(siren, source, **valeur) if siren else None
+        return cls(valeur, source) if valeur else None
+
+    def __eq__(self, autre) -> bool:
+        return (isinstance(autre, ResultatRecherche)
+                and all(getattr(self, champ) == getattr(autre, champ) for champ in self.__slots__))
+
+    def __repr__(self) -> str:
+        champs = ", ".join(f"{champ}={getattr(self, champ)!r}" for champ in self.__slots__
+                           if getattr(self, champ) is not None)
+        return f"ResultatRecherche({champs})"
+
+# Élément d'un résultat de lot : résultat, None (aucune entreprise) ou erreur
+ResultatLot = Union[ResultatRecherche, None, Exception]
+
+class BackendRecherche(Protocol):
+    """Interface commune des sources de recherche SIREN"""
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        """Recherche une entreprise ; None si aucune ne correspond, exception si échec"""
+        ...
+
+    def rechercher_lot(self, recherches: Sequence[Tuple[str, str]]) -> List[ResultatLot]:
+        """
+        Recherche un lot de (nom, code_postal), résultats dans le même ordre ;
+        l'échec d'une recherche est retourné à sa place (exception) sans
+        interrompre les autres
+        """
+        ...
+
+class BackendBase:
+    """Base des backends : le lot est traité recherche par recherche"""
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        raise NotImplementedError
+
+    def rechercher_lot(self, recherches: Sequence[Tuple[str, str]]) -> List[ResultatLot]:
+        resultats = []
+        for nom, code_postal in recherches:
+            try:
+                resultats.append(self.rechercher(nom, code_postal))
+            except Exception as e:
+                resultats.append(e)
+        return resultats
+
+class BackendIndex(BackendBase):
+    """Adapte un `index_sirene.IndexSirene` (recherche locale, sans réseau)"""
+
+    def __init__(self, index, score_min: float = 0.0):
+        """
+        Args:
+            index: Index local ouvert
+            score_min: Score de confiance en dessous duquel le candidat est écarté
+        """
+        self.index = index
+        self.score_min = score_min
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        resultat = self.index.rechercher_details(nom, code_postal)
+        if resultat is None or resultat.score < self.score_min:
+            return None
+        return resultat
+
+class BackendCache(BackendBase):
+    """
+    Mémoire de résultats (cache, journal de reprise) placée devant un backend
+
+    La mémoire doit exposer `lire(nom, code_postal, espace)` (résultat
+    mémorisé, None pour un résultat négatif, ou ABSENT) et `ecrire(nom,
+    code_postal, valeur, espace)`. Les résultats y sont conservés sous la
+    forme compacte de `ResultatRecherche.en_dict` ; les échecs du backend
+    interne ne sont pas mémorisés.
+    """
+
+    def __init__(self, memoire, interne: BackendRecherche, source: str = "cache", metriques=None,
+                 espace: str = ""):
+        """
+        Args:
+            memoire: Cache ou journal de reprise
+            interne: Backend interrogé quand la mémoire ne connaît pas la recherche
+            source: Source indiquée sur les résultats lus en mémoire
+            metriques: `MetriquesEnrichissement` recevant les hits/misses
+            espace: Source et paramètres du backend interne (score minimal
+                compris), pour ne relire que des résultats comparables
+        """
+        self.memoire = memoire
+        self.interne = interne
+        self.source = source
+        self.metriques = metriques
+        self.espace = espace
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        valeur = self.memoire.lire(nom, code_postal, self.espace)
+        if self.metriques is not None:
+            self.metriques.observer_memoire(self.source, valeur is not ABSENT)
+        if valeur is not ABSENT:
+            return ResultatRecherche.depuis_memoire(valeur, self.source)
+        resultat = self.interne.rechercher(nom, code_postal)
+        self.memoire.ecrire(nom, code_postal, resultat.en_dict() if resultat else None, self.espace)
+        return resultat
+
+class BackendMemoire(BackendBase):
+    """
+    Étage mémoire du processus (`cache_recherche.CacheMemoire`) placé devant
+    un backend : les recherches identiques lancées en même temps par
+    plusieurs enrichissements n'interrogent le backend qu'une fois
+    """
+
+    def __init__(self, memoire, interne: BackendRecherche, espace: str = "", metriques=None,
+                 echeance: Optional[float] = None):
+        """
+        Args:
+            memoire: `CacheMemoire`, en général celui du processus (`cache_memoire_partage`)
+            interne: Backend interrogé quand la mémoire ne connaît pas la recherche
+            espace: Source et paramètres de la recherche, pour ne partager que
+                des résultats comparables
+            metriques: `MetriquesEnrichissement` recevant les hits/misses
+            echeance: Instant limite (horloge de `time.monotonic`) au-delà
+                duquel l'attente d'une recherche identique lève `DelaiDepasse`
+        """
+        self.memoire = memoire
+        self.interne = interne
+        self.espace = espace
+        self.metriques = metriques
+        self.echeance = echeance
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        obtenu = []
+
+        def rechercher_interne():
+            resultat = self.interne.rechercher(nom, code_postal)
+            obtenu.append(resultat)
+            return resultat.en_dict() if resultat else None
+
+        try:
+            valeur, recherche = self.memoire.obtenir(nom, code_postal, rechercher_interne, self.espace,
+                                                     self.echeance)
+        except AttenteExpiree as e:
+            raise DelaiDepasse(str(e)) from e
+        if self.metriques is not None:
+            self.metriques.observer_memoire("memoire", not recherche)
+        if recherche:
+            return obtenu[0]
+        return ResultatRecherche.depuis_memoire(valeur, "memoire")
+
+class BackendEcheance(BackendBase):
+    """
+    Refuse les recherches une fois l'échéance passée, en levant
+    `DelaiDepasse` sans interroger le backend interne
+
+    Placé sous les caches et journaux, il laisse ceux-ci répondre après
+    l'échéance : seules les recherches qui coûteraient un appel sont refusées.
+    """
+
+    def __init__(self, interne: BackendRecherche, echeance: float):
+        """
+        Args:
+            interne: Backend protégé
+            echeance: Instant limite, sur l'horloge de `time.monotonic`
+        """
+        self.interne = interne
+        self.echeance = echeance
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        if monotonic() >= self.echeance:
+            raise DelaiDepasse(f"Budget de temps épuisé avant la recherche de « {nom} »")
+        return self.interne.rechercher(nom, code_postal)
+
+class BackendCascade(BackendBase):
+    """
+    Interroge les backends dans l'ordre jusqu'au premier résultat
+
+    Un backend sans résultat ou en échec passe la main au suivant ; si aucun
+    n'a trouvé et qu'au moins un a échoué, la dernière erreur est relevée
+    (la recherche sera retentée plutôt que conclue négative).
+    """
+
+    def __init__(self, backends: Sequence[BackendRecherche]):
+        if not backends:
+            raise ValueError("BackendCascade nécessite au moins un backend")
+        self.backends = list(backends)
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        erreur = None
+        for backend in self.backends:
+            try:
+                resultat = backend.rechercher(nom, code_postal)
+            except Exception as e:
+                erreur = e
+                continue
+            if resultat is not None:
+                return resultat
+        if erreur is not None:
+            raise erreur
+        return None
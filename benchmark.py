@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Banc de performance de l'enrichissement SIREN, sans appel à la vraie API.
+
+Un serveur HTTP local imite l'endpoint `/search` de recherche-entreprises
+(latence, taux de réponses 429 et part de recherches sans résultat
+configurables) ; `enrichir_sirens` est mesuré de bout en bout, en lignes par
+seconde, pour chaque mode et chaque taille de fichier. Les résultats sont
+écrits en JSON-lines (une ligne par mesure) pour suivre les régressions
+d'une version à l'autre.
+
+    python benchmark.py --tailles 500 5000 --latence 0.02 --sortie benchmark.jsonl
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import urllib.parse
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+from typing import Callable, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from cache_recherche import CacheRecherche
+from limiteur import LimiteurDebit
+from main import BackendAPI, ClientAPI, enrichir_csv_par_blocs, enrichir_sirens
+from metriques import MetriquesEnrichissement
+
+MODES = ("sequentiel", "concurrent", "cache", "blocs")
+
+class ServeurAPIFactice:
+    """
+    Serveur local imitant `GET /search` de l'API recherche-entreprises
+
+    Le SIREN retourné est dérivé du nom recherché : deux recherches du même
+    nom donnent le même résultat, d'une exécution à l'autre.
+    """
+
+    def __init__(self, latence: float = 0.02, taux_429: float = 0.0,
+                 taux_sans_resultat: float = 0.1, resultats_par_page: int = 3, graine: int = 0):
+        """
+        Args:
+            latence: Temps de réponse simulé (secondes)
+            taux_429: Proportion de réponses 429 (Retry-After: 0)
+            taux_sans_resultat: Proportion de noms sans aucune entreprise
+            resultats_par_page: Nombre de candidats par réponse
+            graine: Graine du tirage des réponses 429
+        """
+        self.latence = latence
+        self.taux_429 = taux_429
+        self.taux_sans_resultat = taux_sans_resultat
+        self.resultats_par_page = resultats_par_page
+        self.requetes = 0
+        self.reponses_429 = 0
+        self._aleatoire = random.Random(graine)
+        self._verrou = threading.Lock()
+        self._serveur = None
+
+    def reponse(self, terme: str, code_postal: str) -> dict:
+        """Contenu JSON retourné pour une recherche"""
+        empreinte = zlib.crc32(terme.upper().encode("utf-8"))
+        if empreinte % 1000 < self.taux_sans_resultat * 1000:
+            return {"results": [], "total_results": 0}
+        resultats = []
+        for rang in range(self.resultats_par_page):
+            siren = f"{(empreinte + rang * 7919) % 10 ** 9:09d}"
+            nom = terme.upper() if rang == 0 else f"{terme.upper()} {rang}"
+            resultats.append({
+                "siren": siren,
+                "nom_complet": nom,
+                "activite_principale": "62.01Z",
+                "siege": {"code_postal": code_postal, "adresse": f"{rang + 1} RUE DU TEST {code_postal}"},
+            })
+        # Le meilleur candidat n'est pas toujours le premier
+        if empreinte % 3 == 0:
+            resultats.reverse()
+        return {"results": resultats, "total_results": len(resultats)}
+
+    def demarrer(self) -> "ServeurAPIFactice":
+        factice = self
+
+        class Gestionnaire(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # En-têtes et corps sont écrits séparément : sans cela, Nagle et
+            # l'ACK retardé ajoutent ~40 ms à chaque réponse keep-alive
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                if url.path != "/search":
+                    self._envoyer(404, {"erreur": "introuvable"})
+                    return
+                parametres = urllib.parse.parse_qs(url.query)
+                with factice._verrou:
+                    factice.requetes += 1
+                    sature = factice._aleatoire.random() < factice.taux_429
+                    if sature:
+                        factice.reponses_429 += 1
+                if factice.latence:
+                    sleep(factice.latence)
+                if sature:
+                    self._envoyer(429, {"erreur": "quota dépassé"}, {"Retry-After": "0"})
+                    return
+                self._envoyer(200, factice.reponse(parametres.get("q", [""])[0],
+                                                   parametres.get("code_postal", [""])[0]))
+
+            def _envoyer(self, statut, contenu, entetes=None):
+                corps = json.dumps(contenu).encode("utf-8")
+                self.send_response(statut)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corps)))
+                for cle, valeur in (entetes or {}).items():
+                    self.send_header(cle, valeur)
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, *args):
+                pass
+
+        self._serveur = ThreadingHTTPServer(("127.0.0.1", 0), Gestionnaire)
+        self._serveur.daemon_threads = True
+        threading.Thread(target=self._serveur.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._serveur.server_port}"
+
+    def arreter(self):
+        if self._serveur is not None:
+            self._serveur.shutdown()
+            self._serveur.server_close()
+            self._serveur = None
+
+    def __enter__(self):
+        return self.demarrer()
+
+    def __exit__(self, *exc):
+        self.arreter()
+
+def generer_donnees(lignes: int, taux_doublons: float = 0.3, graine: int = 0) -> pd.DataFrame:
+    """
+    Fichier d'entreprises synthétique : `taux_doublons` des lignes répètent
+    une entreprise déjà présente, comme dans les exports réels
+    """
+    aleatoire = random.Random(graine)
+    codes_postaux = ["75001", "69001", "13001", "33000", "59000", "31000"]
+    uniques = max(1, int(lignes * (1 - taux_doublons)))
+    entreprises = [(f"ENTREPRISE TEST {i}", codes_postaux[i % len(codes_postaux)]) for i in range(uniques)]
+    choix = entreprises + [aleatoire.choice(entreprises) for _ in range(lignes - uniques)]
+    aleatoire.shuffle(choix)
+    return pd.DataFrame({
+        "Nom d'usage": [nom for nom, _ in choix],
+        "Code Postal": [code_postal for _, code_postal in choix],
+        "Num Siren": [""] * len(choix),
+    })
+
+def _version_code() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def mesurer_mode(mode: str, df: pd.DataFrame, api_base: str, workers: int = 8,
+                 requetes_par_seconde: float = 1000.0) -> dict:
+    """
+    Enrichit `df` dans un mode donné et mesure le débit de bout en bout
+
+    Modes : "sequentiel", "concurrent" (`workers` threads), "cache" (relance
+    sur un cache déjà rempli) et "blocs" (`enrichir_csv_par_blocs`, lecture
+    et écriture comprises)
+    """
+    if mode not in MODES:
+        raise ValueError(f"Mode inconnu : {mode} (attendu : {', '.join(MODES)})")
+    metriques = MetriquesEnrichissement()
+    client = ClientAPI(taille_pool=max(10, workers), limiteur=LimiteurDebit(requetes_par_seconde),
+                       delai_base=0.0)
+    backend = BackendAPI(client, api_base=api_base)
+    options = {"verbose": False, "backend": backend, "metriques": metriques,
+               "workers": 1 if mode == "sequentiel" else workers}
+    try:
+        with tempfile.TemporaryDirectory() as dossier:
+            if mode == "cache":
+                with CacheRecherche(os.path.join(dossier, "cache.sqlite")) as cache:
+                    enrichir_sirens(df.copy(), cache=cache, **options)
+                    metriques = options["metriques"] = MetriquesEnrichissement()
+                    debut = monotonic()
+                    enrichir_sirens(df.copy(), cache=cache, **options)
+                    duree = monotonic() - debut
+            elif mode == "blocs":
+                entree = os.path.join(dossier, "entree.csv")
+                df.to_csv(entree, sep=";", index=False, encoding="utf-8-sig")
+                debut = monotonic()
+                enrichir_csv_par_blocs(entree, os.path.join(dossier, "sortie.csv"),
+                                       taille_bloc=max(1, len(df) // 4), **options)
+                duree = monotonic() - debut
+            else:
+                debut = monotonic()
+                enrichir_sirens(df.copy(), **options)
+                duree = monotonic() - debut
+    finally:
+        client.fermer()
+
+    resume = metriques.resume()
+    return {
+        "mode": mode,
+        "lignes": len(df),
+        "workers": options["workers"],
+        "duree_s": round(duree, 4),
+        "lignes_par_seconde": round(len(df) / duree, 1) if duree else None,
+        "requetes": resume["requetes"],
+        "reponses_429": resume["reponses_429"],
+        "reessais": resume["reessais"],
+        "latence_p50_ms": resume["latence_p50_ms"],
+        "latence_p95_ms": resume["latence_p95_ms"],
+        "sirens_trouves": resume["lignes"]["trouvees"],
+    }
+
+def executer_benchmark(tailles: Sequence[int] = (500, 2000), modes: Sequence[str] = MODES,
+                       latence: float = 0.02, taux_429: float = 0.0, workers: int = 8,
+                       requetes_par_seconde: float = 1000.0,
+                       rapporter: Optional[Callable[[dict], None]] = None) -> List[Dict]:
+    """
+    Mesure chaque mode pour chaque taille de fichier contre un serveur factice
+
+    Args:
+        tailles: Nombres de lignes des fichiers générés
+        modes: Modes à mesurer (voir `MODES`)
+        latence: Latence simulée de l'API (secondes)
+        taux_429: Proportion de réponses 429 simulées
+        workers: Threads des modes concurrents
+        requetes_par_seconde: Débit du limiteur (élevé : on mesure le code, pas le quota)
+        rapporter: Appelée avec chaque mesure dès qu'elle est disponible
+
+    Returns:
+        Une mesure par (taille, mode), avec le contexte d'exécution
+    """
+    contexte = {
+        "horodatage": datetime.now(timezone.utc).isoformat(),
+        "version": _version_code(),
+        "python": platform.python_version(),
+        "latence_api_s": latence,
+        "taux_429": taux_429,
+    }
+    mesures = []
+    with ServeurAPIFactice(latence=latence, taux_429=taux_429) as serveur:
+        for lignes in tailles:
+            df = generer_donnees(lignes)
+            for mode in modes:
+                mesure = {**contexte, **mesurer_mode(mode, df, serveur.url, workers, requetes_par_seconde)}
+                mesures.append(mesure)
+                if rapporter is not None:
+                    rapporter(mesure)
+    return mesures
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de performance de l'enrichissement SIREN")
+    parser.add_argument("--tailles", type=int, nargs="+", default=[500, 2000], help="Nombres de lignes")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="Modes mesurés")
+    parser.add_argument("--latence", type=float, default=0.02, help="Latence simulée de l'API (s)")
+    parser.add_argument("--taux-429", type=float, default=0.0, help="Proportion de réponses 429")
+    parser.add_argument("--workers", type=int, default=8, help="Threads des modes concurrents")
+    parser.add_argument("--sortie", help="Fichier JSON-lines auquel ajouter les mesures")
+    args = parser.parse_args()
+
+    def rapporter(mesure):
+        print(f"{mesure['mode']:>11} | {mesure['lignes']:>7} lignes | {mesure['lignes_par_seconde']:>9} lignes/s "
+              f"| {mesure['requetes']:>6} requêtes | 429 : {mesure['reponses_429']}")
+        if args.sortie:
+            with open(args.sortie, "a", encoding="utf-8") as f:
+                f.write(json.dumps(mesure, ensure_ascii=False) + "\n")
+
+    executer_benchmark(args.tailles, args.modes, args.latence, args.taux_429, args.workers,
+                       rapporter=rapporter)
+
+if __name__ == "__main__":
+    main()
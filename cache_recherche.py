@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Cache persistant des recherches SIREN (SQLite).
+
+Les fichiers ré-enrichis chaque semaine contiennent surtout des couples
+(nom, code postal) déjà recherchés : le cache évite de rappeler l'API pour
+ceux-ci. Les résultats négatifs (aucune entreprise trouvée) sont conservés
+moins longtemps, car l'entreprise peut être créée ou renommée entre-temps.
+
+`CacheMemoire` ajoute un étage en mémoire, partagé par tout le processus
+(sessions Streamlit, travaux en arrière-plan) : une recherche en cours n'est
+jamais lancée une seconde fois, les demandes identiques simultanées
+attendent son résultat.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from time import monotonic, time
+from typing import Callable, Dict, Optional, Tuple, Union
+
+# Valeur retournée par `CacheRecherche.lire` quand la clé est absente ou expirée
+ABSENT = object()
+
+JOUR = 24 * 3600
+
+# Nombre de lectures dont la date est enregistrée en une seule transaction
+LOT_ACCES = 100
+
+class AttenteExpiree(TimeoutError):
+    """L'échéance de l'appelant est passée pendant l'attente d'une recherche identique en vol"""
+
+def normaliser_nom(nom: str) -> str:
+    """
+    Nom sans accents, en majuscules, sans ponctuation ni espaces multiples
+    """
+    nom = unicodedata.normalize("NFKD", nom or "")
+    nom = "".join(c for c in nom if not unicodedata.combining(c)).upper()
+    return " ".join(re.sub(r"[^\w]+", " ", nom).split())
+
+def cle_recherche(nom: str, code_postal: str, espace: str = "") -> str:
+    """
+    Clé normalisée d'une recherche : nom normalisé suivi du code postal,
+    préfixés par l'espace éventuel (source et paramètres de la recherche)
+    """
+    cle = f"{normaliser_nom(nom)}|{(code_postal or '').strip()}"
+    return f"{espace}|{cle}" if espace else cle
+
+class CacheRecherche:
+    """
+    Cache SQLite clé → résultat (SIREN, ou dictionnaire décrivant
+    l'entreprise trouvée), avec durée de vie (TTL), TTL plus court pour
+    les résultats négatifs et éviction des entrées les moins récemment lues
+    au-delà de `taille_max`.
+
+    Comme pour `CacheMemoire`, un espace (source et paramètres, dont le
+    score minimal) peut préfixer les clés : un résultat obtenu avec un seuil
+    n'est pas resservi à une recherche faite avec un autre.
+
+    Thread-safe ; le mode WAL permet de partager le fichier entre processus.
+    """
+
+    def __init__(self, chemin: str = "cache_sirens.sqlite", ttl: float = 30 * JOUR,
+                 ttl_negatif: float = 3 * JOUR, taille_max: int = 500_000):
+        """
+        Args:
+            chemin: Fichier SQLite (":memory:" pour un cache non persistant)
+            ttl: Durée de vie d'un SIREN trouvé (secondes)
+            ttl_negatif: Durée de vie d'un résultat « aucun SIREN » (secondes)
+            taille_max: Nombre maximal d'entrées conservées
+        """
+        self.chemin = chemin
+        self.ttl = ttl
+        self.ttl_negatif = ttl_negatif
+        self.taille_max = taille_max
+        self.hits = 0
+        self.hits_negatifs = 0
+        self.misses = 0
+        self._ecritures = 0
+        # Dates de lecture des hits, enregistrées par lots (une transaction
+        # par lot plutôt qu'une par lecture)
+        self._acces_en_attente: Dict[str, float] = {}
+        self._verrou = threading.Lock()
+        self._connexion = sqlite3.connect(chemin, timeout=30, check_same_thread=False)
+        if chemin != ":memory:":
+            self._connexion.execute("PRAGMA journal_mode=WAL")
+        self._connexion.execute(
+            "CREATE TABLE IF NOT EXISTS recherches ("
+            " cle TEXT PRIMARY KEY,"
+            " valeur TEXT,"
+            " expire REAL NOT NULL,"
+            " acces REAL NOT NULL)"
+        )
+        self._connexion.execute("CREATE INDEX IF NOT EXISTS idx_recherches_acces ON recherches (acces)")
+        self._connexion.commit()
+
+    def lire(self, nom: str, code_postal: str, espace: str = ""):
+        """
+        Returns:
+            Le résultat en cache (None pour un résultat négatif), ou ABSENT
+        """
+        cle = cle_recherche(nom, code_postal, espace)
+        maintenant = time()
+        with self._verrou:
+            ligne = self._connexion.execute(
+                "SELECT valeur, expire FROM recherches WHERE cle = ?", (cle,)
+            ).fetchone()
+            if ligne is None or ligne[1] < maintenant:
+                self.misses += 1
+                return ABSENT
+            self._acces_en_attente[cle] = maintenant
+            if len(self._acces_en_attente) >= LOT_ACCES:
+                self._enregistrer_acces()
+                self._connexion.commit()
+            valeur = json.loads(ligne[0])
+            self.hits += 1
+            if valeur is None:
+                self.hits_negatifs += 1
+            return valeur
+
+    def _enregistrer_acces(self):
+        """Écrit les dates de lecture en attente (verrou tenu, sans commit)"""
+        if self._acces_en_attente:
+            self._connexion.executemany("UPDATE recherches SET acces = ? WHERE cle = ?",
+                                        [(acces, cle) for cle, acces in self._acces_en_attente.items()])
+            self._acces_en_attente.clear()
+
+    def ecrire(self, nom: str, code_postal: str, valeur: Union[str, dict, None], espace: str = ""):
+        """Enregistre le résultat d'une recherche (None = aucun SIREN trouvé)"""
+        maintenant = time()
+        expire = maintenant + (self.ttl if valeur else self.ttl_negatif)
+        with self._verrou:
+            self._enregistrer_acces()
+            self._connexion.execute(
+                "INSERT OR REPLACE INTO recherches (cle, valeur, expire, acces) VALUES (?, ?, ?, ?)",
+                (cle_recherche(nom, code_postal, espace), json.dumps(valeur or None, ensure_ascii=False),
+                 expire, maintenant),
+            )
+            self._connexion.commit()
+            self._ecritures += 1
+            if self._ecritures % 100 == 0:
+                self._evincer(maintenant)
+
+    def _evincer(self, maintenant: float):
+        """Supprime les entrées expirées puis les moins récemment lues au-delà de taille_max"""
+        self._connexion.execute("DELETE FROM recherches WHERE expire < ?", (maintenant,))
+        excedent = self._connexion.execute("SELECT COUNT(*) FROM recherches").fetchone()[0] - self.taille_max
+        if excedent > 0:
+            self._connexion.execute(
+                "DELETE FROM recherches WHERE cle IN "
+                "(SELECT cle FROM recherches ORDER BY acces LIMIT ?)", (excedent,)
+            )
+        self._connexion.commit()
+
+    def __len__(self) -> int:
+        with self._verrou:
+            return self._connexion.execute("SELECT COUNT(*) FROM recherches").fetchone()[0]
+
+    def statistiques(self) -> dict:
+        """Compteurs de hits/misses depuis l'ouverture du cache"""
+        lectures = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "hits_negatifs": self.hits_negatifs,
+            "misses": self.misses,
+            "taux_hit": self.hits / lectures if lectures else 0.0,
+        }
+
+    def vider(self):
+        """Supprime toutes les entrées"""
+        with self._verrou:
+            self._acces_en_attente.clear()
+            self._connexion.execute("DELETE FROM recherches")
+            self._connexion.commit()
+
+    def fermer(self):
+        with self._verrou:
+            self._enregistrer_acces()
+            self._connexion.commit()
+            self._connexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+class CacheMemoire:
+    """
+    Cache LRU en mémoire, thread-safe, avec TTL, et coalescence des
+    recherches en vol (« single-flight ») : pour une clé donnée, seul le
+    premier appelant effectue la recherche, les appelants simultanés
+    attendent son résultat au lieu de la relancer.
+
+    Les clés sont préfixées par un espace (source et paramètres de la
+    recherche) : des recherches de paramètres différents ne se mélangent pas.
+    """
+
+    def __init__(self, taille_max: int = 100_000, ttl: float = JOUR, ttl_negatif: float = 3600.0):
+        """
+        Args:
+            taille_max: Nombre maximal d'entrées ; les moins récemment lues sont évincées
+            ttl: Durée de vie d'un SIREN trouvé (secondes)
+            ttl_negatif: Durée de vie d'un résultat « aucun SIREN » (secondes)
+        """
+        if taille_max < 1:
+            raise ValueError("taille_max doit être supérieur ou égal à 1")
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self.ttl_negatif = ttl_negatif
+        self.hits = 0
+        self.misses = 0
+        self.coalescees = 0
+        self._entrees: "OrderedDict[Tuple[str, str], Tuple[object, float]]" = OrderedDict()
+        self._en_vol: Dict[Tuple[str, str], Future] = {}
+        self._verrou = threading.Lock()
+
+    def _lire(self, cle: Tuple[str, str]):
+        """Valeur de la clé ou ABSENT (verrou tenu)"""
+        entree = self._entrees.get(cle)
+        if entree is None:
+            return ABSENT
+        valeur, expire = entree
+        if expire < monotonic():
+            del self._entrees[cle]
+            return ABSENT
+        self._entrees.move_to_end(cle)
+        return valeur
+
+    def _ecrire(self, cle: Tuple[str, str], valeur):
+        """Enregistre la valeur et évince au-delà de taille_max (verrou tenu)"""
+        self._entrees[cle] = (valeur, monotonic() + (self.ttl if valeur else self.ttl_negatif))
+        self._entrees.move_to_end(cle)
+        while len(self._entrees) > self.taille_max:
+            self._entrees.popitem(last=False)
+
+    def lire(self, nom: str, code_postal: str, espace: str = ""):
+        """
+        Returns:
+            Le résultat en mémoire (None pour un résultat négatif), ou ABSENT
+        """
+        with self._verrou:
+            valeur = self._lire((espace, cle_recherche(nom, code_postal)))
+            if valeur is ABSENT:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return valeur
+
+    def ecrire(self, nom: str, code_postal: str, valeur: Union[str, dict, None], espace: str = ""):
+        """Enregistre le résultat d'une recherche (None = aucun SIREN trouvé)"""
+        with self._verrou:
+            self._ecrire((espace, cle_recherche(nom, code_postal)), valeur or None)
+
+    def obtenir(self, nom: str, code_postal: str, rechercher: Callable[[], Union[str, dict, None]],
+                espace: str = "", echeance: Optional[float] = None) -> Tuple[Union[str, dict, None], bool]:
+        """
+        Résultat en mémoire, ou calculé par `rechercher` une seule fois pour
+        tous les appelants simultanés de la même clé
+
+        Un échec de la recherche n'est pas mémorisé ; il est transmis aux
+        appelants en attente, sauf un dépassement de délai (TimeoutError,
+        propre au budget de temps de l'appelant) : ils relancent alors la
+        recherche eux-mêmes.
+
+        Args:
+            echeance: Instant limite de l'appelant (horloge de `time.monotonic`),
+                qui borne son attente d'une recherche lancée par un autre
+
+        Returns:
+            (résultat, True si cet appel a effectué la recherche)
+
+        Raises:
+            AttenteExpiree: si l'échéance passe avant la fin de la recherche attendue
+        """
+        cle = (espace, cle_recherche(nom, code_postal))
+        while True:
+            with self._verrou:
+                valeur = self._lire(cle)
+                if valeur is not ABSENT:
+                    self.hits += 1
+                    return valeur, False
+                en_vol = self._en_vol.get(cle)
+                if en_vol is None:
+                    en_vol = self._en_vol[cle] = Future()
+                    self.misses += 1
+                    break
+                self.coalescees += 1
+            attente = None if echeance is None else max(0.0, echeance - monotonic())
+            if not wait([en_vol], timeout=attente).done:
+                raise AttenteExpiree(f"Échéance atteinte en attendant la recherche de « {nom} »")
+            try:
+                return en_vol.result(), False
+            except TimeoutError:
+                continue
+
+        try:
+            valeur = rechercher() or None
+        except BaseException as e:
+            with self._verrou:
+                del self._en_vol[cle]
+            en_vol.set_exception(e)
+            raise
+        with self._verrou:
+            self._ecrire(cle, valeur)
+            del self._en_vol[cle]
+        en_vol.set_result(valeur)
+        return valeur, True
+
+    def __len__(self) -> int:
+        with self._verrou:
+            return len(self._entrees)
+
+    def statistiques(self) -> dict:
+        """Compteurs de hits/misses et recherches coalescées depuis la création"""
+        with self._verrou:
+            lectures = self.hits + self.misses
+            return {
+                "entrees": len(self._entrees),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalescees": self.coalescees,
+                "taux_hit": self.hits / lectures if lectures else 0.0,
+            }
+
+    def vider(self):
+        """Supprime toutes les entrées (les recherches en vol se terminent normalement)"""
+        with self._verrou:
+            self._entrees.clear()
+
+_cache_memoire_partage: Optional[CacheMemoire] = None
+_verrou_partage = threading.Lock()
+
+def cache_memoire_partage(taille_max: int = 100_000) -> CacheMemoire:
+    """
+    Retourne le cache mémoire du processus (partagé par toutes les sessions
+    et tous les travaux), créé au premier appel
+    """
+    global _cache_memoire_partage
+    with _verrou_partage:
+        if _cache_memoire_partage is None:
+            _cache_memoire_partage = CacheMemoire(taille_max)
+        return _cache_memoire_partage
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Classement des candidats d'une recherche par similarité de nom.
+
+L'API (comme la recherche plein texte de l'index local) retourne plusieurs
+entreprises pour un même nom ; le premier résultat n'est pas toujours le
+bon. Chaque candidat est noté contre le `Nom d'usage` normalisé à partir de
+ses trigrammes de caractères (tolérants aux fautes de frappe) et de ses
+mots significatifs, et le mieux noté est retenu avec son score de
+confiance, entre 0 et 1. Les profils de noms (mots et trigrammes) sont
+calculés une fois puis conservés en mémoire.
+"""
+
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Optional, Sequence, Tuple
+
+from cache_recherche import normaliser_nom
+
+# Formes juridiques et mots de liaison, ignorés pour la couverture des mots
+MOTS_VIDES = frozenset({
+    "SARL", "SAS", "SASU", "SA", "EURL", "SCI", "SNC", "SCP", "SELARL", "EI",
+    "ET", "DE", "DU", "DES", "LA", "LE", "LES", "L", "D", "AU", "AUX", "EN",
+})
+
+# Poids des trigrammes dans le score, le complément revenant aux mots
+POIDS_TRIGRAMMES = 0.6
+
+@lru_cache(maxsize=100_000)
+def profil_nom(nom: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """
+    Profil d'un nom : mots significatifs et trigrammes de caractères
+
+    Chaque mot est encadré d'espaces avant découpage, pour que les débuts et
+    fins de mots pèsent autant que leur milieu.
+    """
+    mots = normaliser_nom(nom).split()
+    significatifs = frozenset(m for m in mots if m not in MOTS_VIDES) or frozenset(mots)
+    trigrammes = frozenset(
+        f"  {mot} "[i:i + 3] for mot in mots for i in range(len(mot) + 1)
+    )
+    return significatifs, trigrammes
+
+def score_similarite(terme: str, candidat: str) -> float:
+    """
+    Similarité entre le nom recherché et le nom d'un candidat
+
+    Returns:
+        Score entre 0 (aucun point commun) et 1 (noms identiques une fois
+        normalisés)
+    """
+    mots_terme, tri_terme = profil_nom(terme)
+    mots_candidat, tri_candidat = profil_nom(candidat)
+    if not tri_terme or not tri_candidat:
+        return 0.0
+    dice = 2 * len(tri_terme & tri_candidat) / (len(tri_terme) + len(tri_candidat))
+    couverture = len(mots_terme & mots_candidat) / len(mots_terme) if mots_terme else 0.0
+    return round(POIDS_TRIGRAMMES * dice + (1 - POIDS_TRIGRAMMES) * couverture, 3)
+
+def meilleur_candidat(terme: str, noms_candidats: Sequence[Iterable[str]]) -> Tuple[Optional[int], float]:
+    """
+    Choisit le candidat dont l'un des noms ressemble le plus au terme
+
+    Args:
+        terme: Nom recherché
+        noms_candidats: Pour chaque candidat, ses noms (raison sociale,
+            enseignes, sigle...)
+
+    Returns:
+        (position du meilleur candidat, score) ; à score égal le premier
+        candidat l'emporte, ce qui conserve l'ordre de pertinence de la
+        source. (None, 0.0) s'il n'y a aucun candidat.
+    """
+    meilleur, meilleur_score = None, -1.0
+    for position, noms in enumerate(noms_candidats):
+        score = max((score_similarite(terme, nom) for nom in noms if nom), default=0.0)
+        if score > meilleur_score:
+            meilleur, meilleur_score = position, score
+    return meilleur, max(meilleur_score, 0.0)
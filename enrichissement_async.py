@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Enrichissement SIREN asynchrone (asyncio).
+
+Variante non bloquante de `recherche_entreprise` / `enrichir_sirens` destinée
+à être intégrée dans un service asyncio existant : un seul client HTTP
+(aiohttp) réutilise ses connexions, un sémaphore borne le nombre de requêtes
+en vol et un `LimiteurDebit` (éventuellement partagé avec des threads)
+respecte le quota de l'API.
+
+Nécessite la dépendance optionnelle `aiohttp` (pip install aiohttp).
+"""
+
+import asyncio
+from time import monotonic
+from typing import Optional, Union
+
+import pandas as pd
+
+from backends import ResultatRecherche
+from cache_recherche import ABSENT, CacheRecherche
+from journalisation import obtenir_logger
+from limiteur import DEBIT_MAX_API, LimiteurDebit
+from metriques import MetriquesEnrichissement
+from reprise import JournalReprise
+from main import (
+    BASE_URL,
+    CODES_A_REESSAYER,
+    ECHEC_RECHERCHE,
+    construire_url_recherche,
+    delai_reessai,
+    _extraire_resultat,
+    _extraire_siren,
+    _charger_dataframe,
+    _selectionner_recherches,
+    _planifier_recherches,
+    _reporter_resultats,
+    _espace_api,
+)
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    aiohttp = None
+
+logger = obtenir_logger("async")
+
+def _verifier_aiohttp():
+    if aiohttp is None:
+        raise ImportError("Le mode asynchrone nécessite aiohttp : pip install aiohttp")
+
+def creer_session_async(concurrence: int = 20, timeout: float = 30.0) -> "aiohttp.ClientSession":
+    """
+    Crée un client HTTP asynchrone avec réutilisation des connexions
+
+    Args:
+        concurrence: Nombre maximal de connexions ouvertes
+        timeout: Durée maximale d'une requête (secondes)
+    """
+    _verifier_aiohttp()
+    connecteur = aiohttp.TCPConnector(limit=concurrence, ttl_dns_cache=300)
+    return aiohttp.ClientSession(
+        connector=connecteur,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"Accept-Encoding": "gzip, deflate"},
+    )
+
+async def _get_json(session: "aiohttp.ClientSession", url: str, limiteur: Optional[LimiteurDebit],
+                    reessais: int, delai_base: float,
+                    metriques: Optional[MetriquesEnrichissement] = None) -> dict:
+    """
+    GET JSON avec nouvelles tentatives sur erreur transitoire (429, 5xx,
+    coupure réseau), en respectant Retry-After et le contrôle AIMD du limiteur
+    """
+    for tentative in range(reessais + 1):
+        derniere = tentative == reessais
+        if limiteur is not None:
+            attente = await limiteur.attendre_async()
+            if metriques is not None:
+                metriques.observer_attente_limiteur(attente)
+        debut = monotonic()
+        statut = None
+        try:
+            async with session.get(url) as r:
+                statut = r.status
+                logger.debug("URL appelée : %s (status %s)", r.url, r.status)
+                if r.status == 429 and limiteur is not None:
+                    limiteur.signaler_saturation()
+                if r.status not in CODES_A_REESSAYER or derniere:
+                    r.raise_for_status()
+                    if limiteur is not None:
+                        limiteur.signaler_succes()
+                    return await r.json(content_type=None)
+                retry_after = r.headers.get("Retry-After")
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if derniere:
+                raise
+            retry_after = None
+        finally:
+            if metriques is not None:
+                metriques.observer_requete(monotonic() - debut, statut)
+        attente = delai_reessai(tentative, retry_after, delai_base)
+        if metriques is not None:
+            metriques.observer_reessai(attente)
+        await asyncio.sleep(attente)
+
+async def recherche_entreprise_async(session: "aiohttp.ClientSession", api_base: str, terme: str,
+                                     code_postal: str, per_page: int = 5,
+                                     limiteur: Optional[LimiteurDebit] = None, reessais: int = 4,
+                                     delai_base: float = 0.5, lever_erreurs: bool = False,
+                                     score_min: float = 0.0, details: bool = False,
+                                     metriques: Optional[MetriquesEnrichissement] = None):
+    """
+    Équivalent asynchrone de `recherche_entreprise`
+
+    Args:
+        session: Client aiohttp partagé
+        api_base: URL de base de l'API
+        terme: Nom de l'entreprise à rechercher
+        code_postal: Code postal de l'entreprise
+        per_page: Nombre de résultats par page (défaut: 5)
+        limiteur: Limiteur de débit consulté avant chaque tentative
+        reessais: Nombre de nouvelles tentatives après une erreur transitoire
+        delai_base: Premier délai de backoff (secondes)
+        lever_erreurs: Propager les erreurs au lieu de retourner None
+        score_min: Score de confiance du nom en dessous duquel le meilleur
+            candidat est écarté
+        details: Retourner un `ResultatRecherche` plutôt que le seul SIREN
+        metriques: Métriques alimentées par chaque tentative
+
+    Returns:
+        Numéro SIREN trouvé ou None si aucun résultat
+    """
+    if not terme or not terme.strip():
+        logger.debug("Terme de recherche vide, passage")
+        return None
+
+    url = construire_url_recherche(api_base, terme, code_postal, per_page)
+
+    try:
+        donnees = await _get_json(session, url, limiteur, reessais, delai_base, metriques)
+        if details:
+            return _extraire_resultat(donnees, terme, code_postal, score_min)
+        return _extraire_siren(donnees, terme, code_postal, score_min)
+
+    except aiohttp.ClientError as e:
+        logger.warning("Erreur lors de la requête pour « %s » (%s) : %s", terme, code_postal, e,
+                       extra={"terme": terme, "code_postal": code_postal})
+        if lever_erreurs:
+            raise
+        return None
+    except asyncio.TimeoutError:
+        logger.warning("Délai dépassé pour « %s » (%s)", terme, code_postal,
+                       extra={"terme": terme, "code_postal": code_postal})
+        if lever_erreurs:
+            raise
+        return None
+    except Exception as e:
+        logger.warning("Erreur inattendue pour « %s » (%s) : %s", terme, code_postal, e,
+                       extra={"terme": terme, "code_postal": code_postal})
+        if lever_erreurs:
+            raise
+        return None
+
+async def enrichir_sirens_async(input_data: Union[str, pd.DataFrame], verbose: bool = True,
+                                concurrence: int = 20, requetes_par_seconde: float = DEBIT_MAX_API,
+                                session: Optional["aiohttp.ClientSession"] = None,
+                                api_base: str = BASE_URL,
+                                limiteur: Optional[LimiteurDebit] = None,
+                                cache: Optional[CacheRecherche] = None,
+                                dedupliquer: bool = True, journal: Optional[str] = None,
+                                resume: bool = False, score_min: float = 0.0,
+                                details: bool = False,
+                                metriques: Optional[MetriquesEnrichissement] = None) -> pd.DataFrame:
+    """
+    Équivalent asynchrone de `enrichir_sirens`
+
+    Args:
+        input_data: Chemin vers le fichier CSV d'entrée OU DataFrame pandas
+        verbose: Afficher les logs détaillés
+        concurrence: Nombre maximal de requêtes en vol
+        requetes_par_seconde: Budget d'appels API si aucun limiteur n'est fourni
+        session: Client aiohttp à réutiliser (créé et fermé ici si absent)
+        api_base: URL de base de l'API
+        limiteur: Limiteur de débit à partager avec d'autres enrichissements
+        cache: Cache persistant consulté avant l'API
+        dedupliquer: Une seule recherche par couple (nom, code postal) normalisé
+        journal: Fichier journal de reprise des recherches résolues
+        resume: Reprendre depuis le journal existant
+        score_min: Score de confiance minimal d'une correspondance de nom
+        details: Ajouter les colonnes d'informations sur l'entreprise trouvée
+        metriques: Métriques à alimenter ; leur résumé est joint au DataFrame
+            retourné dans `df.attrs["metriques"]`
+
+    Returns:
+        DataFrame pandas enrichi avec les SIRENs
+    """
+    _verifier_aiohttp()
+    if concurrence < 1:
+        raise ValueError("concurrence doit être supérieur ou égal à 1")
+    if resume and journal is None:
+        raise ValueError("resume=True nécessite un fichier journal")
+
+    df = _charger_dataframe(input_data, verbose)
+    taches = _selectionner_recherches(df, verbose)
+    recherches, correspondance = _planifier_recherches(taches, dedupliquer)
+
+    if limiteur is None:
+        limiteur = LimiteurDebit(requetes_par_seconde)
+    if verbose:
+        print(f"\n{len(recherches)} recherche(s) à effectuer pour {len(taches)} ligne(s) "
+              f"(asyncio, {concurrence} en vol, {limiteur.requetes_par_seconde:g} req/s)")
+
+    semaphore = asyncio.Semaphore(concurrence)
+    session_locale = session is None
+    if session_locale:
+        session = creer_session_async(concurrence)
+    memoires = []
+    if journal is not None:
+        journal_reprise = JournalReprise(journal, resume=resume)
+        memoires.append((journal_reprise, "journal"))
+    if cache is not None:
+        memoires.append((cache, "cache"))
+    if metriques is None:
+        metriques = MetriquesEnrichissement()
+    espace = _espace_api(api_base, score_min)
+
+    async def rechercher(recherche):
+        nom_usage, code_postal = recherche
+        # Cache SQLite et journal font des écritures disque bloquantes : ils
+        # sont consultés dans un thread pour ne pas bloquer la boucle
+        for rang, (memoire, source) in enumerate(memoires):
+            valeur = await asyncio.to_thread(memoire.lire, nom_usage, code_postal, espace)
+            metriques.observer_memoire(source, valeur is not ABSENT)
+            if valeur is not ABSENT:
+                for precedente, _ in memoires[:rang]:
+                    await asyncio.to_thread(precedente.ecrire, nom_usage, code_postal, valeur, espace)
+                return ResultatRecherche.depuis_memoire(valeur, source)
+        async with semaphore:
+            try:
+                resultat = await recherche_entreprise_async(session, api_base, nom_usage, code_postal,
+                                                            limiteur=limiteur, lever_erreurs=True,
+                                                            score_min=score_min, details=True,
+                                                            metriques=metriques)
+            except Exception:
+                return ECHEC_RECHERCHE
+        for memoire, _ in memoires:
+            await asyncio.to_thread(memoire.ecrire, nom_usage, code_postal,
+                                    resultat.en_dict() if resultat else None, espace)
+        return resultat
+
+    debut = monotonic()
+    try:
+        resultats_uniques = await asyncio.gather(*(rechercher(recherche) for recherche in recherches))
+    finally:
+        metriques.observer_duree(monotonic() - debut)
+        if session_locale:
+            await session.close()
+        if journal is not None:
+            journal_reprise.fermer()
+
+    resultats = [resultats_uniques[i] for i in correspondance]
+    sirens_trouves = _reporter_resultats(df, taches, resultats, verbose, details)
+    metriques.observer_lignes(len(df), len(taches), sirens_trouves,
+                              sum(resultat is ECHEC_RECHERCHE for resultat in resultats))
+    df.attrs["metriques"] = metriques.resume()
+
+    return df
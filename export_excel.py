@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Export Excel en flux (classeur openpyxl en écriture seule).
+
+`df.to_excel` construit un objet cellule par valeur avant d'écrire : lent et
+gourmand en mémoire au-delà de ~100 000 lignes. Ici les lignes sont
+écrites bloc par bloc dans un classeur en écriture seule, à mémoire
+constante, ce qui permet aussi de consommer les blocs produits par
+`enrichir_csv_par_blocs`. Une feuille Excel est limitée à 1 048 576 lignes
+(en-tête compris) : au-delà, l'appelant bascule explicitement en CSV.
+"""
+
+from io import BytesIO
+from typing import BinaryIO, Iterable, Union
+
+import pandas as pd
+from openpyxl import Workbook
+
+# Nombre maximal de lignes d'une feuille Excel, en-tête compris
+LIGNES_MAX_EXCEL = 1_048_576
+
+TYPE_MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+class LimiteExcelDepassee(ValueError):
+    """Les données ne tiennent pas dans une feuille Excel"""
+
+def tient_dans_excel(lignes: int) -> bool:
+    """Vrai si `lignes` lignes de données (plus l'en-tête) tiennent dans une feuille"""
+    return lignes + 1 <= LIGNES_MAX_EXCEL
+
+def compter_lignes_csv(chemin: str, taille_lecture: int = 1 << 20) -> int:
+    """
+    Nombre de lignes de données d'un CSV (en-tête exclu), sans le parser
+
+    Les retours à la ligne entre guillemets sont comptés : le résultat est
+    un majorant, suffisant pour décider du format de sortie.
+    """
+    lignes = 0
+    dernier = b"\n"
+    with open(chemin, "rb") as f:
+        while True:
+            bloc = f.read(taille_lecture)
+            if not bloc:
+                break
+            lignes += bloc.count(b"\n")
+            dernier = bloc[-1:]
+    if dernier != b"\n":
+        lignes += 1
+    return max(0, lignes - 1)
+
+class ClasseurEnFlux:
+    """
+    Classeur Excel d'une feuille, rempli bloc par bloc à mémoire constante
+
+        with ClasseurEnFlux("sortie.xlsx") as classeur:
+            for bloc in blocs:
+                classeur.ecrire_bloc(bloc)
+
+    Le fichier n'est écrit qu'à la fermeture, et seulement si aucune erreur
+    n'a interrompu le remplissage.
+    """
+
+    def __init__(self, destination: Union[str, BinaryIO], nom_feuille: str = "Sheet1"):
+        """
+        Args:
+            destination: Chemin du fichier .xlsx ou flux binaire (BytesIO)
+            nom_feuille: Nom de la feuille (celui de `to_excel` par défaut)
+        """
+        self.destination = destination
+        self.lignes = 0
+        self._classeur = Workbook(write_only=True)
+        self._feuille = self._classeur.create_sheet(nom_feuille)
+        self._colonnes = None
+
+    def ecrire_bloc(self, df: pd.DataFrame):
+        """
+        Ajoute les lignes d'un bloc ; l'en-tête est celui du premier bloc
+
+        Raises:
+            LimiteExcelDepassee: si le bloc ferait dépasser la limite de lignes
+        """
+        if self._colonnes is None:
+            self._colonnes = [str(col) for col in df.columns]
+            self._feuille.append(self._colonnes)
+            self.lignes += 1
+        if self.lignes + len(df) > LIGNES_MAX_EXCEL:
+            raise LimiteExcelDepassee(
+                f"{self.lignes - 1 + len(df)} lignes dépassent la limite d'une feuille Excel "
+                f"({LIGNES_MAX_EXCEL - 1} lignes de données)"
+            )
+        # Valeurs manquantes (NaN, NA, None) en cellules vides
+        valeurs = df.astype(object).where(df.notna(), None)
+        for ligne in valeurs.itertuples(index=False, name=None):
+            self._feuille.append(ligne)
+        self.lignes += len(df)
+
+    def fermer(self):
+        """Écrit le classeur dans sa destination"""
+        self._classeur.save(self.destination)
+
+    def abandonner(self):
+        """Libère le fichier temporaire de la feuille sans rien écrire"""
+        self._feuille.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_exc, *exc):
+        if type_exc is None:
+            self.fermer()
+        else:
+            self.abandonner()
+
+def exporter_excel(donnees: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                   destination: Union[str, BinaryIO], taille_bloc: int = 50_000):
+    """
+    Écrit un DataFrame, ou une suite de blocs, dans un classeur Excel en flux
+
+    Raises:
+        LimiteExcelDepassee: si les données dépassent une feuille Excel
+    """
+    if isinstance(donnees, pd.DataFrame):
+        if not tient_dans_excel(len(donnees)):
+            raise LimiteExcelDepassee(
+                f"{len(donnees)} lignes dépassent la limite d'une feuille Excel "
+                f"({LIGNES_MAX_EXCEL - 1} lignes de données)"
+            )
+        # Un DataFrame vide produit tout de même l'en-tête
+        donnees = [donnees.iloc[debut:debut + taille_bloc]
+                   for debut in range(0, max(len(donnees), 1), taille_bloc)]
+    with ClasseurEnFlux(destination) as classeur:
+        for bloc in donnees:
+            classeur.ecrire_bloc(bloc)
+
+def excel_en_octets(df: pd.DataFrame) -> bytes:
+    """Contenu d'un classeur Excel pour un téléchargement (Streamlit...)"""
+    tampon = BytesIO()
+    exporter_excel(df, tampon)
+    return tampon.getvalue()
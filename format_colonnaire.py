@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Lecture et écriture des fichiers colonnaires Parquet et Arrow (Feather/IPC).
+
+Les systèmes amont et aval échangent du Parquet : le lire directement évite
+l'analyse CSV et le ré-encodage texte des fichiers de plusieurs millions de
+lignes. `Code Postal` et `Num Siren` sont toujours traités comme du texte ;
+une colonne numérique en entrée est complétée par ses zéros de tête
+(« 1000 » → « 01000 »). Nécessite pyarrow (dépendance optionnelle).
+"""
+
+import os
+from typing import Iterator, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    pa = None
+
+EXTENSIONS_PARQUET = (".parquet", ".pq")
+EXTENSIONS_ARROW = (".arrow", ".feather", ".ipc")
+
+# Colonnes toujours en texte, avec leur longueur pour compléter les zéros de tête
+COLONNES_TEXTE = {"Code Postal": 5, "Num Siren": 9}
+
+def _verifier_pyarrow():
+    if pa is None:
+        raise ImportError("La lecture et l'écriture Parquet/Arrow nécessitent pyarrow : pip install pyarrow")
+
+def est_fichier_colonnaire(chemin: str) -> bool:
+    """Vrai pour un chemin Parquet ou Arrow, d'après son extension"""
+    return chemin.lower().endswith(EXTENSIONS_PARQUET + EXTENSIONS_ARROW)
+
+def _est_parquet(chemin: str) -> bool:
+    if chemin.lower().endswith(EXTENSIONS_PARQUET):
+        return True
+    if chemin.lower().endswith(EXTENSIONS_ARROW):
+        return False
+    raise ValueError(f"Extension non reconnue pour {chemin} (attendu : "
+                     f"{', '.join(EXTENSIONS_PARQUET + EXTENSIONS_ARROW)})")
+
+def normaliser_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convertit `Code Postal` et `Num Siren` en texte (valeurs manquantes
+    conservées), en complétant les zéros de tête des colonnes numériques
+
+    Dans une colonne numérique, 0 tient lieu de valeur manquante : il reste
+    manquant au lieu de devenir « 000000000 »
+    """
+    for colonne, longueur in COLONNES_TEXTE.items():
+        if colonne not in df.columns:
+            continue
+        serie = df[colonne]
+        if pd.api.types.is_numeric_dtype(serie.dtype):
+            entiers = serie.astype("Int64")
+            texte = entiers.mask(entiers == 0).astype("string").str.zfill(longueur)
+        else:
+            texte = serie.astype("string")
+        df[colonne] = texte.astype(object).where(texte.notna(), None)
+    return df
+
+def lire_colonnaire(chemin: str, colonnes: Optional[list] = None) -> pd.DataFrame:
+    """
+    Lit un fichier Parquet ou Arrow en DataFrame aux types normalisés
+    """
+    _verifier_pyarrow()
+    if _est_parquet(chemin):
+        table = pq.read_table(chemin, columns=colonnes)
+    else:
+        table = feather.read_table(chemin, columns=colonnes)
+    return normaliser_types(table.to_pandas())
+
+def compter_lignes_colonnaire(chemin: str) -> int:
+    """Nombre de lignes d'un fichier Parquet ou Arrow, lu dans ses métadonnées"""
+    _verifier_pyarrow()
+    if _est_parquet(chemin):
+        return pq.ParquetFile(chemin).metadata.num_rows
+    with pa.memory_map(chemin) as source:
+        lecteur = ipc.open_file(source)
+        return sum(lecteur.get_batch(i).num_rows for i in range(lecteur.num_record_batches))
+
+def lire_colonnaire_par_blocs(chemin: str, taille_bloc: int = 50_000) -> Iterator[pd.DataFrame]:
+    """
+    Lit un fichier Parquet ou Arrow par blocs d'au plus `taille_bloc`
+    lignes, sans le charger entièrement en mémoire
+    """
+    _verifier_pyarrow()
+    if _est_parquet(chemin):
+        for lot in pq.ParquetFile(chemin).iter_batches(batch_size=taille_bloc):
+            yield normaliser_types(lot.to_pandas())
+        return
+    # Fichier Arrow projeté en mémoire : les lots sont redécoupés sans copie
+    with pa.memory_map(chemin) as source:
+        lecteur = ipc.open_file(source)
+        for i in range(lecteur.num_record_batches):
+            lot = lecteur.get_batch(i)
+            for debut in range(0, lot.num_rows, taille_bloc):
+                yield normaliser_types(lot.slice(debut, taille_bloc).to_pandas())
+
+def _table(df: pd.DataFrame, schema: Optional["pa.Schema"] = None) -> "pa.Table":
+    """Table Arrow du DataFrame, `Code Postal` et `Num Siren` en texte"""
+    df = normaliser_types(df.copy())
+    if schema is None:
+        champs = []
+        for colonne in df.columns:
+            champ = pa.Schema.from_pandas(df[[colonne]], preserve_index=False).field(0)
+            # Colonne vide dans ce bloc (type « null ») : texte par défaut
+            if colonne in COLONNES_TEXTE or pa.types.is_null(champ.type):
+                champ = pa.field(str(colonne), pa.string())
+            champs.append(champ)
+        schema = pa.schema(champs)
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def ecrire_colonnaire(df: pd.DataFrame, chemin: str) -> str:
+    """
+    Écrit un DataFrame en Parquet (compression zstd) ou en Arrow selon
+    l'extension du chemin
+
+    Returns:
+        Chemin du fichier écrit
+    """
+    with ColonnaireEnFlux(chemin) as sortie:
+        sortie.ecrire_bloc(df)
+    return chemin
+
+class ColonnaireEnFlux:
+    """
+    Fichier Parquet (compression zstd) ou Arrow rempli bloc par bloc, à
+    mémoire constante : un groupe de lignes, ou un lot Arrow, par bloc
+
+        with ColonnaireEnFlux("sortie.parquet") as sortie:
+            for bloc in blocs:
+                sortie.ecrire_bloc(bloc)
+
+    Le schéma est fixé par le premier bloc ; les suivants y sont convertis,
+    pour qu'une colonne entièrement vide dans un bloc ne change pas de type.
+    En cas d'erreur, le fichier partiel est supprimé.
+    """
+
+    def __init__(self, chemin: str):
+        _verifier_pyarrow()
+        self.chemin = chemin
+        self.parquet = _est_parquet(chemin)
+        self.lignes = 0
+        self._schema = None
+        self._ecrivain = None
+
+    def ecrire_bloc(self, df: pd.DataFrame):
+        table = _table(df, self._schema)
+        if self._ecrivain is None:
+            self._schema = table.schema
+            if self.parquet:
+                self._ecrivain = pq.ParquetWriter(self.chemin, self._schema, compression="zstd")
+            else:
+                self._ecrivain = ipc.new_file(self.chemin, self._schema)
+        self._ecrivain.write_table(table)
+        self.lignes += len(df)
+
+    def fermer(self):
+        if self._ecrivain is not None:
+            self._ecrivain.close()
+            self._ecrivain = None
+
+    def abandonner(self):
+        """Ferme et supprime le fichier partiel"""
+        self.fermer()
+        if os.path.exists(self.chemin):
+            os.remove(self.chemin)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_exc, *exc):
+        if type_exc is None:
+            self.fermer()
+        else:
+            self.abandonner()
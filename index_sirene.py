@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Index local du stock SIRENE pour un enrichissement sans appel réseau.
+
+Le fichier stock des établissements publié par l'INSEE (CSV ou Parquet) est
+converti une fois pour toutes en base SQLite compacte, indexée par nom
+normalisé et code postal, avec un index plein texte (FTS5) pour les noms
+qui ne correspondent pas exactement. Les recherches se font ensuite
+localement, sans quota ni latence réseau.
+
+Le stock des établissements ne porte que leurs enseignes et dénominations
+usuelles ; la dénomination et le sigle de l'entreprise sont dans le stock
+des unités légales, joint par SIREN quand il est fourni.
+
+Construction de l'index :
+    python index_sirene.py StockEtablissement_utf8.csv sirene.sqlite --unites StockUniteLegale_utf8.csv
+
+Utilisation :
+    from index_sirene import IndexSirene
+    with IndexSirene("sirene.sqlite") as index:
+        df_enrichi = enrichir_sirens(df, index=index)
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+from backends import ResultatRecherche
+from cache_recherche import normaliser_nom
+from correspondance import meilleur_candidat
+
+# Nombre de candidats plein texte re-classés par similarité de nom
+CANDIDATS_PLEIN_TEXTE = 20
+
+# Colonnes du stock établissements SIRENE pouvant porter le nom recherché
+# (celles de l'unité légale ne s'y trouvent que dans un stock déjà joint)
+COLONNES_NOM = [
+    "denominationUniteLegale",
+    "denominationUsuelleEtablissement",
+    "enseigne1Etablissement",
+    "enseigne2Etablissement",
+    "enseigne3Etablissement",
+]
+# Colonnes du stock des unités légales portant le nom de l'entreprise
+COLONNES_NOM_UNITE_LEGALE = [
+    "denominationUniteLegale",
+    "sigleUniteLegale",
+]
+COLONNE_SIREN = "siren"
+COLONNE_CODE_POSTAL = "codePostalEtablissement"
+COLONNE_SIEGE = "etablissementSiege"
+COLONNE_ETAT = "etatAdministratifEtablissement"
+
+def _colonnes_stock(fichier_stock: str) -> List[str]:
+    """Colonnes d'un fichier stock (CSV, ou Parquet avec pyarrow), sans le lire"""
+    if not os.path.exists(fichier_stock):
+        raise FileNotFoundError(f"Le fichier {fichier_stock} n'existe pas")
+    if fichier_stock.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+        return pq.read_schema(fichier_stock).names
+    return pd.read_csv(fichier_stock, nrows=0).columns.tolist()
+
+def _lire_stock(fichier_stock: str, colonnes: List[str], taille_bloc: int) -> Iterable[pd.DataFrame]:
+    """Lit le stock par blocs de `taille_bloc` lignes (CSV, ou Parquet avec pyarrow)"""
+    if fichier_stock.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+        for lot in pq.ParquetFile(fichier_stock).iter_batches(batch_size=taille_bloc, columns=colonnes):
+            yield lot.to_pandas()
+        return
+    with pd.read_csv(fichier_stock, usecols=colonnes, dtype=str, chunksize=taille_bloc) as lecteur:
+        yield from lecteur
+
+def construire_index(fichier_stock: str, chemin_index: str, taille_bloc: int = 200_000,
+                     actifs_seulement: bool = True, verbose: bool = True,
+                     fichier_unites: Optional[str] = None) -> int:
+    """
+    Construit l'index local à partir du fichier stock des établissements
+
+    Args:
+        fichier_stock: StockEtablissement (CSV séparé par des virgules ou Parquet)
+        chemin_index: Base SQLite à produire (remplacée si elle existe)
+        taille_bloc: Nombre de lignes du stock traitées à la fois
+        actifs_seulement: Ignorer les établissements fermés
+        verbose: Afficher la progression
+        fichier_unites: StockUniteLegale (CSV ou Parquet), dont la dénomination
+            et le sigle sont indexés pour chaque établissement de l'entreprise
+
+    Returns:
+        Nombre d'entrées (nom, code postal, SIREN) indexées
+    """
+    disponibles = _colonnes_stock(fichier_stock)
+    colonnes_nom = [col for col in COLONNES_NOM if col in disponibles]
+    for col in (COLONNE_SIREN, COLONNE_CODE_POSTAL):
+        if col not in disponibles:
+            raise ValueError(f"Colonne '{col}' manquante dans le fichier stock")
+    colonnes_unite = []
+    if fichier_unites is not None:
+        disponibles_unite = _colonnes_stock(fichier_unites)
+        if COLONNE_SIREN not in disponibles_unite:
+            raise ValueError(f"Colonne '{COLONNE_SIREN}' manquante dans le stock des unités légales")
+        colonnes_unite = [col for col in COLONNES_NOM_UNITE_LEGALE if col in disponibles_unite]
+        if not colonnes_unite:
+            raise ValueError("Aucune colonne de nom dans le stock des unités légales "
+                             f"(attendu : {', '.join(COLONNES_NOM_UNITE_LEGALE)})")
+    if not colonnes_nom and not colonnes_unite:
+        raise ValueError(f"Aucune colonne de nom dans le fichier stock (attendu : {', '.join(COLONNES_NOM)}, "
+                         "ou un stock des unités légales)")
+    colonnes = [COLONNE_SIREN, COLONNE_CODE_POSTAL] + colonnes_nom
+    colonnes += [col for col in (COLONNE_SIEGE, COLONNE_ETAT) if col in disponibles]
+
+    if os.path.exists(chemin_index):
+        os.remove(chemin_index)
+    connexion = sqlite3.connect(chemin_index)
+    connexion.execute("PRAGMA journal_mode=OFF")
+    connexion.execute("PRAGMA synchronous=OFF")
+    connexion.execute(
+        "CREATE TABLE etablissements ("
+        " nom TEXT NOT NULL,"
+        " code_postal TEXT NOT NULL,"
+        " siren TEXT NOT NULL,"
+        " siege INTEGER NOT NULL,"
+        " UNIQUE (nom, code_postal, siren))"
+    )
+    if colonnes_unite:
+        # Localisation des établissements retenus, jointe ensuite aux noms des unités légales
+        connexion.execute("CREATE TEMP TABLE localisations (siren TEXT, code_postal TEXT, siege INTEGER)")
+
+    lues = 0
+    for bloc in _lire_stock(fichier_stock, colonnes, taille_bloc):
+        lues += len(bloc)
+        if actifs_seulement and COLONNE_ETAT in bloc.columns:
+            bloc = bloc[bloc[COLONNE_ETAT].fillna("A") == "A"]
+        siege = (bloc[COLONNE_SIEGE].astype(str).str.lower() == "true").astype(int) \
+            if COLONNE_SIEGE in bloc.columns else pd.Series(0, index=bloc.index)
+        for col in colonnes_nom:
+            noms = bloc[col].dropna()
+            entrees = pd.DataFrame({
+                "nom": noms.map(normaliser_nom),
+                "code_postal": bloc.loc[noms.index, COLONNE_CODE_POSTAL].astype(str).str.strip(),
+                "siren": bloc.loc[noms.index, COLONNE_SIREN].astype(str).str.strip(),
+                "siege": siege.loc[noms.index],
+            })
+            entrees = entrees[(entrees["nom"] != "") & (entrees["code_postal"] != "")]
+            connexion.executemany(
+                "INSERT OR IGNORE INTO etablissements (nom, code_postal, siren, siege) VALUES (?, ?, ?, ?)",
+                entrees.itertuples(index=False, name=None),
+            )
+        if colonnes_unite:
+            localisations = pd.DataFrame({
+                "siren": bloc[COLONNE_SIREN].astype(str).str.strip(),
+                "code_postal": bloc[COLONNE_CODE_POSTAL].fillna("").astype(str).str.strip(),
+                "siege": siege,
+            })
+            connexion.executemany(
+                "INSERT INTO localisations (siren, code_postal, siege) VALUES (?, ?, ?)",
+                localisations[localisations["code_postal"] != ""].itertuples(index=False, name=None),
+            )
+        connexion.commit()
+        if verbose:
+            print(f"  > {lues} établissement(s) lus")
+
+    if colonnes_unite:
+        _joindre_unites_legales(connexion, fichier_unites, colonnes_unite, taille_bloc, verbose)
+
+    connexion.execute("CREATE INDEX idx_etablissements_nom_cp ON etablissements (nom, code_postal)")
+    try:
+        connexion.execute(
+            "CREATE VIRTUAL TABLE etablissements_fts USING fts5("
+            " nom, content='etablissements', content_rowid='rowid')"
+        )
+        connexion.execute("INSERT INTO etablissements_fts (etablissements_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError:
+        # SQLite compilé sans FTS5 : seules les correspondances exactes seront possibles
+        if verbose:
+            print("  > FTS5 indisponible, index plein texte non créé")
+    entrees = connexion.execute("SELECT COUNT(*) FROM etablissements").fetchone()[0]
+    connexion.commit()
+    connexion.execute("VACUUM")
+    connexion.close()
+
+    if verbose:
+        print(f"Index construit : {chemin_index} ({entrees} entrées)")
+    return entrees
+
+def _joindre_unites_legales(connexion: sqlite3.Connection, fichier_unites: str, colonnes_nom: List[str],
+                            taille_bloc: int, verbose: bool):
+    """
+    Indexe la dénomination et le sigle de chaque unité légale sous le code
+    postal de chacun de ses établissements (table temporaire `localisations`)
+    """
+    connexion.execute("CREATE TEMP TABLE unites (siren TEXT, nom TEXT)")
+    lues = 0
+    for bloc in _lire_stock(fichier_unites, [COLONNE_SIREN] + colonnes_nom, taille_bloc):
+        lues += len(bloc)
+        for col in colonnes_nom:
+            noms = bloc[col].dropna()
+            entrees = pd.DataFrame({
+                "siren": bloc.loc[noms.index, COLONNE_SIREN].astype(str).str.strip(),
+                "nom": noms.map(normaliser_nom),
+            })
+            connexion.executemany("INSERT INTO unites (siren, nom) VALUES (?, ?)",
+                                  entrees[entrees["nom"] != ""].itertuples(index=False, name=None))
+        connexion.commit()
+        if verbose:
+            print(f"  > {lues} unité(s) légale(s) lues")
+    connexion.execute("CREATE INDEX temp.idx_unites_siren ON unites (siren)")
+    connexion.execute(
+        "INSERT OR IGNORE INTO etablissements (nom, code_postal, siren, siege)"
+        " SELECT u.nom, l.code_postal, l.siren, l.siege FROM localisations l JOIN unites u ON u.siren = l.siren"
+    )
+    connexion.execute("DROP TABLE unites")
+    connexion.execute("DROP TABLE localisations")
+    connexion.commit()
+
+class IndexSirene:
+    """
+    Recherche locale de SIREN dans un index construit par `construire_index`
+
+    Correspondance exacte sur (nom normalisé, code postal) en privilégiant le
+    siège, puis à défaut recherche plein texte (tous les mots du nom) dans le
+    même code postal, dont les candidats sont re-classés par similarité de
+    nom (`correspondance`). Une connexion en lecture par thread.
+    """
+
+    def __init__(self, chemin_index: str, en_memoire: bool = False):
+        """
+        Args:
+            chemin_index: Base SQLite produite par `construire_index`
+            en_memoire: Copier l'index en mémoire (chaque thread en reçoit une copie)
+        """
+        if not os.path.exists(chemin_index):
+            raise FileNotFoundError(f"L'index {chemin_index} n'existe pas")
+        self.chemin_index = chemin_index
+        self.en_memoire = en_memoire
+        self.hits_exacts = 0
+        self.hits_plein_texte = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._connexions = []
+        self._verrou = threading.Lock()
+        self.plein_texte = self._connexion().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'etablissements_fts'"
+        ).fetchone() is not None
+
+    def _connexion(self) -> sqlite3.Connection:
+        connexion = getattr(self._local, "connexion", None)
+        if connexion is None:
+            connexion = sqlite3.connect(f"file:{self.chemin_index}?mode=ro", uri=True, check_same_thread=False)
+            if self.en_memoire:
+                copie = sqlite3.connect(":memory:", check_same_thread=False)
+                connexion.backup(copie)
+                connexion.close()
+                connexion = copie
+            self._local.connexion = connexion
+            with self._verrou:
+                self._connexions.append(connexion)
+        return connexion
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[str]:
+        """
+        Returns:
+            SIREN de l'établissement correspondant, ou None
+        """
+        resultat = self.rechercher_details(nom, code_postal)
+        return resultat.siren if resultat is not None else None
+
+    def rechercher_details(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        """
+        Returns:
+            Résultat (SIREN, nom indexé, code postal, score de confiance) de
+            l'établissement correspondant, ou None ; une correspondance
+            exacte a un score de 1
+        """
+        nom_normalise = normaliser_nom(nom)
+        code_postal = (code_postal or "").strip()
+        if not nom_normalise or not code_postal:
+            return None
+        connexion = self._connexion()
+
+        ligne = connexion.execute(
+            "SELECT siren FROM etablissements WHERE nom = ? AND code_postal = ?"
+            " ORDER BY siege DESC LIMIT 1",
+            (nom_normalise, code_postal),
+        ).fetchone()
+        if ligne is not None:
+            self.hits_exacts += 1
+            return ResultatRecherche(ligne[0], "index", 1.0, nom=nom_normalise, code_postal=code_postal)
+
+        if self.plein_texte:
+            requete = " ".join(f'"{mot}"' for mot in nom_normalise.split())
+            candidats = connexion.execute(
+                "SELECT e.nom, e.siren FROM etablissements_fts f JOIN etablissements e ON e.rowid = f.rowid"
+                " WHERE etablissements_fts MATCH ? AND e.code_postal = ?"
+                " ORDER BY bm25(etablissements_fts), e.siege DESC LIMIT ?",
+                (requete, code_postal, CANDIDATS_PLEIN_TEXTE),
+            ).fetchall()
+            if candidats:
+                position, score = meilleur_candidat(nom_normalise, [[nom_candidat] for nom_candidat, _ in candidats])
+                self.hits_plein_texte += 1
+                nom_trouve, siren = candidats[position]
+                return ResultatRecherche(siren, "index", score, nom=nom_trouve, code_postal=code_postal)
+
+        self.misses += 1
+        return None
+
+    def statistiques(self) -> dict:
+        return {
+            "hits_exacts": self.hits_exacts,
+            "hits_plein_texte": self.hits_plein_texte,
+            "misses": self.misses,
+        }
+
+    def fermer(self):
+        with self._verrou:
+            for connexion in self._connexions:
+                connexion.close()
+            self._connexions = []
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit l'index local du stock SIRENE")
+    parser.add_argument("stock", help="Fichier StockEtablissement (CSV ou Parquet)")
+    parser.add_argument("index", help="Base SQLite à produire")
+    parser.add_argument("--unites", help="Fichier StockUniteLegale (CSV ou Parquet) : dénominations et sigles")
+    parser.add_argument("--inclure-fermes", action="store_true", help="Indexer aussi les établissements fermés")
+    parser.add_argument("--taille-bloc", type=int, default=200_000, help="Lignes du stock lues à la fois")
+    args = parser.parse_args()
+    construire_index(args.stock, args.index, taille_bloc=args.taille_bloc,
+                     actifs_seulement=not args.inclure_fermes, fichier_unites=args.unites)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Journalisation des recherches SIREN.
+
+Les messages émis pour chaque requête (URL appelée, statut, candidat
+retenu) passent par les loggers `siren.*` avec un formatage paresseux : tant
+que le niveau DEBUG n'est pas activé, la boucle d'enrichissement ne formate
+aucune chaîne et n'écrit rien. Par défaut seuls les avertissements (erreurs
+de requête) sont affichés, sur la sortie d'erreur.
+
+    from journalisation import configurer_journalisation
+    configurer_journalisation("DEBUG", fichier_json="recherches.jsonl")
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+# Logger parent des modules de l'application
+LOGGER_RACINE = "siren"
+
+# Attributs standard d'un LogRecord, exclus des champs supplémentaires
+_ATTRIBUTS_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def obtenir_logger(nom: str) -> logging.Logger:
+    """Logger `siren.<nom>` d'un module de l'application"""
+    return logging.getLogger(f"{LOGGER_RACINE}.{nom}")
+
+class FormateurJSON(logging.Formatter):
+    """
+    Une ligne JSON par message : horodatage, niveau, logger, message et
+    champs passés via `extra=` (par exemple `terme`, `siren`, `statut`)
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entree = {
+            "horodatage": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "niveau": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for cle, valeur in vars(record).items():
+            if cle not in _ATTRIBUTS_STANDARD and not cle.startswith("_"):
+                entree[cle] = valeur
+        if record.exc_info:
+            entree["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entree, ensure_ascii=False, default=str)
+
+def configurer_journalisation(niveau: Union[int, str] = logging.WARNING,
+                              fichier_json: Optional[str] = None,
+                              console: bool = True) -> logging.Logger:
+    """
+    Configure les loggers `siren.*` ; peut être rappelée pour changer de
+    configuration (les gestionnaires posés par un appel précédent sont
+    remplacés)
+
+    Args:
+        niveau: Niveau minimal ("DEBUG" pour le détail de chaque requête)
+        fichier_json: Fichier JSON-lines recevant aussi les messages
+        console: Afficher les messages sur la sortie d'erreur
+
+    Returns:
+        Le logger parent `siren`
+    """
+    logger = logging.getLogger(LOGGER_RACINE)
+    for gestionnaire in [g for g in logger.handlers if getattr(g, "_siren", False)]:
+        logger.removeHandler(gestionnaire)
+        gestionnaire.close()
+
+    gestionnaires = []
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter("%(levelname)s %(name)s : %(message)s"))
+        gestionnaires.append(console_handler)
+    if fichier_json:
+        fichier_handler = logging.FileHandler(fichier_json, encoding="utf-8")
+        fichier_handler.setFormatter(FormateurJSON())
+        gestionnaires.append(fichier_handler)
+    for gestionnaire in gestionnaires:
+        gestionnaire._siren = True
+        logger.addHandler(gestionnaire)
+
+    logger.setLevel(niveau.upper() if isinstance(niveau, str) else niveau)
+    logger.propagate = False
+    return logger
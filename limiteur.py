@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Limitation du débit des appels à l'API recherche-entreprises.
+
+Un seau à jetons unique peut être partagé entre threads, tâches asyncio et
+sessions Streamlit d'un même processus pour rester exactement au quota de
+l'API, sans pause fixe après chaque requête. Son débit s'adapte (AIMD) :
+divisé à chaque salve de réponses 429, il remonte progressivement vers le
+débit nominal au fil des succès.
+
+`LimiteurInterProcessus` étend ce seau à plusieurs processus (pool de
+traitement par lots) : son état est placé en mémoire partagée.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+from time import monotonic, sleep
+from typing import Dict, Optional
+
+# Quota documenté de l'API recherche-entreprises : 7 appels par seconde et par IP
+DEBIT_MAX_API = 7.0
+
+class LimiteurDebit:
+    """
+    Seau à jetons thread-safe : `requetes_par_seconde` jetons par seconde,
+    jusqu'à `rafale` jetons accumulés.
+
+    Chaque appel réserve un jeton sous verrou puis attend hors verrou, ce qui
+    sert les appelants dans l'ordre d'arrivée. Le temps passé à attendre la
+    réponse de l'API regarnit le seau : on ne paie que l'attente restante.
+
+    Contrôle AIMD : `signaler_saturation` (réponse 429) multiplie le débit
+    courant par `facteur_baisse`, au plus une fois par `delai_entre_baisses`
+    pour qu'une salve de 429 simultanés ne compte qu'une fois ;
+    `signaler_succes` le remonte de `hausse_par_succes` jusqu'au débit nominal.
+    """
+
+    def __init__(self, requetes_par_seconde: float = DEBIT_MAX_API, rafale: int = 1,
+                 debit_min: float = 0.5, facteur_baisse: float = 0.5,
+                 hausse_par_succes: float = 0.05, delai_entre_baisses: float = 1.0):
+        if requetes_par_seconde <= 0:
+            raise ValueError("requetes_par_seconde doit être strictement positif")
+        if rafale < 1:
+            raise ValueError("rafale doit être supérieur ou égal à 1")
+        if not 0 < facteur_baisse < 1:
+            raise ValueError("facteur_baisse doit être compris entre 0 et 1")
+        self.debit_nominal = float(requetes_par_seconde)
+        self.requetes_par_seconde = self.debit_nominal
+        self.rafale = rafale
+        self.debit_min = min(debit_min, self.debit_nominal)
+        self.facteur_baisse = facteur_baisse
+        self.hausse_par_succes = hausse_par_succes
+        self.delai_entre_baisses = delai_entre_baisses
+        self.saturations = 0
+        self._derniere_baisse = float("-inf")
+        self._jetons = float(rafale)
+        self._derniere_maj = monotonic()
+        self._verrou = threading.Lock()
+
+    def _reserver(self, attente_max: Optional[float] = None) -> Optional[float]:
+        """
+        Réserve un jeton et retourne le temps d'attente correspondant
+        (secondes) ; None sans rien réserver si l'attente dépasserait `attente_max`
+        """
+        with self._verrou:
+            maintenant = monotonic()
+            ecoule = maintenant - self._derniere_maj
+            self._jetons = min(self.rafale, self._jetons + ecoule * self.requetes_par_seconde)
+            self._derniere_maj = maintenant
+            restants = self._jetons - 1
+            attente = -restants / self.requetes_par_seconde if restants < 0 else 0.0
+            if attente_max is not None and attente > attente_max:
+                return None
+            self._jetons = restants
+            return attente
+
+    def attendre(self, attente_max: Optional[float] = None) -> Optional[float]:
+        """
+        Bloque le thread appelant jusqu'à obtention d'un jeton
+
+        Args:
+            attente_max: Attente acceptable (secondes) ; au-delà, aucun jeton
+                n'est consommé et l'appel retourne aussitôt
+
+        Returns:
+            Temps attendu (secondes), None si le jeton n'aurait pas été
+            disponible avant `attente_max`
+        """
+        attente = self._reserver(attente_max)
+        if attente:
+            sleep(attente)
+        return attente
+
+    async def attendre_async(self) -> float:
+        """Équivalent non bloquant de `attendre` pour asyncio"""
+        attente = self._reserver()
+        if attente > 0:
+            await asyncio.sleep(attente)
+        return attente
+
+    def modifier_debit(self, requetes_par_seconde: float):
+        """Change le débit nominal à chaud (les réservations en cours sont conservées)"""
+        if requetes_par_seconde <= 0:
+            raise ValueError("requetes_par_seconde doit être strictement positif")
+        with self._verrou:
+            self.debit_nominal = float(requetes_par_seconde)
+            self.requetes_par_seconde = self.debit_nominal
+            self.debit_min = min(self.debit_min, self.debit_nominal)
+
+    def signaler_saturation(self):
+        """L'API a répondu 429 : baisse multiplicative du débit courant"""
+        with self._verrou:
+            self.saturations += 1
+            maintenant = monotonic()
+            if maintenant - self._derniere_baisse < self.delai_entre_baisses:
+                return
+            self._derniere_baisse = maintenant
+            self.requetes_par_seconde = max(self.debit_min, self.requetes_par_seconde * self.facteur_baisse)
+
+    def signaler_succes(self):
+        """Requête acceptée : hausse additive du débit courant, bornée au nominal"""
+        with self._verrou:
+            if self.requetes_par_seconde < self.debit_nominal:
+                self.requetes_par_seconde = min(self.debit_nominal,
+                                                self.requetes_par_seconde + self.hausse_par_succes)
+
+def _champ_partage(indice: int, type_=float) -> property:
+    """Attribut de `LimiteurInterProcessus` stocké dans son tableau partagé"""
+    def lire(self):
+        return type_(self._etat[indice])
+
+    def ecrire(self, valeur):
+        self._etat[indice] = valeur
+
+    return property(lire, ecrire)
+
+class LimiteurInterProcessus(LimiteurDebit):
+    """
+    `LimiteurDebit` dont l'état (jetons, débit courant AIMD, compteurs) est
+    en mémoire partagée, protégé par un verrou inter-processus : tous les
+    processus d'un pool consomment un seul budget d'appels
+
+    L'instance se transmet aux processus à leur création (argument
+    `initargs` d'un pool) ; les horloges monotones sont communes aux
+    processus d'une même machine.
+    """
+
+    _jetons = _champ_partage(0)
+    _derniere_maj = _champ_partage(1)
+    requetes_par_seconde = _champ_partage(2)
+    debit_nominal = _champ_partage(3)
+    debit_min = _champ_partage(4)
+    _derniere_baisse = _champ_partage(5)
+    saturations = _champ_partage(6, int)
+
+    def __init__(self, requetes_par_seconde: float = DEBIT_MAX_API, rafale: int = 1, contexte=None, **options):
+        """
+        Args:
+            requetes_par_seconde, rafale, **options: voir `LimiteurDebit`
+            contexte: Contexte multiprocessing du pool (celui par défaut sinon)
+        """
+        contexte = contexte or multiprocessing.get_context()
+        self._etat = contexte.Array("d", 7, lock=False)
+        super().__init__(requetes_par_seconde, rafale, **options)
+        self._verrou = contexte.Lock()
+
+_limiteurs_partages: Dict[str, LimiteurDebit] = {}
+_verrou_registre = threading.Lock()
+
+def limiteur_partage(nom: str = "recherche-entreprises", requetes_par_seconde: float = DEBIT_MAX_API,
+                     rafale: int = 1) -> LimiteurDebit:
+    """
+    Retourne le limiteur de débit partagé du processus pour `nom`
+
+    Le limiteur est créé au premier appel avec les paramètres fournis ; les
+    appels suivants retournent la même instance (utiliser `modifier_debit`
+    pour en changer le débit).
+    """
+    with _verrou_registre:
+        limiteur = _limiteurs_partages.get(nom)
+        if limiteur is None:
+            limiteur = LimiteurDebit(requetes_par_seconde, rafale)
+            _limiteurs_partages[nom] = limiteur
+        return limiteur
@@ -11,76 +11,562 @@ Version: 2.0.0
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import urllib.parse
 import pandas as pd
 import os
-from time import sleep
+import random
+import threading
+import copy
+from contextlib import closing
+from itertools import chain
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
 import warnings
-from typing import Tuple, Union
+from typing import Callable, List, Optional, Tuple, Union
+
+from backends import (
+    BackendBase,
+    BackendCache,
+    BackendEcheance,
+    BackendIndex,
+    BackendMemoire,
+    BackendRecherche,
+    DelaiDepasse,
+    ResultatRecherche,
+)
+from cache_recherche import CacheMemoire, CacheRecherche, cle_recherche
+from correspondance import meilleur_candidat
+from export_excel import (
+    LIGNES_MAX_EXCEL,
+    ClasseurEnFlux,
+    compter_lignes_csv,
+    exporter_excel,
+    tient_dans_excel,
+)
+from format_colonnaire import (
+    ColonnaireEnFlux,
+    compter_lignes_colonnaire,
+    ecrire_colonnaire,
+    est_fichier_colonnaire,
+    lire_colonnaire,
+    lire_colonnaire_par_blocs,
+    normaliser_types,
+)
+from index_sirene import IndexSirene
+from journalisation import configurer_journalisation, obtenir_logger
+from metriques import HistogrammeLatence, MetriquesEnrichissement
+from limiteur import DEBIT_MAX_API, LimiteurDebit, limiteur_partage
+from reprise import JournalReprise
 
 # Supprimer les avertissements pandas
 warnings.filterwarnings('ignore', category=FutureWarning)
 
+logger = obtenir_logger("recherche")
+
 BASE_URL = "https://recherche-entreprises.api.gouv.fr"
 
-def recherche_entreprise(api_base: str, terme: str, code_postal: str, per_page: int = 5) -> str:
+# Réponses transitoires : on retente plutôt que de conclure à l'absence de SIREN
+CODES_A_REESSAYER = {429, 500, 502, 503, 504}
+
+# Timeouts (connexion, lecture) de chaque requête, en secondes : une
+# connexion bloquée ne doit jamais figer un enrichissement
+TIMEOUT_DEFAUT = (5.0, 30.0)
+
+def delai_reessai(tentative: int, retry_after: Optional[str] = None,
+                  delai_base: float = 0.5, delai_max: float = 60.0) -> float:
+    """
+    Délai avant la tentative suivante : valeur de l'en-tête Retry-After si
+    présente (secondes ou date HTTP), sinon backoff exponentiel avec jitter
+
+    Args:
+        tentative: Numéro de la tentative qui vient d'échouer (0 = première)
+        retry_after: Valeur brute de l'en-tête Retry-After
+        delai_base: Délai de la première nouvelle tentative (secondes)
+        delai_max: Délai maximal (secondes)
+    """
+    if retry_after:
+        try:
+            return min(delai_max, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                return min(delai_max, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time()))
+            except (TypeError, ValueError):
+                pass
+    plafond = min(delai_max, delai_base * 2 ** tentative)
+    # Jitter « equal » : au moins la moitié du plafond, pour désynchroniser les threads
+    return plafond / 2 + random.uniform(0, plafond / 2)
+
+def _liberer_reponse(requete):
+    """Ferme la réponse d'une requête doublée ignorée, une fois celle-ci terminée"""
+    if not requete.cancelled() and requete.exception() is None:
+        requete.result().close()
+
+class ClientAPI:
+    """
+    Client HTTP réutilisable pour l'API : session persistante avec pool de
+    connexions keep-alive, timeouts et compression gzip.
+
+    Chaque tentative consomme un jeton du limiteur de débit. Les erreurs
+    transitoires (429, 5xx, coupures réseau) sont retentées avec backoff ;
+    les 429 abaissent le débit du limiteur (AIMD), les succès le remontent.
+
+    Mesure la latence de chaque requête pour rendre visible le gain de la
+    réutilisation des connexions (la première requête paie DNS, TCP et TLS).
+
+    Avec `relance_quantile`, une requête plus lente que ce quantile des
+    latences récentes (p95 par exemple) est doublée : la première réponse
+    est retenue, l'autre est ignorée. Le doublon consomme lui aussi un jeton
+    du limiteur, le quota de l'API est donc respecté.
+
+    Une requête déjà envoyée ne peut pas être interrompue : la requête
+    ignorée occupe son thread et sa connexion jusqu'à sa réponse ou son
+    timeout de lecture. Au plus `relance_abandons_max` requêtes ignorées
+    peuvent être en cours ; au-delà, les requêtes lentes ne sont plus
+    doublées.
+    """
+
+    def __init__(self, taille_pool: int = 10, keep_alive: bool = True,
+                 timeout: Tuple[float, float] = TIMEOUT_DEFAUT, gzip: bool = True,
+                 limiteur: Optional[LimiteurDebit] = None, reessais: int = 4,
+                 delai_base: float = 0.5, delai_max: float = 60.0,
+                 metriques: Optional[MetriquesEnrichissement] = None,
+                 relance_quantile: Optional[float] = None, relance_echantillons: int = 20,
+                 relance_abandons_max: Optional[int] = None):
+        """
+        Args:
+            taille_pool: Nombre de connexions conservées par hôte
+            keep_alive: Réutiliser les connexions entre les requêtes
+            timeout: Timeouts (connexion, lecture) en secondes
+            gzip: Demander des réponses compressées
+            limiteur: Limiteur de débit consulté avant chaque tentative
+            reessais: Nombre de nouvelles tentatives après une erreur transitoire
+            delai_base: Premier délai de backoff (secondes)
+            delai_max: Délai de backoff maximal, Retry-After compris (secondes)
+            metriques: Métriques alimentées par chaque requête (latence,
+                statut, nouvelles tentatives, attente du limiteur)
+            relance_quantile: Quantile des latences récentes (entre 0 et 1,
+                0.95 : p95) au-delà duquel une requête est doublée ; None
+                désactive le doublage
+            relance_echantillons: Nombre de latences observées avant le
+                premier doublage (le quantile n'a pas de sens avant)
+            relance_abandons_max: Nombre maximal de requêtes doublées ignorées
+                encore en cours (par défaut `taille_pool`)
+        """
+        if relance_quantile is not None and not 0 < relance_quantile < 1:
+            raise ValueError("relance_quantile doit être compris entre 0 et 1 exclus")
+        self.timeout = timeout
+        # Instant (horloge monotone) au-delà duquel aucune tentative n'est
+        # faite ni attendue ; propre à chaque appel (voir `pour_appel`)
+        self.echeance: Optional[float] = None
+        self.limiteur = limiteur
+        self.reessais = reessais
+        self.delai_base = delai_base
+        self.delai_max = delai_max
+        self.metriques = metriques
+        self.session = requests.Session()
+        adaptateur = HTTPAdapter(pool_connections=taille_pool, pool_maxsize=taille_pool)
+        self.session.mount("https://", adaptateur)
+        self.session.mount("http://", adaptateur)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if gzip else "identity"
+        self.session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+        # Compteurs partagés par le client et ses vues (`pour_appel`) : première
+        # latence (connexion à établir), puis cumul des suivantes, à taille
+        # constante pour les clients de longue durée
+        self._compteurs = {"premiere_latence": None, "latences_suivantes": 0,
+                           "somme_latences_suivantes": 0.0, "reessais": 0, "relances": 0}
+        self._verrou_compteurs = threading.Lock()
+        self.relance_quantile = relance_quantile
+        self.relance_echantillons = relance_echantillons
+        self._latences_recentes = HistogrammeLatence(fenetre=500)
+        self._verrou_relance = threading.Lock()
+        self._pool_relance: Optional[ThreadPoolExecutor] = None
+        if relance_abandons_max is None:
+            relance_abandons_max = taille_pool
+        # Un jeton par requête doublée susceptible d'être ignorée, rendu quand
+        # celle-ci se termine
+        self._abandons = threading.BoundedSemaphore(relance_abandons_max)
+        if relance_quantile is not None:
+            # Requête principale et doublon de chaque worker, plus les
+            # requêtes ignorées qui n'ont pas encore répondu
+            self._pool_relance = ThreadPoolExecutor(max_workers=2 * taille_pool + relance_abandons_max,
+                                                    thread_name_prefix="relance")
+
+    def pour_appel(self, metriques: Optional[MetriquesEnrichissement] = None,
+                   echeance: Optional[float] = None) -> "ClientAPI":
+        """
+        Vue du client pour un enrichissement : même session, limiteur, pool
+        de doublage et compteurs, mais métriques et échéance propres à
+        l'appel, pour que des appels simultanés sur un même client ne se
+        mélangent pas (la vue ne doit pas être fermée)
+        """
+        vue = copy.copy(self)
+        vue.metriques = metriques
+        vue.echeance = echeance
+        return vue
+
+    def _compter(self, compteur: str):
+        with self._verrou_compteurs:
+            self._compteurs[compteur] += 1
+
+    @property
+    def reessais_effectues(self) -> int:
+        return self._compteurs["reessais"]
+
+    @property
+    def relances(self) -> int:
+        return self._compteurs["relances"]
+
+    def _temps_restant(self) -> Optional[float]:
+        """Secondes avant l'échéance (None sans échéance)"""
+        return None if self.echeance is None else self.echeance - monotonic()
+
+    def _reserver(self, url: str) -> Tuple[float, float]:
+        """
+        Attend un jeton du limiteur, sans dépasser l'échéance : un jeton qui
+        ne serait pas disponible à temps n'est pas consommé
+
+        Returns:
+            Timeouts (connexion, lecture) de la requête, écourtés à l'échéance
+
+        Raises:
+            DelaiDepasse: si l'échéance est atteinte avant l'envoi
+        """
+        restant = self._temps_restant()
+        if restant is not None and restant <= 0:
+            raise DelaiDepasse(f"Budget de temps épuisé avant l'appel de {url}")
+        if self.limiteur is not None:
+            attente = self.limiteur.attendre(attente_max=restant)
+            if attente is None:
+                raise DelaiDepasse(f"Pas de jeton du limiteur avant l'échéance pour {url}")
+            if self.metriques is not None:
+                self.metriques.observer_attente_limiteur(attente)
+        timeout = self.timeout
+        restant = self._temps_restant()
+        if restant is not None:
+            if restant <= 0:
+                raise DelaiDepasse(f"Budget de temps épuisé avant l'appel de {url}")
+            # La requête ne dépasse pas l'échéance
+            timeout = tuple(min(valeur, restant) for valeur in timeout)
+        return timeout
+
+    def _envoyer(self, url: str, timeout: Tuple[float, float]) -> requests.Response:
+        """Effectue un GET sur la session et enregistre sa latence"""
+        metriques = self.metriques
+        debut = monotonic()
+        statut = None
+        try:
+            r = self.session.get(url, timeout=timeout)
+            statut = r.status_code
+            return r
+        finally:
+            duree = monotonic() - debut
+            with self._verrou_compteurs:
+                if self._compteurs["premiere_latence"] is None:
+                    self._compteurs["premiere_latence"] = duree
+                else:
+                    self._compteurs["latences_suivantes"] += 1
+                    self._compteurs["somme_latences_suivantes"] += duree
+            if metriques is not None:
+                metriques.observer_requete(duree, statut)
+            if self._pool_relance is not None:
+                with self._verrou_relance:
+                    self._latences_recentes.observer(duree)
+
+    def _seuil_relance(self) -> Optional[float]:
+        """Latence au-delà de laquelle une requête est doublée (None : pas de doublage)"""
+        if self._pool_relance is None:
+            return None
+        with self._verrou_relance:
+            if self._latences_recentes.total < self.relance_echantillons:
+                return None
+            return self._latences_recentes.quantile(self.relance_quantile)
+
+    def _get_unique(self, url: str) -> requests.Response:
+        """Effectue un GET, doublé s'il dépasse le seuil de relance"""
+        timeout = self._reserver(url)
+        seuil = self._seuil_relance()
+        if seuil is None:
+            return self._envoyer(url, timeout)
+        
+        principale = self._pool_relance.submit(self._envoyer, url, timeout)
+        try:
+            return principale.result(timeout=seuil)
+        except FuturesTimeoutError:
+            pass
+        if not self._abandons.acquire(blocking=False):
+            # Trop de requêtes ignorées encore en cours : pas de doublage
+            return principale.result()
+        # Le doublon est décompté du quota comme n'importe quelle requête
+        try:
+            timeout_doublon = self._reserver(url)
+        except DelaiDepasse:
+            self._abandons.release()
+            return principale.result()
+        if principale.done():
+            self._abandons.release()
+            return principale.result()
+        doublon = self._pool_relance.submit(self._envoyer, url, timeout_doublon)
+        self._compter("relances")
+        if self.metriques is not None:
+            self.metriques.observer_relance()
+        
+        en_cours = {principale, doublon}
+        while True:
+            termines, en_cours = wait(en_cours, return_when=FIRST_COMPLETED)
+            # Les deux requêtes peuvent finir ensemble : une réponse l'emporte
+            # sur une erreur réseau, retenue seulement si l'autre échoue aussi
+            gagnante = min(termines, key=lambda requete: requete.exception() is not None)
+            for requete in termines:
+                if requete is not gagnante:
+                    _liberer_reponse(requete)
+            if gagnante.exception() is None or not en_cours:
+                break
+        if not en_cours:
+            self._abandons.release()
+        for perdante in en_cours:
+            # N'annule qu'un doublon pas encore lancé ; une requête en cours
+            # va jusqu'à sa réponse ou son timeout
+            perdante.cancel()
+            perdante.add_done_callback(_liberer_reponse)
+            perdante.add_done_callback(lambda _: self._abandons.release())
+        return gagnante.result()
+
+    def get(self, url: str) -> requests.Response:
+        """
+        GET avec nouvelles tentatives sur erreur transitoire
+
+        Returns:
+            La première réponse non transitoire, ou la dernière réponse obtenue
+            une fois les tentatives épuisées
+
+        Raises:
+            requests.exceptions.ConnectionError, requests.exceptions.Timeout:
+                si la dernière tentative échoue au niveau réseau
+            DelaiDepasse: si l'échéance est atteinte avant une tentative ou
+                pendant l'attente qui la précède
+        """
+        for tentative in range(self.reessais + 1):
+            derniere = tentative == self.reessais
+            try:
+                r = self._get_unique(url)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                restant = self._temps_restant()
+                if restant is not None and restant <= 0:
+                    raise DelaiDepasse(f"Budget de temps épuisé pendant l'appel de {url}") from e
+                if derniere:
+                    raise
+                retry_after = None
+            else:
+                if r.status_code == 429 and self.limiteur is not None:
+                    self.limiteur.signaler_saturation()
+                if r.status_code not in CODES_A_REESSAYER or derniere:
+                    if r.ok and self.limiteur is not None:
+                        self.limiteur.signaler_succes()
+                    return r
+                retry_after = r.headers.get("Retry-After")
+            self._compter("reessais")
+            attente = delai_reessai(tentative, retry_after, self.delai_base, self.delai_max)
+            restant = self._temps_restant()
+            if restant is not None and attente >= restant:
+                raise DelaiDepasse(f"Budget de temps épuisé avant une nouvelle tentative sur {url}")
+            if self.metriques is not None:
+                self.metriques.observer_reessai(attente)
+            sleep(attente)
+
+    def resume_latences(self) -> dict:
+        """
+        Résumé des latences en millisecondes : première requête (connexion à
+        établir) et moyenne des suivantes (connexions réutilisées)
+        """
+        with self._verrou_compteurs:
+            premiere = self._compteurs["premiere_latence"]
+            if premiere is None:
+                return {"requetes": 0}
+            suivantes = self._compteurs["latences_suivantes"]
+            somme = self._compteurs["somme_latences_suivantes"]
+            return {
+                "requetes": suivantes + 1,
+                "premiere_ms": premiere * 1000,
+                "moyenne_suivantes_ms": (somme / suivantes if suivantes else premiere) * 1000,
+            }
+
+    def fermer(self):
+        """Ferme les connexions du pool"""
+        if self._pool_relance is not None:
+            self._pool_relance.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+def recherche_entreprise(api_base: str, terme: str, code_postal: str, per_page: int = 5,
+                         client: Optional[ClientAPI] = None, lever_erreurs: bool = False,
+                         score_min: float = 0.0, details: bool = False):
     """
-    Recherche une entreprise via l'API gouvernementale et retourne le SIREN du premier résultat.
+    Recherche une entreprise via l'API gouvernementale et retourne le SIREN du
+    résultat dont le nom ressemble le plus au terme recherché.
     
     Args:
         api_base (str): URL de base de l'API
         terme (str): Nom de l'entreprise à rechercher
         code_postal (str): Code postal de l'entreprise
         per_page (int): Nombre de résultats par page (défaut: 5)
+        client (ClientAPI): Client à réutiliser (défaut: requête isolée)
+        lever_erreurs (bool): Propager les erreurs au lieu de retourner None,
+            pour distinguer « aucun résultat » d'un échec de la requête
+        score_min (float): Score de confiance du nom (0 à 1) en dessous duquel
+            le meilleur candidat est écarté
+        details (bool): Retourner un `ResultatRecherche` (SIREN, nom, code
+            postal du siège, code NAF, adresse, score) plutôt que le seul SIREN
     
     Returns:
         str: Numéro SIREN trouvé ou None si aucun résultat
     
     Raises:
         requests.exceptions.RequestException: En cas d'erreur de requête HTTP
+            (uniquement si lever_erreurs)
+        DelaiDepasse: Si l'échéance du client est atteinte (toujours levée :
+            la recherche n'a pas abouti, elle ne doit pas passer pour négative)
     """
     if not terme or not terme.strip():
-        print(f"  > Terme de recherche vide, passage...")
+        logger.debug("Terme de recherche vide, passage")
         return None
         
+    url = construire_url_recherche(api_base, terme, code_postal, per_page)
+    
+    try:
+        r = client.get(url) if client is not None else requests.get(url, timeout=TIMEOUT_DEFAUT)
+        logger.debug("URL appelée : %s (status %s)", r.request.url, r.status_code)
+        r.raise_for_status()
+
+        resultat = _extraire_resultat(r.json(), terme, code_postal, score_min)
+        if details:
+            return resultat
+        return resultat.siren if resultat is not None else None
+        
+    except DelaiDepasse:
+        logger.debug("Budget de temps épuisé pour « %s » (%s)", terme, code_postal)
+        raise
+    except requests.exceptions.RequestException as e:
+        logger.warning("Erreur lors de la requête pour « %s » (%s) : %s", terme, code_postal, e,
+                       extra={"terme": terme, "code_postal": code_postal})
+        if lever_erreurs:
+            raise
+        return None
+    except Exception as e:
+        logger.warning("Erreur inattendue pour « %s » (%s) : %s", terme, code_postal, e,
+                       extra={"terme": terme, "code_postal": code_postal})
+        if lever_erreurs:
+            raise
+        return None
+
+def construire_url_recherche(api_base: str, terme: str, code_postal: str, per_page: int = 5) -> str:
+    """
+    Construit l'URL de l'endpoint /search pour un nom et un code postal
+    """
     q = urllib.parse.quote(terme.strip(), safe="")
-    url = (
+    return (
         f"{api_base}/search"
         f"?q={q}"
         f"&code_postal={code_postal}"
         f"&per_page={per_page}"
     )
-    
-    try:
-        r = requests.get(url)
-        print(f"  > URL appelée : {r.request.url}")
-        print(f"  > Status : {r.status_code}")
-        r.raise_for_status()
 
-        results = r.json().get("results", [])
-        if not results:
-            print(f"  > Aucun résultat pour « {terme} » dans le {code_postal}")
-            return None
+def _noms_candidat(resultat: dict) -> List[str]:
+    """
+    Noms sous lesquels un résultat de l'API peut être connu : raison
+    sociale, sigle et enseignes du siège ou des établissements trouvés
+    """
+    noms = [
+        resultat.get("denomination"),
+        resultat.get("denominationUniteLegale"),
+        resultat.get("nom_raison_sociale"),
+        resultat.get("nom_complet"),
+        resultat.get("sigle"),
+    ]
+    for etablissement in [resultat.get("siege") or {}] + (resultat.get("matching_etablissements") or []):
+        noms.extend(etablissement.get("liste_enseignes") or [])
+        noms.append(etablissement.get("nom_commercial"))
+    return [nom for nom in noms if nom]
 
-        premier = results[0]
-        siren = premier.get("siren", "")
-        nom = (
-            premier.get("denomination")
-            or premier.get("denominationUniteLegale")
-            or premier.get("nom_raison_sociale")
-            or premier.get("nom_complet")
-            or "<nom inconnu>"
-        )
-        siege_cp = premier.get("siege", {}).get("code_postal", "<CP inconnu>")
-        print(f"  > Match trouvé → SIREN: {siren} | Nom : {nom} | CP du siège : {siege_cp}")
-        return siren
-        
-    except requests.exceptions.RequestException as e:
-        print(f"  > Erreur lors de la requête : {e}")
+def _extraire_resultat(donnees: dict, terme: str, code_postal: str,
+                       score_min: float = 0.0) -> Optional[ResultatRecherche]:
+    """
+    Retient, parmi les résultats d'une réponse JSON de l'API, celui dont le
+    nom ressemble le plus au terme recherché (premier résultat à égalité)
+    """
+    results = donnees.get("results", [])
+    if not results:
+        logger.debug("Aucun résultat pour « %s » dans le %s", terme, code_postal)
         return None
-    except Exception as e:
-        print(f"  > Erreur inattendue : {e}")
+
+    position, score = meilleur_candidat(terme, [_noms_candidat(resultat) for resultat in results])
+    retenu = results[position]
+    siege = retenu.get("siege") or {}
+    siren = retenu.get("siren", "")
+    noms = _noms_candidat(retenu)
+    nom = noms[0] if noms else None
+    if score < score_min:
+        logger.debug("Meilleur candidat écarté → SIREN: %s | Nom : %s | Score : %.2f", siren, nom, score)
+        return None
+    logger.debug("Match trouvé → SIREN: %s | Nom : %s | CP du siège : %s | Score : %.2f",
+                 siren, nom, siege.get("code_postal"), score,
+                 extra={"terme": terme, "siren": siren, "score": score})
+    if not siren:
         return None
+    return ResultatRecherche(
+        siren, "api", score,
+        nom=nom,
+        code_postal=siege.get("code_postal"),
+        code_naf=retenu.get("activite_principale") or siege.get("activite_principale"),
+        adresse=siege.get("adresse"),
+    )
+
+def _extraire_siren(donnees: dict, terme: str, code_postal: str, score_min: float = 0.0) -> Optional[str]:
+    """
+    Extrait le SIREN du meilleur résultat d'une réponse JSON de l'API
+    """
+    resultat = _extraire_resultat(donnees, terme, code_postal, score_min)
+    return resultat.siren if resultat is not None else None
+
+class BackendAPI(BackendBase):
+    """
+    Backend par défaut : API gouvernementale de recherche d'entreprises
+    """
+
+    def __init__(self, client: Optional[ClientAPI] = None, api_base: str = BASE_URL,
+                 score_min: float = 0.0):
+        """
+        Args:
+            client: Client HTTP à utiliser ; à défaut, un client limité par le
+                limiteur partagé du processus (`limiteur_partage`)
+            api_base: URL de base de l'API
+            score_min: Score de confiance en dessous duquel le candidat est écarté
+        """
+        self.client = client if client is not None else ClientAPI(limiteur=limiteur_partage())
+        self.api_base = api_base
+        self.score_min = score_min
+
+    def pour_appel(self, metriques: Optional[MetriquesEnrichissement] = None,
+                   echeance: Optional[float] = None) -> "BackendAPI":
+        """Copie du backend dont le client alimente `metriques` et respecte `echeance`"""
+        backend = copy.copy(self)
+        backend.client = self.client.pour_appel(metriques, echeance)
+        return backend
+
+    def rechercher(self, nom: str, code_postal: str) -> Optional[ResultatRecherche]:
+        resultat = recherche_entreprise(self.api_base, nom, code_postal, client=self.client,
+                                        lever_erreurs=True, score_min=self.score_min, details=True)
+        if isinstance(resultat, str):
+            # Fonction de recherche substituée qui ne retourne que le SIREN
+            resultat = ResultatRecherche(resultat, "api")
+        return resultat or None
 
 def lire_csv(fichier_csv: str) -> pd.DataFrame:
     """
@@ -127,6 +613,42 @@ def nettoyer_donnees_ligne(row: pd.Series) -> Tuple[str, str, str]:
     
     return nom_usage, code_postal, siren_actuel
 
+def _colonne_texte(serie: pd.Series) -> pd.Series:
+    """Convertit une colonne en texte sans espaces superflus ("" pour les valeurs manquantes)"""
+    valeurs = serie.astype(object)
+    return valeurs.where(valeurs.notna(), "").astype(str).str.strip()
+
+def nettoyer_colonnes(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    """
+    Version vectorisée de `nettoyer_donnees_ligne` appliquée à tout le DataFrame
+
+    Returns:
+        Séries (nom_usage, code_postal, siren_actuel), alignées sur df,
+        identiques ligne à ligne au résultat de `nettoyer_donnees_ligne`
+    """
+    noms = _colonne_texte(df['Nom d\'usage'])
+    sirens = _colonne_texte(df['Num Siren'])
+    
+    # Code postal : 'nan' littéral traité comme manquant, suffixe .0 supprimé
+    code_postal_brut = df['Code Postal'].astype(object)
+    present = code_postal_brut.notna() & (code_postal_brut.where(code_postal_brut.notna(), "").astype(str) != 'nan')
+    codes_postaux = _colonne_texte(code_postal_brut)
+    codes_postaux = codes_postaux.where(~codes_postaux.str.endswith('.0'), codes_postaux.str[:-2])
+    codes_postaux = codes_postaux.where(present, "")
+    
+    return noms, codes_postaux, sirens
+
+def _siren_renseigne(sirens: pd.Series) -> pd.Series:
+    """SIREN nettoyé (voir `nettoyer_colonnes`) présent et non nul ("0", "000000000"...)"""
+    return (sirens.str.strip('0') != '') & (sirens != 'nan')
+
+def masque_siren_renseigne(df: pd.DataFrame) -> pd.Series:
+    """
+    Lignes dont le SIREN est déjà renseigné, avec le critère de
+    l'enrichissement (vide, "nan" et zéros comptent comme manquants)
+    """
+    return _siren_renseigne(_colonne_texte(df['Num Siren']))
+
 def valider_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     """
     Valide et nettoie un DataFrame pour l'enrichissement SIREN
@@ -145,19 +667,127 @@ def valider_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     
     return df
 
-def enrichir_sirens(input_data: Union[str, pd.DataFrame], verbose: bool = True) -> pd.DataFrame:
+# Résultat d'une recherche qui a échoué (erreur API persistante) : la ligne
+# reste à enrichir, contrairement à une recherche sans résultat
+ECHEC_RECHERCHE = object()
+
+# Résultat d'une recherche non faite faute de temps (`deadline=`) : la ligne
+# reste à enrichir lors d'un prochain passage
+HORS_DELAI = object()
+
+# Colonne ajoutée par `enrichir_sirens(..., deadline=)` : issue de la
+# recherche de chaque ligne (vide pour les lignes non recherchées)
+COLONNE_STATUT = "Statut recherche"
+STATUT_TROUVE = "trouvé"
+STATUT_NON_TROUVE = "non trouvé"
+STATUT_ECHEC = "échec"
+STATUT_HORS_DELAI = "hors délai"
+
+# Colonnes ajoutées par `enrichir_sirens(..., details=True)` : champ du
+# `ResultatRecherche` → nom de colonne
+COLONNES_DETAILS = {
+    "nom": "Nom trouvé",
+    "code_postal": "CP siège",
+    "code_naf": "Code NAF",
+    "adresse": "Adresse siège",
+    "score": "Score correspondance",
+    "source": "Source SIREN",
+}
+
+def _planifier_recherches(taches: List[Tuple[int, str, str]],
+                          dedupliquer: bool = True) -> Tuple[List[Tuple[str, str]], List[int]]:
     """
-    Enrichit un DataFrame avec les SIRENs manquants via l'API gouvernementale
-    
+    Regroupe les lignes à enrichir par clé de recherche normalisée pour
+    n'interroger l'API qu'une fois par entreprise
+
     Args:
-        input_data: Chemin vers le fichier CSV d'entrée OU DataFrame pandas
-        verbose: Afficher les logs détaillés
-    
+        taches: Liste de (position, nom_usage, code_postal)
+        dedupliquer: Regrouper les recherches identiques (sinon une par ligne)
+
     Returns:
-        DataFrame pandas enrichi avec les SIRENs
+        (recherches uniques (nom_usage, code_postal), indice de la recherche
+        correspondant à chaque tâche)
     """
-    # Étape 1: Obtenir le DataFrame
-    if isinstance(input_data, str):
+    recherches = []
+    correspondance = []
+    indices = {}
+    for _, nom_usage, code_postal in taches:
+        cle = cle_recherche(nom_usage, code_postal) if dedupliquer else len(recherches)
+        if cle not in indices:
+            indices[cle] = len(recherches)
+            recherches.append((nom_usage, code_postal))
+        correspondance.append(indices[cle])
+    return recherches, correspondance
+
+def _rechercher_sirens(recherches: List[Tuple[str, str]], workers: int,
+                       backend: BackendRecherche, taille_lot: int = 100,
+                       progression: Optional[Callable[[int, int], None]] = None) -> list:
+    """
+    Exécute les recherches SIREN par lots, dans l'ordre fourni
+
+    Args:
+        recherches: Liste de (nom_usage, code_postal)
+        workers: Nombre de threads (1 = séquentiel), chacun traitant des lots
+        backend: Source des résultats (API, index local, cache...)
+        taille_lot: Nombre maximal de recherches par appel à `rechercher_lot`
+        progression: Appelée avec (recherches terminées, total) après chaque lot
+
+    Returns:
+        Liste des résultats (`ResultatRecherche`, None si aucun résultat,
+        ECHEC_RECHERCHE si la recherche a échoué, HORS_DELAI si elle n'a pas
+        été faite faute de temps), alignée sur les recherches
+    """
+    if workers > 1:
+        # Lots plus petits pour répartir la charge entre les threads
+        taille_lot = max(1, min(taille_lot, len(recherches) // (workers * 4)))
+    if progression is not None:
+        # Au moins une centaine d'étapes pour une progression régulière
+        taille_lot = max(1, min(taille_lot, -(-len(recherches) // 100)))
+    lots = [recherches[i:i + taille_lot] for i in range(0, len(recherches), taille_lot)]
+    
+    rechercher_lot = backend.rechercher_lot
+    if progression is not None:
+        verrou = threading.Lock()
+        terminees = 0
+        progression(0, len(recherches))
+        
+        def rechercher_lot(lot):
+            nonlocal terminees
+            resultats = backend.rechercher_lot(lot)
+            with verrou:
+                terminees += len(lot)
+                progression(terminees, len(recherches))
+            return resultats
+
+    if workers > 1 and len(lots) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            resultats_lots = list(pool.map(rechercher_lot, lots))
+    else:
+        resultats_lots = [rechercher_lot(lot) for lot in lots]
+
+    return [HORS_DELAI if isinstance(resultat, DelaiDepasse)
+            else ECHEC_RECHERCHE if isinstance(resultat, Exception) else resultat
+            for resultats in resultats_lots for resultat in resultats]
+
+def lire_fichier_colonnaire(fichier: str) -> pd.DataFrame:
+    """
+    Lit un fichier Parquet ou Arrow (voir `format_colonnaire`) et vérifie
+    les colonnes nécessaires ; `Code Postal` et `Num Siren` sont du texte
+    """
+    if not os.path.exists(fichier):
+        raise FileNotFoundError(f"Le fichier {fichier} n'existe pas")
+    return valider_dataframe(lire_colonnaire(fichier))
+
+def _charger_dataframe(input_data: Union[str, pd.DataFrame], verbose: bool) -> pd.DataFrame:
+    """
+    Charge et valide les données d'entrée (chemin CSV, Parquet ou Arrow,
+    table Arrow ou DataFrame, copié)
+    """
+    if isinstance(input_data, str) and est_fichier_colonnaire(input_data):
+        if verbose:
+            print(f"Lecture du fichier colonnaire : {input_data}")
+        df = lire_fichier_colonnaire(input_data)
+    elif isinstance(input_data, str):
         # C'est un chemin de fichier
         if verbose:
             print(f"Lecture du fichier CSV : {input_data}")
@@ -167,8 +797,14 @@ def enrichir_sirens(input_data: Union[str, pd.DataFrame], verbose: bool = True)
         if verbose:
             print("Traitement du DataFrame fourni")
         df = valider_dataframe(input_data.copy())
+    elif hasattr(input_data, "to_pandas"):
+        # Table Arrow (pyarrow.Table, RecordBatch)
+        if verbose:
+            print("Traitement de la table Arrow fournie")
+        df = valider_dataframe(normaliser_types(input_data.to_pandas()))
     else:
-        raise TypeError("input_data doit être un chemin de fichier (str) ou un DataFrame pandas")
+        raise TypeError("input_data doit être un chemin de fichier (str), un DataFrame pandas "
+                        "ou une table Arrow")
     
     if verbose:
         print(f"DataFrame chargé : {len(df)} lignes")
@@ -176,78 +812,432 @@ def enrichir_sirens(input_data: Union[str, pd.DataFrame], verbose: bool = True)
         print(f"Premières lignes du DataFrame :")
         print(df.head(3))
     
-    # Étape 2: Enrichissement via API
-    lignes_traitées = 0
-    sirens_trouvés = 0
+    return df
+
+def _selectionner_recherches(df: pd.DataFrame, verbose: bool) -> List[Tuple[int, str, str]]:
+    """
+    Sélectionne les lignes sans SIREN à rechercher (nettoyage par colonnes,
+    sans boucle Python sur les lignes hors mode verbose)
+
+    Returns:
+        Liste de (position, nom_usage, code_postal)
+    """
+    noms, codes_postaux, sirens = nettoyer_colonnes(df)
     
-    for index, row in df.iterrows():
-        nom_usage, code_postal, siren_actuel = nettoyer_donnees_ligne(row)
-        
-        if verbose:
-            print(f"\n--- Ligne {index + 2} ---")
+    # SIREN déjà renseigné et non vide, ou nom d'usage / code postal manquant : on passe
+    siren_renseigne = _siren_renseigne(sirens)
+    donnees_manquantes = (noms == '') | (noms == 'nan') | (codes_postaux == '') | (codes_postaux == 'nan')
+    a_rechercher = (~siren_renseigne & ~donnees_manquantes).to_numpy()
+    
+    if verbose:
+        for position, (nom_usage, code_postal, siren_actuel) in enumerate(
+                zip(noms.tolist(), codes_postaux.tolist(), sirens.tolist())):
+            print(f"\n--- Ligne {position + 2} ---")
             print(f"Nom d'usage : '{nom_usage}'")
             print(f"Code postal : '{code_postal}'")
             print(f"SIREN actuel : '{siren_actuel}'")
-        
-        # Si le SIREN est déjà renseigné et non vide, on passe
-        if siren_actuel and siren_actuel != 'nan' and siren_actuel != '0':
-            if verbose:
+            if siren_renseigne.iat[position]:
                 print("  > SIREN déjà renseigné, passage...")
-            lignes_traitées += 1
-            continue
-        
-        # Si nom d'usage ou code postal manquants, on passe
-        if not nom_usage or nom_usage == 'nan' or not code_postal or code_postal == 'nan':
-            if verbose:
+            elif donnees_manquantes.iat[position]:
                 print("  > Nom d'usage ou code postal manquant, passage...")
-            lignes_traitées += 1
-            continue
-        
-        # Recherche du SIREN
-        if verbose:
-            print(f"  > Recherche de '{nom_usage}' dans '{code_postal}'...")
-        
-        siren_trouvé = recherche_entreprise(BASE_URL, nom_usage, code_postal)
-        
-        if siren_trouvé:
-            df.at[index, 'Num Siren'] = str(siren_trouvé)
+    
+    positions = a_rechercher.nonzero()[0]
+    return list(zip(positions.tolist(), noms.to_numpy()[positions].tolist(),
+                    codes_postaux.to_numpy()[positions].tolist()))
+
+def _reporter_resultats(df: pd.DataFrame, taches: List[Tuple[int, str, str]],
+                        resultats: list, verbose: bool, details: bool = False,
+                        statut: bool = False) -> int:
+    """
+    Reporte les SIRENs trouvés dans le DataFrame, par position pour rester
+    aligné sur l'index d'origine
+
+    Args:
+        details: Écrire aussi les informations de l'entreprise retenue dans
+            les colonnes de `COLONNES_DETAILS` (créées si besoin)
+        statut: Écrire l'issue de chaque recherche dans `COLONNE_STATUT`
+
+    Returns:
+        Nombre de SIRENs trouvés
+    """
+    if taches and not pd.api.types.is_string_dtype(df['Num Siren'].dtype):
+        df['Num Siren'] = df['Num Siren'].astype(object)
+    col_siren = df.columns.get_loc('Num Siren')
+    if details:
+        for champ, colonne in COLONNES_DETAILS.items():
+            if colonne not in df.columns:
+                df[colonne] = pd.Series(None, index=df.index, dtype=float if champ == "score" else object)
+            elif champ != "score":
+                df[colonne] = df[colonne].astype(object)
+        cols_details = {champ: df.columns.get_loc(colonne) for champ, colonne in COLONNES_DETAILS.items()}
+    if statut:
+        df[COLONNE_STATUT] = pd.Series(None, index=df.index, dtype=object)
+        col_statut = df.columns.get_loc(COLONNE_STATUT)
+    sirens_trouvés = 0
+    echecs = 0
+    hors_delai = 0
+    
+    for (position, nom_usage, code_postal), resultat in zip(taches, resultats):
+        siren_trouvé = resultat.siren if isinstance(resultat, ResultatRecherche) else resultat
+        if resultat is HORS_DELAI:
+            hors_delai += 1
+            issue = STATUT_HORS_DELAI
+            if verbose:
+                print(f"  > Ligne {position + 2} : budget de temps épuisé avant '{nom_usage}', à relancer")
+        elif resultat is ECHEC_RECHERCHE:
+            echecs += 1
+            issue = STATUT_ECHEC
+            if verbose:
+                print(f"  > Ligne {position + 2} : échec de la recherche pour '{nom_usage}', à relancer")
+        elif siren_trouvé:
+            issue = STATUT_TROUVE
+            df.iat[position, col_siren] = str(siren_trouvé)
+            if details and isinstance(resultat, ResultatRecherche):
+                for champ, col in cols_details.items():
+                    df.iat[position, col] = getattr(resultat, champ)
             sirens_trouvés += 1
             if verbose:
-                print(f"  > SIREN mis à jour : {siren_trouvé}")
+                print(f"  > Ligne {position + 2} : SIREN mis à jour pour '{nom_usage}' : {siren_trouvé}")
         else:
+            issue = STATUT_NON_TROUVE
             if verbose:
-                print("  > Aucun SIREN trouvé")
-        
-        lignes_traitées += 1
-        
-        # Pause pour éviter de surcharger l'API
-        sleep(1)
+                print(f"  > Ligne {position + 2} : aucun SIREN trouvé pour '{nom_usage}' ({code_postal})")
+        if statut:
+            df.iat[position, col_statut] = issue
     
     if verbose:
         print(f"\n=== RÉSUMÉ ENRICHISSEMENT ===")
-        print(f"Lignes traitées : {lignes_traitées}")
+        print(f"Lignes traitées : {len(df)}")
+        print(f"Lignes à enrichir : {len(taches)}")
         print(f"SIRENs trouvés : {sirens_trouvés}")
+        if echecs:
+            print(f"Recherches en échec (à relancer) : {echecs}")
+        if hors_delai:
+            print(f"Recherches non faites, budget de temps épuisé (à relancer) : {hors_delai}")
+    
+    return sirens_trouvés
+
+def _espace_api(api_base: str, score_min: float) -> str:
+    """Espace des résultats de l'API (voir `_espace_resultats`)"""
+    return f"api|{api_base}|{score_min}"
+
+def _espace_resultats(backend: BackendRecherche, persistant: bool = False) -> str:
+    """
+    Espace des résultats d'un backend dans un cache partagé : seuls les
+    backends de même source et mêmes paramètres (score minimal compris)
+    partagent leurs résultats. Un espace `persistant` (cache SQLite, journal)
+    ne dépend que de paramètres stables d'une exécution à l'autre.
+    """
+    if isinstance(backend, BackendAPI):
+        return _espace_api(backend.api_base, backend.score_min)
+    if isinstance(backend, BackendIndex):
+        index = os.path.abspath(backend.index.chemin_index) if persistant else id(backend.index)
+        return f"index|{index}|{backend.score_min}"
+    return type(backend).__name__ if persistant else f"{type(backend).__name__}|{id(backend)}"
+
+def enrichir_sirens(input_data: Union[str, pd.DataFrame], verbose: bool = True,
+                    workers: int = 1, requetes_par_seconde: float = DEBIT_MAX_API,
+                    client: Optional[ClientAPI] = None,
+                    limiteur: Optional[LimiteurDebit] = None,
+                    cache: Optional[CacheRecherche] = None,
+                    dedupliquer: bool = True, journal: Optional[str] = None,
+                    resume: bool = False, index: Optional[IndexSirene] = None,
+                    backend: Optional[BackendRecherche] = None,
+                    score_min: float = 0.0, details: bool = False,
+                    metriques: Optional[MetriquesEnrichissement] = None,
+                    progression: Optional[Callable[[int, int], None]] = None,
+                    deadline: Optional[float] = None,
+                    memoire: Optional[CacheMemoire] = None) -> pd.DataFrame:
+    """
+    Enrichit un DataFrame avec les SIRENs manquants via l'API gouvernementale
+    
+    Args:
+        input_data: Chemin vers le fichier d'entrée (CSV, Parquet ou Arrow),
+            DataFrame pandas ou table Arrow
+        verbose: Afficher les logs détaillés
+        workers: Nombre de recherches simultanées (1 = mode séquentiel historique)
+        requetes_par_seconde: Budget d'appels API si aucun limiteur n'est fourni
+        client: Client HTTP à réutiliser (créé pour la durée de l'appel si
+            absent) ; c'est alors son propre limiteur qui s'applique
+        limiteur: Limiteur de débit adaptatif à partager avec d'autres
+            enrichissements (voir `limiteur.limiteur_partage`)
+        cache: Cache persistant des recherches (voir `cache_recherche.CacheRecherche`)
+        dedupliquer: Une seule recherche par couple (nom, code postal) normalisé,
+            dont le résultat est reporté sur toutes les lignes concernées
+        journal: Fichier journal de reprise où chaque recherche résolue est
+            sauvegardée au fil de l'eau (voir `reprise.JournalReprise`)
+        resume: Reprendre depuis le journal existant : les recherches déjà
+            résolues ne sont pas refaites
+        index: Index local du stock SIRENE (voir `index_sirene`) interrogé à
+            la place de l'API : aucun appel réseau
+        backend: Source de recherche à utiliser à la place de l'API (voir
+            `backends`, par exemple une cascade index local → API) ; le
+            journal et le cache éventuels sont placés devant
+        score_min: Score de confiance minimal (0 à 1) d'une correspondance de
+            nom, pour l'API et l'index local : en dessous, la ligne reste vide
+        details: Ajouter les colonnes de `COLONNES_DETAILS` (nom trouvé, code
+            postal du siège, code NAF, adresse, score, source), renseignées
+            pour les lignes enrichies sans appel API supplémentaire
+        metriques: Métriques à alimenter (latences, débit, erreurs, cache),
+            par exemple partagées entre plusieurs appels ; leur résumé est
+            joint au DataFrame retourné dans `df.attrs["metriques"]`
+        progression: Appelée avec (recherches terminées, recherches à
+            effectuer) au démarrage puis au fil de l'eau, depuis le thread qui
+            vient de finir un lot ; une exception levée par la fonction
+            interrompt l'enrichissement (annulation)
+        deadline: Budget de temps total de l'appel (secondes). Une fois
+            épuisé, plus aucun appel n'est lancé (caches et journal répondent
+            encore) et les requêtes en cours sont écourtées ; le DataFrame est
+            retourné avec les résultats obtenus et une colonne `COLONNE_STATUT`
+            (« trouvé », « non trouvé », « échec », « hors délai ») pour
+            relancer les lignes non résolues
+        memoire: Cache en mémoire partagé avec les enrichissements simultanés
+            du processus (voir `cache_recherche.cache_memoire_partage`) : une
+            recherche déjà en cours ailleurs n'est pas relancée, son résultat
+            est attendu
+    
+    Returns:
+        DataFrame pandas enrichi avec les SIRENs
+    """
+    if workers < 1:
+        raise ValueError("workers doit être supérieur ou égal à 1")
+    if resume and journal is None:
+        raise ValueError("resume=True nécessite un fichier journal")
+    if deadline is not None and deadline < 0:
+        raise ValueError("deadline doit être positif ou nul")
+    echeance = monotonic() + deadline if deadline is not None else None
+
+    # Étape 1: Obtenir le DataFrame
+    df = _charger_dataframe(input_data, verbose)
+    
+    # Étape 2: Sélection des lignes à rechercher
+    taches = _selectionner_recherches(df, verbose)
+    recherches, correspondance = _planifier_recherches(taches, dedupliquer)
+    
+    # Étape 3: Enrichissement via le backend (API par défaut)
+    client_local = backend is None and index is None and client is None
+    if backend is None:
+        if index is not None:
+            backend = BackendIndex(index, score_min)
+        else:
+            if client_local:
+                if limiteur is None:
+                    limiteur = LimiteurDebit(requetes_par_seconde)
+                client = ClientAPI(taille_pool=max(10, workers), limiteur=limiteur)
+            backend = BackendAPI(client, score_min=score_min)
+    
+    # Les sources les plus rapides d'abord : journal de reprise, cache, puis backend
+    if metriques is None:
+        metriques = MetriquesEnrichissement()
+    # Le client (éventuellement partagé avec d'autres appels simultanés)
+    # alimente les métriques de cet appel et respecte son échéance, via une
+    # vue propre à l'appel
+    if isinstance(backend, BackendAPI):
+        backend = backend.pour_appel(metriques, echeance)
+    
+    chaine = backend if echeance is None else BackendEcheance(backend, echeance)
+    espace = _espace_resultats(backend, persistant=True)
+    if cache is not None:
+        chaine = BackendCache(cache, chaine, metriques=metriques, espace=espace)
+    if memoire is not None:
+        chaine = BackendMemoire(memoire, chaine, _espace_resultats(backend), metriques=metriques,
+                                echeance=echeance)
+    if journal is not None:
+        journal_reprise = JournalReprise(journal, resume=resume)
+        chaine = BackendCache(journal_reprise, chaine, source="journal", metriques=metriques,
+                              espace=espace)
+        if verbose and resume:
+            print(f"Reprise depuis {journal} : {len(journal_reprise)} recherche(s) déjà résolue(s)")
+    
+    if verbose:
+        if isinstance(backend, BackendAPI) and backend.client.limiteur is not None:
+            source = f"API, {backend.client.limiteur.requetes_par_seconde:g} req/s"
+        else:
+            source = type(backend).__name__
+        mode = f"{workers} workers" if workers > 1 else "séquentiel"
+        print(f"\n{len(recherches)} recherche(s) à effectuer pour {len(taches)} ligne(s) ({mode}, {source})")
+    
+    debut = monotonic()
+    try:
+        resultats_uniques = _rechercher_sirens(recherches, workers, chaine, progression=progression)
+    finally:
+        metriques.observer_duree(monotonic() - debut)
+        if client_local:
+            client.fermer()
+        if journal is not None:
+            journal_reprise.fermer()
+    
+    # Étape 4: Report des résultats sur toutes les lignes de chaque recherche
+    resultats = [resultats_uniques[i] for i in correspondance]
+    sirens_trouvés = _reporter_resultats(df, taches, resultats, verbose, details, statut=deadline is not None)
+    metriques.observer_lignes(len(df), len(taches), sirens_trouvés,
+                              sum(resultat is ECHEC_RECHERCHE for resultat in resultats),
+                              sum(resultat is HORS_DELAI for resultat in resultats))
+    resume_metriques = metriques.resume()
+    df.attrs["metriques"] = resume_metriques
+    
+    if verbose:
+        if taches:
+            print(f"Recherches uniques : {len(recherches)} "
+                  f"(déduplication : {1 - len(recherches) / len(taches):.0%} des lignes)")
+        if resume_metriques["requetes"]:
+            print(f"Requêtes API : {resume_metriques['requetes']} "
+                  f"({resume_metriques['requetes_par_seconde']:.1f} req/s, "
+                  f"p50 {resume_metriques['latence_p50_ms']:.0f} ms, p95 {resume_metriques['latence_p95_ms']:.0f} ms)")
+            if resume_metriques["reponses_429"] or resume_metriques["attente_limiteur_s"]:
+                print(f"Réponses 429 : {resume_metriques['reponses_429']} | Attente du limiteur : "
+                      f"{resume_metriques['attente_limiteur_s']:.1f} s")
+        if isinstance(backend, BackendAPI):
+            latences = backend.client.resume_latences()
+            if latences["requetes"]:
+                print(f"Latence première requête : {latences['premiere_ms']:.0f} ms")
+                print(f"Latence moyenne (connexions réutilisées) : {latences['moyenne_suivantes_ms']:.0f} ms")
+            if backend.client.reessais_effectues:
+                print(f"Nouvelles tentatives après erreur transitoire : {backend.client.reessais_effectues}")
+        elif index is not None:
+            stats_index = index.statistiques()
+            print(f"Index local : {stats_index['hits_exacts']} correspondance(s) exacte(s), "
+                  f"{stats_index['hits_plein_texte']} approchée(s), {stats_index['misses']} sans résultat")
+        if cache is not None:
+            stats_cache = cache.statistiques()
+            print(f"Cache : {stats_cache['hits']} hit(s) dont {stats_cache['hits_negatifs']} négatif(s), "
+                  f"{stats_cache['misses']} miss ({stats_cache['taux_hit']:.0%} de hits)")
     
     return df
 
+def enrichir_csv_par_blocs(fichier_entree: str, fichier_sortie: str, taille_bloc: int = 50_000,
+                          verbose: bool = True, **options) -> str:
+    """
+    Enrichit un fichier CSV, Parquet ou Arrow bloc par bloc et écrit le
+    résultat au fil de l'eau : la mémoire utilisée dépend de `taille_bloc`,
+    pas de la taille du fichier. L'ordre des lignes et le format (`;`,
+    utf-8-sig pour un CSV) sont conservés.
+    
+    Une sortie `.xlsx` est écrite en flux dans un classeur en écriture seule ;
+    si le fichier d'entrée dépasse la limite d'une feuille Excel, la sortie
+    est produite en CSV (même nom, extension `.csv`). Une sortie `.parquet`
+    ou `.arrow` est écrite en flux, `Code Postal` et `Num Siren` en texte.
+    
+    Args:
+        fichier_entree: Fichier à enrichir (CSV, ou Parquet/Arrow d'après l'extension)
+        fichier_sortie: Fichier enrichi à produire (CSV, Excel si `.xlsx`,
+            Parquet si `.parquet`, Arrow si `.arrow`/`.feather`)
+        taille_bloc: Nombre de lignes lues et enrichies à la fois
+        verbose: Afficher la progression bloc par bloc
+        **options: Options transmises à `enrichir_sirens` (workers, cache,
+            limiteur, journal, resume...) ; le client HTTP et les métriques
+            (`metriques=` pour les récupérer) sont partagés par tous les blocs,
+            `deadline=` vaut pour le fichier entier
+    
+    Returns:
+        Chemin du fichier produit
+    """
+    if not os.path.exists(fichier_entree):
+        raise FileNotFoundError(f"Le fichier {fichier_entree} n'existe pas")
+    if taille_bloc < 1:
+        raise ValueError("taille_bloc doit être supérieur ou égal à 1")
+    
+    options.setdefault('metriques', MetriquesEnrichissement())
+    echeance = monotonic() + options['deadline'] if options.get('deadline') is not None else None
+    client_local = all(options.get(option) is None for option in ('client', 'index', 'backend'))
+    if client_local:
+        limiteur = options.pop('limiteur', None) or LimiteurDebit(options.pop('requetes_par_seconde', DEBIT_MAX_API))
+        options['client'] = ClientAPI(taille_pool=max(10, options.get('workers', 1)), limiteur=limiteur)
+    
+    entree_colonnaire = est_fichier_colonnaire(fichier_entree)
+    excel = fichier_sortie.lower().endswith('.xlsx')
+    if excel:
+        lignes_entree = (compter_lignes_colonnaire(fichier_entree) if entree_colonnaire
+                         else compter_lignes_csv(fichier_entree))
+        if not tient_dans_excel(lignes_entree):
+            fichier_sortie = os.path.splitext(fichier_sortie)[0] + '.csv'
+            excel = False
+            if verbose:
+                print(f"Au-delà de la limite d'une feuille Excel ({LIGNES_MAX_EXCEL} lignes) : "
+                      f"écriture en CSV dans {fichier_sortie}")
+    sortie_csv = not excel and not est_fichier_colonnaire(fichier_sortie)
+    
+    lignes = 0
+    try:
+        if entree_colonnaire:
+            lecteur = closing(lire_colonnaire_par_blocs(fichier_entree, taille_bloc))
+        else:
+            # SIREN lu en texte : le type ne doit pas varier d'un bloc à l'autre.
+            # Vers Parquet/Arrow, dont le schéma est fixé par le premier bloc,
+            # toutes les colonnes sont lues en texte : une colonne vide dans le
+            # premier bloc serait sinon inférée en float puis refusée ensuite
+            types = str if not excel and not sortie_csv else {'Code Postal': str, 'Num Siren': str}
+            lecteur = pd.read_csv(fichier_entree, sep=';', encoding='utf-8-sig',
+                                  dtype=types, chunksize=taille_bloc)
+        with lecteur as blocs:
+            # Premier bloc non vide lu avant de créer la sortie : un fichier
+            # sans ligne de données ne laisse pas de sortie vide derrière lui
+            blocs = (bloc for bloc in blocs if len(bloc))
+            premier = next(blocs, None)
+            if premier is None:
+                raise ValueError("Le fichier d'entrée est vide")
+            if excel:
+                sortie = ClasseurEnFlux(fichier_sortie)
+            elif sortie_csv:
+                # utf-8-sig sur le fichier ouvert : le BOM n'est écrit qu'une fois, en tête
+                sortie = open(fichier_sortie, 'w', encoding='utf-8-sig', newline='')
+            else:
+                sortie = ColonnaireEnFlux(fichier_sortie)
+            with sortie:
+                for numero, bloc in enumerate(chain([premier], blocs)):
+                    bloc.columns = bloc.columns.str.strip()
+                    if echeance is not None:
+                        # Budget restant : les blocs après l'échéance sont marqués « hors délai »
+                        options['deadline'] = max(0.0, echeance - monotonic())
+                    bloc_enrichi = enrichir_sirens(bloc, verbose=False, **options)
+                    if sortie_csv:
+                        bloc_enrichi.to_csv(sortie, sep=';', index=False, header=numero == 0)
+                    else:
+                        sortie.ecrire_bloc(bloc_enrichi)
+                    # Les blocs suivants complètent le journal du premier
+                    if options.get('journal') is not None:
+                        options['resume'] = True
+                    lignes += len(bloc)
+                    if verbose:
+                        print(f"Bloc {numero + 1} enrichi : {lignes} ligne(s) écrite(s) dans {fichier_sortie}")
+    finally:
+        if client_local:
+            options['client'].fermer()
+    
+    return fichier_sortie
+
 def sauvegarder_excel(df: pd.DataFrame, fichier_sortie: str) -> str:
     """
-    Sauvegarde un DataFrame en Excel avec fallback CSV
+    Sauvegarde un DataFrame en Excel (écriture en flux), ou en CSV s'il
+    dépasse la limite de lignes d'une feuille Excel
     
     Returns:
         Chemin du fichier sauvegardé
     """
-    try:
-        df.to_excel(fichier_sortie, index=False, engine='openpyxl')
-        print(f"Fichier Excel sauvegardé : {fichier_sortie}")
-        return fichier_sortie
-    except Exception as e:
-        print(f"Erreur lors de la sauvegarde Excel : {e}")
-        # Fallback en CSV si Excel échoue
-        fichier_csv_sortie = fichier_sortie.replace('.xlsx', '.csv')
-        df.to_csv(fichier_csv_sortie, sep=';', index=False, encoding='utf-8')
-        print(f"Fichier CSV de secours sauvegardé : {fichier_csv_sortie}")
+    if not tient_dans_excel(len(df)):
+        fichier_csv_sortie = os.path.splitext(fichier_sortie)[0] + '.csv'
+        print(f"{len(df)} lignes : au-delà de la limite d'une feuille Excel "
+              f"({LIGNES_MAX_EXCEL} lignes), sauvegarde en CSV")
+        df.to_csv(fichier_csv_sortie, sep=';', index=False, encoding='utf-8-sig')
+        print(f"Fichier CSV sauvegardé : {fichier_csv_sortie}")
         return fichier_csv_sortie
+    
+    exporter_excel(df, fichier_sortie)
+    print(f"Fichier Excel sauvegardé : {fichier_sortie}")
+    return fichier_sortie
+
+def sauvegarder_colonnaire(df: pd.DataFrame, fichier_sortie: str) -> str:
+    """
+    Sauvegarde un DataFrame en Parquet (`.parquet`) ou en Arrow (`.arrow`,
+    `.feather`), sans limite de lignes ; `Code Postal` et `Num Siren` sont
+    écrits en texte
+    
+    Returns:
+        Chemin du fichier sauvegardé
+    """
+    ecrire_colonnaire(df, fichier_sortie)
+    print(f"Fichier colonnaire sauvegardé : {fichier_sortie}")
+    return fichier_sortie
 
 def traiter_fichier_csv(fichier_csv: str):
     """
@@ -265,6 +1255,7 @@ def traiter_fichier_csv(fichier_csv: str):
         print(f"Erreur : {e}")
 
 if __name__ == "__main__":
+    configurer_journalisation("DEBUG")
     # Exemple d'utilisation avec le fichier d'exemple
     fichier_csv = "data/exemple.csv"
     if os.path.exists(fichier_csv):
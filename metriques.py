@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Métriques d'un enrichissement : latences, débit, erreurs de l'API, cache.
+
+Un objet `MetriquesEnrichissement` est alimenté pendant la recherche par le
+client HTTP (latence et statut de chaque requête, nouvelles tentatives,
+attente imposée par le limiteur) et par les caches (hits/misses). Son
+résumé est joint au DataFrame enrichi (`df.attrs["metriques"]`) et il peut
+être exporté au format texte Prometheus, dans un fichier (collecteur
+textfile de node_exporter) ou servi en HTTP.
+
+    metriques = MetriquesEnrichissement()
+    df = enrichir_sirens(df, metriques=metriques)
+    metriques.ecrire_prometheus("/var/lib/node_exporter/siren.prom")
+"""
+
+import os
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+
+# Bornes (secondes) des intervalles de l'histogramme des latences
+BORNES_LATENCE = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class HistogrammeLatence:
+    """
+    Histogramme cumulatif des latences, plus une fenêtre des dernières
+    valeurs pour des quantiles exacts sur l'activité récente
+    """
+
+    def __init__(self, bornes: Sequence[float] = BORNES_LATENCE, fenetre: int = 1000):
+        self.bornes = tuple(bornes)
+        self.comptes = [0] * (len(self.bornes) + 1)
+        self.total = 0
+        self.somme = 0.0
+        self.recentes = deque(maxlen=fenetre)
+
+    def observer(self, duree: float):
+        for i, borne in enumerate(self.bornes):
+            if duree <= borne:
+                self.comptes[i] += 1
+                break
+        else:
+            self.comptes[-1] += 1
+        self.total += 1
+        self.somme += duree
+        self.recentes.append(duree)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Quantile q (entre 0 et 1) des dernières latences, None si aucune"""
+        if not self.recentes:
+            return None
+        valeurs = sorted(self.recentes)
+        return valeurs[min(len(valeurs) - 1, int(q * len(valeurs)))]
+
+    def cumulatifs(self) -> list:
+        """(borne, nombre d'observations <= borne), "+Inf" compris"""
+        cumul, resultat = 0, []
+        for borne, compte in zip(self.bornes + (float("inf"),), self.comptes):
+            cumul += compte
+            resultat.append((borne, cumul))
+        return resultat
+
+class MetriquesEnrichissement:
+    """Compteurs thread-safe d'un ou plusieurs enrichissements"""
+
+    def __init__(self, bornes_latence: Sequence[float] = BORNES_LATENCE):
+        self.latences = HistogrammeLatence(bornes_latence)
+        self.requetes_par_statut: Dict[str, int] = {}
+        self.reessais = 0
+        self.relances = 0
+        self.attente_limiteur = 0.0
+        self.attente_reessais = 0.0
+        self.lectures_memoire: Dict[Tuple[str, str], int] = {}
+        self.lignes = {"traitees": 0, "a_enrichir": 0, "trouvees": 0, "echecs": 0, "hors_delai": 0}
+        self.duree_recherche = 0.0
+        self._verrou = threading.Lock()
+
+    def observer_requete(self, duree: float, statut: Optional[int]):
+        """Enregistre une requête HTTP (statut None : erreur réseau)"""
+        cle = str(statut) if statut is not None else "erreur_reseau"
+        with self._verrou:
+            self.latences.observer(duree)
+            self.requetes_par_statut[cle] = self.requetes_par_statut.get(cle, 0) + 1
+
+    def observer_reessai(self, attente: float):
+        with self._verrou:
+            self.reessais += 1
+            self.attente_reessais += attente
+
+    def observer_relance(self):
+        """Requête doublée car plus lente que le seuil de relance"""
+        with self._verrou:
+            self.relances += 1
+
+    def observer_attente_limiteur(self, attente: float):
+        if attente > 0:
+            with self._verrou:
+                self.attente_limiteur += attente
+
+    def observer_memoire(self, source: str, hit: bool):
+        """Lecture dans un cache ou journal de reprise"""
+        cle = (source, "hit" if hit else "miss")
+        with self._verrou:
+            self.lectures_memoire[cle] = self.lectures_memoire.get(cle, 0) + 1
+
+    def observer_lignes(self, traitees: int, a_enrichir: int, trouvees: int, echecs: int,
+                        hors_delai: int = 0):
+        with self._verrou:
+            self.lignes["traitees"] += traitees
+            self.lignes["a_enrichir"] += a_enrichir
+            self.lignes["trouvees"] += trouvees
+            self.lignes["echecs"] += echecs
+            self.lignes["hors_delai"] += hors_delai
+
+    def observer_duree(self, duree: float):
+        """Temps passé dans l'étape de recherche"""
+        with self._verrou:
+            self.duree_recherche += duree
+
+    def resume(self) -> dict:
+        """Résumé sérialisable (dictionnaire de valeurs simples)"""
+        with self._verrou:
+            requetes = self.latences.total
+            taux_hit = {}
+            for source in {source for source, _ in self.lectures_memoire}:
+                hits = self.lectures_memoire.get((source, "hit"), 0)
+                lectures = hits + self.lectures_memoire.get((source, "miss"), 0)
+                taux_hit[source] = hits / lectures if lectures else 0.0
+            p50, p95 = self.latences.quantile(0.5), self.latences.quantile(0.95)
+            return {
+                "requetes": requetes,
+                "requetes_par_statut": dict(self.requetes_par_statut),
+                "requetes_par_seconde": requetes / self.duree_recherche if self.duree_recherche else 0.0,
+                "latence_moyenne_ms": self.latences.somme / requetes * 1000 if requetes else None,
+                "latence_p50_ms": p50 * 1000 if p50 is not None else None,
+                "latence_p95_ms": p95 * 1000 if p95 is not None else None,
+                "reessais": self.reessais,
+                "relances": self.relances,
+                "reponses_429": self.requetes_par_statut.get("429", 0),
+                "attente_limiteur_s": self.attente_limiteur,
+                "attente_reessais_s": self.attente_reessais,
+                "taux_hit": taux_hit,
+                "lignes": dict(self.lignes),
+                "duree_recherche_s": self.duree_recherche,
+            }
+
+    def format_prometheus(self, prefixe: str = "siren") -> str:
+        """Exposition au format texte Prometheus"""
+        lignes = []
+
+        def metrique(nom, type_, aide, valeurs):
+            lignes.append(f"# HELP {prefixe}_{nom} {aide}")
+            lignes.append(f"# TYPE {prefixe}_{nom} {type_}")
+            for etiquettes, valeur in valeurs:
+                texte = ",".join(f'{cle}="{val}"' for cle, val in etiquettes)
+                suffixe = "{" + texte + "}" if etiquettes else ""
+                lignes.append(f"{prefixe}_{nom}{suffixe} {valeur:g}")
+
+        with self._verrou:
+            metrique("requetes_total", "counter", "Requêtes HTTP envoyées à l'API, par statut",
+                     [((("statut", statut),), n) for statut, n in sorted(self.requetes_par_statut.items())])
+            lignes.append(f"# HELP {prefixe}_requete_duree_secondes Latence des requêtes HTTP")
+            lignes.append(f"# TYPE {prefixe}_requete_duree_secondes histogram")
+            for borne, cumul in self.latences.cumulatifs():
+                le = "+Inf" if borne == float("inf") else f"{borne:g}"
+                lignes.append(f'{prefixe}_requete_duree_secondes_bucket{{le="{le}"}} {cumul}')
+            lignes.append(f"{prefixe}_requete_duree_secondes_sum {self.latences.somme:g}")
+            lignes.append(f"{prefixe}_requete_duree_secondes_count {self.latences.total}")
+            metrique("reessais_total", "counter", "Nouvelles tentatives après erreur transitoire",
+                     [((), self.reessais)])
+            metrique("relances_total", "counter", "Requêtes doublées car plus lentes que le seuil de relance",
+                     [((), self.relances)])
+            metrique("attente_secondes_total", "counter", "Temps passé à attendre, par cause",
+                     [((("cause", "limiteur"),), self.attente_limiteur),
+                      ((("cause", "reessais"),), self.attente_reessais)])
+            metrique("lectures_memoire_total", "counter", "Lectures dans les caches et journaux de reprise",
+                     [((("source", source), ("resultat", resultat)), n)
+                      for (source, resultat), n in sorted(self.lectures_memoire.items())])
+            metrique("lignes_total", "counter", "Lignes des fichiers enrichis, par état",
+                     [((("etat", etat),), n) for etat, n in self.lignes.items()])
+            metrique("recherche_duree_secondes_total", "counter", "Temps passé dans l'étape de recherche",
+                     [((), self.duree_recherche)])
+        return "\n".join(lignes) + "\n"
+
+    def ecrire_prometheus(self, chemin: str, prefixe: str = "siren"):
+        """
+        Écrit l'exposition Prometheus dans un fichier, de façon atomique
+        (collecteur textfile de node_exporter)
+        """
+        temporaire = f"{chemin}.tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            f.write(self.format_prometheus(prefixe))
+        os.replace(temporaire, chemin)
+
+def servir_prometheus(metriques: MetriquesEnrichissement, port: int = 9108,
+                      adresse: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Sert les métriques en HTTP (`GET /metrics`) depuis un thread démon
+
+    Returns:
+        Le serveur démarré (`shutdown()` pour l'arrêter)
+    """
+    class Gestionnaire(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            corps = metriques.format_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+
+        def log_message(self, *args):
+            pass
+
+    serveur = ThreadingHTTPServer((adresse, port), Gestionnaire)
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    return serveur
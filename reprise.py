@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Journal de reprise des enrichissements longs.
+
+Chaque recherche résolue (entreprise trouvée ou aucun résultat) est ajoutée à un
+fichier JSON-lines, écrit sur disque par lots réguliers. Après un plantage
+ou une session Streamlit perdue, relancer l'enrichissement avec le même
+journal et `resume=True` reprend là où il s'était arrêté, sans refaire
+aucun appel API déjà effectué. Les recherches en échec ne sont pas
+journalisées : elles seront retentées.
+"""
+
+import json
+import os
+import threading
+from time import monotonic
+from typing import Union
+
+from cache_recherche import ABSENT, cle_recherche
+
+class JournalReprise:
+    """
+    Journal append-only clé de recherche → résultat, thread-safe
+
+    Les écritures sont tamponnées et déposées sur disque (flush + fsync)
+    toutes les `intervalle` entrées ou `intervalle_secondes` secondes.
+    """
+
+    def __init__(self, chemin: str, resume: bool = False, intervalle: int = 50,
+                 intervalle_secondes: float = 5.0):
+        """
+        Args:
+            chemin: Fichier journal (JSON-lines)
+            resume: Recharger les résultats d'un journal existant ; sinon il
+                est remis à zéro
+            intervalle: Nombre d'entrées entre deux points de sauvegarde
+            intervalle_secondes: Délai maximal entre deux points de sauvegarde
+        """
+        self.chemin = chemin
+        self.intervalle = intervalle
+        self.intervalle_secondes = intervalle_secondes
+        self.resolus = {}
+        self._tampon = []
+        self._dernier_point = monotonic()
+        self._verrou = threading.Lock()
+        if resume and os.path.exists(chemin):
+            self._charger()
+        self._fichier = open(chemin, "a" if resume else "w", encoding="utf-8")
+
+    def _charger(self):
+        with open(self.chemin, encoding="utf-8") as f:
+            for ligne in f:
+                try:
+                    entree = json.loads(ligne)
+                except ValueError:
+                    # Dernière ligne tronquée par un arrêt brutal
+                    continue
+                # "siren" : journaux écrits avant l'enregistrement des résultats détaillés
+                self.resolus[entree["cle"]] = entree.get("resultat", entree.get("siren"))
+
+    def lire(self, nom: str, code_postal: str, espace: str = ""):
+        """
+        Returns:
+            Le résultat journalisé (None si la recherche n'avait rien donné), ou ABSENT
+        """
+        return self.resolus.get(cle_recherche(nom, code_postal, espace), ABSENT)
+
+    def ecrire(self, nom: str, code_postal: str, valeur: Union[str, dict, None], espace: str = ""):
+        """
+        Journalise une recherche résolue (SIREN ou résultat détaillé, None si
+        aucun) ; l'espace (source et paramètres) préfixe la clé, comme dans
+        `CacheRecherche`
+        """
+        cle = cle_recherche(nom, code_postal, espace)
+        with self._verrou:
+            self.resolus[cle] = valeur or None
+            self._tampon.append(json.dumps({"cle": cle, "resultat": valeur or None}, ensure_ascii=False))
+            if (len(self._tampon) >= self.intervalle
+                    or monotonic() - self._dernier_point >= self.intervalle_secondes):
+                self._point_de_sauvegarde()
+
+    def _point_de_sauvegarde(self):
+        if self._tampon:
+            self._fichier.write("\n".join(self._tampon) + "\n")
+            self._tampon = []
+        self._fichier.flush()
+        os.fsync(self._fichier.fileno())
+        self._dernier_point = monotonic()
+
+    def __len__(self) -> int:
+        return len(self.resolus)
+
+    def fermer(self):
+        """Écrit les entrées en attente et ferme le journal"""
+        with self._verrou:
+            if not self._fichier.closed:
+                self._point_de_sauvegarde()
+                self._fichier.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
@@ -7,15 +7,53 @@ import unittest
 import pandas as pd
 import tempfile
 import os
+import time
+import asyncio
+import json
+import logging
+import threading
+import gc
+import warnings
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait
 from unittest.mock import patch, MagicMock
 from main import (
     lire_csv, 
     valider_dataframe, 
     nettoyer_donnees_ligne, 
+    nettoyer_colonnes,
     enrichir_sirens,
     sauvegarder_excel,
-    recherche_entreprise
+    recherche_entreprise,
+    ClientAPI,
+    ECHEC_RECHERCHE,
+    enrichir_csv_par_blocs,
+    delai_reessai,
+    sauvegarder_colonnaire,
+    masque_siren_renseigne,
+    COLONNE_STATUT,
+    TIMEOUT_DEFAUT,
+    BASE_URL,
+    _espace_api,
+    _espace_resultats
 )
+import requests
+import multiprocessing
+from limiteur import LimiteurDebit, LimiteurInterProcessus, limiteur_partage
+from cache_recherche import ABSENT, CacheMemoire, CacheRecherche, cle_recherche
+from reprise import JournalReprise
+from index_sirene import IndexSirene, construire_index
+from journalisation import configurer_journalisation
+import format_colonnaire
+from format_colonnaire import ColonnaireEnFlux, lire_colonnaire, normaliser_types
+from export_excel import ClasseurEnFlux, LimiteExcelDepassee, compter_lignes_csv
+from travaux import ANNULE, ECHEC, STATUT_NON_TRAITE, TERMINE, RegistreTravaux, TravailEnrichissement
+import traitement_lot
+from benchmark import MODES, ServeurAPIFactice, executer_benchmark, generer_donnees
+from metriques import MetriquesEnrichissement, servir_prometheus
+from correspondance import meilleur_candidat, score_similarite
+from backends import (BackendBase, BackendCache, BackendCascade, BackendEcheance, BackendMemoire,
+                      DelaiDepasse, ResultatRecherche)
 
 class TestMainFunctions(unittest.TestCase):
     
@@ -79,6 +117,26 @@ class TestMainFunctions(unittest.TestCase):
         self.assertEqual(cp, '')
         self.assertEqual(siren, '')
     
+    def test_nettoyer_colonnes_identique_a_nettoyer_donnees_ligne(self):
+        """Le nettoyage vectorisé donne exactement le résultat du nettoyage ligne à ligne"""
+        df = pd.DataFrame({
+            'Nom d\'usage': [' Entreprise Test ', None, 'nan', 12.0, '', 'B', pd.NA],
+            'Code Postal': ['75001.0', 'nan', ' 69000 ', None, 13000.0, ' nan', '0'],
+            'Num Siren': ['', 123456789.0, None, '0', ' 987654321 ', 'nan', pd.NA]
+        }, dtype=object)
+        
+        noms, codes_postaux, sirens = nettoyer_colonnes(df)
+        
+        for position, (_, row) in enumerate(df.iterrows()):
+            self.assertEqual((noms.iat[position], codes_postaux.iat[position], sirens.iat[position]),
+                             nettoyer_donnees_ligne(row))
+    
+    def test_masque_siren_renseigne(self):
+        """Vide, "nan", zéros et valeurs manquantes comptent comme SIREN manquant"""
+        df = pd.DataFrame({'Num Siren': ['123456789', '', ' 0 ', None, 'nan', ' 987654321 ', '000000000']},
+                          dtype=object)
+        self.assertEqual(list(masque_siren_renseigne(df)), [True, False, False, False, False, True, False])
+    
     def test_lire_csv_file_not_found(self):
         """Test de lecture d'un fichier inexistant"""
         with self.assertRaises(FileNotFoundError):
@@ -203,6 +261,1715 @@ class TestMainFunctions(unittest.TestCase):
         
         self.assertIsNone(siren)
 
+def _consommer_jetons(limiteur, nombre):
+    """Cible des processus de `test_partage_entre_processus`"""
+    for _ in range(nombre):
+        limiteur.attendre()
+
+class TestLimiteurDebit(unittest.TestCase):
+    """Tests du seau à jetons"""
+    
+    def test_rafale_puis_debit(self):
+        """Les `rafale` premiers jetons sont immédiats, les suivants au débit configuré"""
+        limiteur = LimiteurDebit(requetes_par_seconde=20, rafale=3)
+        debut = time.monotonic()
+        for _ in range(3):
+            limiteur.attendre()
+        self.assertLess(time.monotonic() - debut, 0.04)
+        for _ in range(2):
+            limiteur.attendre()
+        self.assertGreaterEqual(time.monotonic() - debut, 0.09)
+    
+    def test_attente_max(self):
+        """Un jeton indisponible avant attente_max n'est ni attendu ni consommé"""
+        limiteur = LimiteurDebit(requetes_par_seconde=10)
+        self.assertEqual(limiteur.attendre(), 0.0)
+        debut = time.monotonic()
+        self.assertIsNone(limiteur.attendre(attente_max=0.01))
+        self.assertLess(time.monotonic() - debut, 0.01)
+        # Le refus n'a rien réservé : le jeton suivant arrive au bout d'un intervalle, pas deux
+        self.assertLessEqual(limiteur.attendre(attente_max=1.0), 0.1)
+    
+    def test_partage_entre_threads(self):
+        """Un même limiteur borne le débit cumulé de plusieurs threads"""
+        limiteur = LimiteurDebit(requetes_par_seconde=50)
+        debut = time.monotonic()
+        threads = [threading.Thread(target=lambda: [limiteur.attendre() for _ in range(3)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 12 jetons à 50/s : au moins 11 intervalles de 20 ms
+        self.assertGreaterEqual(time.monotonic() - debut, 0.2)
+    
+    def test_partage_entre_processus(self):
+        """Le limiteur inter-processus borne le débit cumulé de plusieurs processus"""
+        limiteur = LimiteurInterProcessus(requetes_par_seconde=50)
+        debut = time.monotonic()
+        processus = [multiprocessing.Process(target=_consommer_jetons, args=(limiteur, 6)) for _ in range(2)]
+        for p in processus:
+            p.start()
+        for p in processus:
+            p.join(timeout=10)
+        self.assertGreaterEqual(time.monotonic() - debut, 0.2)
+        
+        # Baisse AIMD visible de tous les processus
+        limiteur.signaler_saturation()
+        self.assertEqual(limiteur.requetes_par_seconde, 25)
+        self.assertEqual(limiteur.saturations, 1)
+    
+    def test_attendre_async(self):
+        """Le même limiteur est utilisable depuis asyncio"""
+        limiteur = LimiteurDebit(requetes_par_seconde=50)
+        
+        async def scenario():
+            await asyncio.gather(*(limiteur.attendre_async() for _ in range(6)))
+        
+        debut = time.monotonic()
+        asyncio.run(scenario())
+        self.assertGreaterEqual(time.monotonic() - debut, 0.09)
+    
+    def test_limiteur_partage(self):
+        """Le registre retourne la même instance pour un même nom"""
+        self.assertIs(limiteur_partage('test-partage'), limiteur_partage('test-partage', requetes_par_seconde=1))
+        self.assertIsNot(limiteur_partage('test-partage'), limiteur_partage('autre'))
+    
+    @patch('main.requests.Session.get')
+    def test_enrichir_sirens_utilise_limiteur_fourni(self, mock_get):
+        """enrichir_sirens consomme un jeton du limiteur fourni par requête"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'results': [{'siren': '987654321'}]}
+        limiteur = MagicMock()
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'C'],
+            'Code Postal': ['75001'] * 3,
+            'Num Siren': ['', '123456789', '']
+        })
+        
+        with patch('builtins.print'):
+            enrichir_sirens(df_test, verbose=False, limiteur=limiteur)
+        
+        self.assertEqual(limiteur.attendre.call_count, 2)
+    
+    def test_aimd_baisse_puis_remonte(self):
+        """Un 429 divise le débit (une fois par salve), les succès le remontent au nominal"""
+        limiteur = LimiteurDebit(requetes_par_seconde=8, facteur_baisse=0.5, hausse_par_succes=1)
+        limiteur.signaler_saturation()
+        limiteur.signaler_saturation()  # même salve : ignoré
+        self.assertEqual(limiteur.requetes_par_seconde, 4)
+        self.assertEqual(limiteur.saturations, 2)
+        for _ in range(10):
+            limiteur.signaler_succes()
+        self.assertEqual(limiteur.requetes_par_seconde, 8)
+
+class TestReessais(unittest.TestCase):
+    """Tests des nouvelles tentatives sur erreur transitoire"""
+    
+    @staticmethod
+    def _reponse(status, results=None, headers=None):
+        reponse = MagicMock()
+        reponse.status_code = status
+        reponse.ok = status < 400
+        reponse.headers = headers or {}
+        reponse.json.return_value = {'results': results or []}
+        if status >= 400:
+            reponse.raise_for_status.side_effect = requests.exceptions.HTTPError(f'{status}')
+        return reponse
+    
+    def test_delai_reessai(self):
+        """Retry-After est respecté, sinon backoff exponentiel avec jitter"""
+        self.assertEqual(delai_reessai(0, '2'), 2.0)
+        self.assertEqual(delai_reessai(0, '120', delai_max=30), 30)
+        for tentative in range(4):
+            delai = delai_reessai(tentative, None, delai_base=1.0)
+            self.assertGreaterEqual(delai, 2 ** tentative / 2)
+            self.assertLessEqual(delai, 2 ** tentative)
+    
+    @patch('main.sleep')
+    def test_429_puis_succes(self, mock_sleep):
+        """Un 429 est retenté après Retry-After et abaisse le débit du limiteur"""
+        limiteur = LimiteurDebit(requetes_par_seconde=1000)
+        client = ClientAPI(limiteur=limiteur)
+        reponses = [self._reponse(429, headers={'Retry-After': '3'}),
+                    self._reponse(200, [{'siren': '123456789'}])]
+        
+        with patch.object(client.session, 'get', side_effect=reponses), patch('builtins.print'):
+            siren = recherche_entreprise('http://api.test', 'Test', '75001', client=client)
+        
+        self.assertEqual(siren, '123456789')
+        mock_sleep.assert_called_once_with(3.0)
+        self.assertEqual(limiteur.saturations, 1)
+        self.assertEqual(client.reessais_effectues, 1)
+    
+    @patch('main.sleep')
+    @patch('main.requests.Session.get')
+    def test_echec_persistant_ne_perd_pas_la_ligne(self, mock_get, mock_sleep):
+        """Une erreur persistante est signalée comme échec, pas comme « aucun SIREN »"""
+        mock_get.return_value = self._reponse(503)
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A'],
+            'Code Postal': ['75001'],
+            'Num Siren': ['']
+        })
+        
+        with patch('builtins.print'):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                recherche_entreprise('http://api.test', 'A', '75001', client=ClientAPI(reessais=2),
+                                     lever_erreurs=True)
+            self.assertEqual(mock_get.call_count, 3)
+            
+            with patch('main._reporter_resultats') as mock_report:
+                enrichir_sirens(df_test, verbose=False)
+        
+        resultats = mock_report.call_args.args[2]
+        self.assertIs(resultats[0], ECHEC_RECHERCHE)
+
+class TestClientAPI(unittest.TestCase):
+    """Tests du client HTTP persistant"""
+    
+    def test_configuration_session(self):
+        """Pool, keep-alive, gzip et timeouts sont appliqués à la session"""
+        with ClientAPI(taille_pool=4, timeout=(1.0, 2.0)) as client:
+            adaptateur = client.session.get_adapter('https://recherche-entreprises.api.gouv.fr')
+            self.assertEqual(adaptateur._pool_maxsize, 4)
+            self.assertEqual(client.session.headers['Connection'], 'keep-alive')
+            self.assertIn('gzip', client.session.headers['Accept-Encoding'])
+            
+            with patch.object(client.session, 'get') as mock_get:
+                client.get('http://api.test/search')
+            mock_get.assert_called_once_with('http://api.test/search', timeout=(1.0, 2.0))
+            self.assertEqual(client.resume_latences()['requetes'], 1)
+    
+    def test_resume_latences_taille_constante(self):
+        """Première latence et moyenne des suivantes, sans conserver chaque requête"""
+        with ClientAPI() as client:
+            with patch.object(client.session, 'get'), patch('main.monotonic', side_effect=[0.0, 0.5] + [1.0, 1.1] * 200):
+                for _ in range(201):
+                    client.get('http://api.test/search')
+            resume = client.resume_latences()
+        self.assertEqual(resume['requetes'], 201)
+        self.assertAlmostEqual(resume['premiere_ms'], 500.0)
+        self.assertAlmostEqual(resume['moyenne_suivantes_ms'], 100.0)
+        self.assertFalse(hasattr(client, 'latences'))
+    
+    def test_recherche_entreprise_avec_client(self):
+        """recherche_entreprise passe par le client fourni plutôt que requests.get"""
+        client = MagicMock()
+        client.get.return_value.json.return_value = {'results': [{'siren': '123456789'}]}
+        
+        with patch('main.requests.get') as mock_get, patch('builtins.print'):
+            siren = recherche_entreprise('http://api.test', 'Test', '75001', client=client)
+        
+        self.assertEqual(siren, '123456789')
+        client.get.assert_called_once()
+        mock_get.assert_not_called()
+    
+    @patch('main.recherche_entreprise')
+    def test_enrichir_sirens_un_seul_client(self, mock_recherche):
+        """Un même client est réutilisé pour toutes les recherches d'un enrichissement"""
+        mock_recherche.return_value = '987654321'
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'C'],
+            'Code Postal': ['75001'] * 3,
+            'Num Siren': [''] * 3
+        })
+        
+        enrichir_sirens(df_test, verbose=False, workers=3, requetes_par_seconde=1000)
+        
+        clients = {id(appel.kwargs['client']) for appel in mock_recherche.call_args_list}
+        self.assertEqual(len(clients), 1)
+
+class TestDelais(unittest.TestCase):
+    """Tests des timeouts par requête et du budget de temps (`deadline=`)"""
+    
+    def test_timeout_par_defaut(self):
+        """Sans client, recherche_entreprise borne aussi la connexion et la lecture"""
+        with patch('main.requests.get') as mock_get, patch('builtins.print'):
+            mock_get.return_value.json.return_value = {'results': []}
+            recherche_entreprise('http://api.test', 'Test', '75001')
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], TIMEOUT_DEFAUT)
+    
+    def test_client_echeance(self):
+        """Le timeout est écourté à l'échéance, et aucun appel n'est lancé après"""
+        with ClientAPI(timeout=(5.0, 30.0)) as client:
+            with patch.object(client.session, 'get') as mock_get:
+                client.echeance = time.monotonic() + 2.0
+                client.get('http://api.test/search')
+                connexion, lecture = mock_get.call_args.kwargs['timeout']
+                self.assertLessEqual(connexion, 2.0)
+                self.assertLessEqual(lecture, 2.0)
+                
+                client.echeance = time.monotonic() - 1.0
+                with self.assertRaises(DelaiDepasse):
+                    client.get('http://api.test/search')
+                self.assertEqual(mock_get.call_count, 1)
+    
+    def test_limiteur_lent_borne_par_deadline(self):
+        """Un limiteur lent ne fait pas dépasser l'échéance, et les jetons refusés restent disponibles"""
+        limiteur = LimiteurDebit(0.5)
+        client = ClientAPI(limiteur=limiteur)
+        reponse = MagicMock(status_code=200, ok=True)
+        reponse.json.return_value = {'results': []}
+        df_test = pd.DataFrame({'Nom d\'usage': [f'E{i}' for i in range(8)],
+                                'Code Postal': ['75001'] * 8, 'Num Siren': [''] * 8})
+        
+        with client, patch.object(client.session, 'get', return_value=reponse) as mock_get:
+            debut = time.monotonic()
+            df_enrichi = enrichir_sirens(df_test, verbose=False, workers=8, client=client, deadline=1.0)
+            duree = time.monotonic() - debut
+        
+        self.assertLess(duree, 1.5)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(list(df_enrichi[COLONNE_STATUT]).count('hors délai'), 7)
+        # Seul le jeton de la requête envoyée a été consommé
+        self.assertLess(limiteur._jetons, 0.9)
+        self.assertGreater(limiteur._jetons, -0.5)
+
+    def test_appels_simultanes_client_partage(self):
+        """Deux enrichissements simultanés sur un même client gardent leurs métriques et échéance"""
+        client = ClientAPI()
+        reponse = MagicMock(status_code=200, ok=True)
+        reponse.json.return_value = {'results': []}
+
+        def get_lent(*args, **kwargs):
+            time.sleep(0.05)
+            return reponse
+
+        def enrichir(noms, metriques, deadline):
+            df_test = pd.DataFrame({'Nom d\'usage': noms, 'Code Postal': ['75001'] * len(noms),
+                                    'Num Siren': [''] * len(noms)})
+            return enrichir_sirens(df_test, verbose=False, client=client, metriques=metriques,
+                                   deadline=deadline)
+
+        metriques_a, metriques_b = MetriquesEnrichissement(), MetriquesEnrichissement()
+        with client, patch.object(client.session, 'get', side_effect=get_lent):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                appel_a = pool.submit(enrichir, ['A1', 'A2', 'A3'], metriques_a, 60.0)
+                appel_b = pool.submit(enrichir, ['B1', 'B2', 'B3', 'B4', 'B5'], metriques_b, None)
+                df_a, df_b = appel_a.result(), appel_b.result()
+
+        self.assertIsNone(client.metriques)
+        self.assertIsNone(client.echeance)
+        self.assertEqual(metriques_a.resume()['requetes'], 3)
+        self.assertEqual(metriques_b.resume()['requetes'], 5)
+        self.assertIn(COLONNE_STATUT, df_a.columns)
+        self.assertNotIn(COLONNE_STATUT, df_b.columns)
+        self.assertEqual(client.resume_latences()['requetes'], 8)
+
+    def test_backend_echeance(self):
+        """Après l'échéance, le backend lève DelaiDepasse sans chercher"""
+        interne = BackendFactice({'A': '111111111'}, 'api')
+        self.assertEqual(BackendEcheance(interne, time.monotonic() + 60).rechercher('A', '75001'),
+                         ResultatRecherche('111111111', 'api'))
+        resultats = BackendEcheance(interne, time.monotonic() - 1).rechercher_lot([('A', '75001')])
+        self.assertIsInstance(resultats[0], DelaiDepasse)
+        self.assertEqual(interne.appels, ['A'])
+    
+    def test_enrichir_sirens_hors_delai(self):
+        """Les lignes non recherchées à temps sont marquées, le cache répond encore"""
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'C', 'D'],
+            'Code Postal': ['75001'] * 4,
+            'Num Siren': ['', '', '', '']
+        })
+        
+        class BackendLent(BackendFactice):
+            def rechercher(self, nom, code_postal):
+                time.sleep(0.2)
+                return super().rechercher(nom, code_postal)
+        
+        backend = BackendLent({'A': '111111111', 'D': '444444444'}, 'api')
+        with CacheRecherche(':memory:') as cache:
+            cache.ecrire('C', '75001', None, _espace_resultats(backend, persistant=True))
+            df_enrichi = enrichir_sirens(df_test, verbose=False, backend=backend, cache=cache,
+                                         deadline=0.1)
+        
+        self.assertEqual(backend.appels, ['A'])
+        self.assertEqual(list(df_enrichi['Num Siren']), ['111111111', '', '', ''])
+        self.assertEqual(list(df_enrichi[COLONNE_STATUT]),
+                         ['trouvé', 'hors délai', 'non trouvé', 'hors délai'])
+        self.assertEqual(df_enrichi.attrs['metriques']['lignes']['hors_delai'], 2)
+    
+    @patch('main.recherche_entreprise')
+    def test_sans_deadline_pas_de_statut(self, mock_recherche):
+        """La colonne de statut n'apparaît qu'avec deadline="""
+        mock_recherche.return_value = '123456789'
+        df_test = pd.DataFrame({'Nom d\'usage': ['A'], 'Code Postal': ['75001'], 'Num Siren': ['']})
+        
+        self.assertNotIn(COLONNE_STATUT, enrichir_sirens(df_test.copy(), verbose=False).columns)
+        with self.assertRaises(ValueError):
+            enrichir_sirens(df_test, verbose=False, deadline=-1)
+
+class TestRelance(unittest.TestCase):
+    """Tests du doublage des requêtes lentes (`relance_quantile`)"""
+    
+    @staticmethod
+    def _reponses(*lentes):
+        """Réponses de session.get : rapides, sauf les appels numéros `lentes` (1 s)"""
+        appels = []
+        verrou = threading.Lock()
+        
+        def get(url, timeout):
+            with verrou:
+                appels.append(url)
+                numero = len(appels)
+            reponse = MagicMock(status_code=200, ok=True)
+            reponse.numero = numero
+            time.sleep(1.0 if numero in lentes else 0.01)
+            return reponse
+        return get, appels
+    
+    def test_requete_lente_doublee(self):
+        """Au-delà du seuil, un doublon est lancé et la première réponse retenue"""
+        limiteur = LimiteurDebit(1000, rafale=10)
+        metriques = MetriquesEnrichissement()
+        get, appels = self._reponses(4)
+        with ClientAPI(limiteur=limiteur, metriques=metriques, relance_quantile=0.95,
+                       relance_echantillons=3) as client:
+            with patch.object(client.session, 'get', side_effect=get), \
+                    patch.object(limiteur, 'attendre', wraps=limiteur.attendre) as attendre:
+                for _ in range(3):
+                    client.get('http://api.test/search')
+                debut = time.monotonic()
+                reponse = client.get('http://api.test/search')
+                duree = time.monotonic() - debut
+        
+        self.assertEqual(reponse.numero, 5)
+        self.assertLess(duree, 0.5)
+        self.assertEqual(len(appels), 5)
+        # Le doublon a consommé son propre jeton
+        self.assertEqual(attendre.call_count, 5)
+        self.assertEqual(client.relances, 1)
+        self.assertEqual(metriques.resume()['relances'], 1)
+    
+    def test_reponse_preferee_a_une_erreur_simultanee(self):
+        """Requête et doublon terminés ensemble : la réponse est retenue, pas l'erreur réseau"""
+        get_lent, appels = self._reponses(4)
+        
+        def get(url, timeout):
+            reponse = get_lent(url, timeout)
+            if reponse.numero == 4:
+                raise requests.ConnectionError("connexion perdue")
+            return reponse
+        
+        def wait_ensemble(requetes, return_when):
+            # Les deux requêtes sont vues terminées par le même appel, l'erreur en premier
+            termines = wait(requetes)[0]
+            return sorted(termines, key=lambda requete: requete.exception() is None), set()
+        
+        with ClientAPI(relance_quantile=0.95, relance_echantillons=3, reessais=0) as client:
+            with patch.object(client.session, 'get', side_effect=get), patch('main.wait', wait_ensemble):
+                for _ in range(3):
+                    client.get('http://api.test/search')
+                reponse = client.get('http://api.test/search')
+        
+        self.assertEqual(reponse.numero, 5)
+        self.assertEqual(len(appels), 5)
+    
+    def test_pas_de_relance_sans_historique(self):
+        """Pas de doublage tant que les latences observées sont trop peu nombreuses"""
+        get, appels = self._reponses(1)
+        with ClientAPI(relance_quantile=0.95, relance_echantillons=3) as client:
+            with patch.object(client.session, 'get', side_effect=get):
+                reponse = client.get('http://api.test/search')
+        
+        self.assertEqual(reponse.numero, 1)
+        self.assertEqual(len(appels), 1)
+        self.assertEqual(client.relances, 0)
+    
+    def test_requetes_ignorees_bornees(self):
+        """Une requête ignorée encore en cours occupe sa place : pas de nouveau doublage au-delà"""
+        get, appels = self._reponses(4, 6)
+        with ClientAPI(relance_quantile=0.95, relance_echantillons=3, relance_abandons_max=1) as client:
+            with patch.object(client.session, 'get', side_effect=get):
+                for _ in range(3):
+                    client.get('http://api.test/search')
+                self.assertEqual(client.get('http://api.test/search').numero, 5)
+                # L'appel 4, ignoré, n'a pas encore répondu
+                self.assertEqual(client.get('http://api.test/search').numero, 6)
+                self.assertEqual(len(appels), 6)
+                self.assertEqual(client.relances, 1)
+                
+        # L'appel 4 terminé a rendu sa place
+        self.assertTrue(client._abandons.acquire(blocking=False))
+    
+    def test_quantile_invalide(self):
+        with self.assertRaises(ValueError):
+            ClientAPI(relance_quantile=1.5)
+
+class TestEnrichissementConcurrent(unittest.TestCase):
+    """Tests du mode concurrent (workers > 1)"""
+    
+    @patch('main.recherche_entreprise')
+    def test_resultats_alignes_sur_index(self, mock_recherche):
+        """Les SIRENs trouvés en parallèle sont reportés sur les bonnes lignes"""
+        mock_recherche.side_effect = lambda api, nom, cp, **kwargs: f"SIREN-{nom}"
+        df_test = pd.DataFrame({
+            'Nom d\'usage': [f'Entreprise {i}' for i in range(20)],
+            'Code Postal': ['75001'] * 20,
+            'Num Siren': [''] * 20
+        }, index=range(100, 120))
+        
+        df_enrichi = enrichir_sirens(df_test, verbose=False, workers=4, requetes_par_seconde=1000)
+        
+        self.assertEqual(list(df_enrichi.index), list(range(100, 120)))
+        for i in range(20):
+            self.assertEqual(df_enrichi.loc[100 + i, 'Num Siren'], f'SIREN-Entreprise {i}')
+    
+    @patch('main.requests.Session.get')
+    def test_budget_requetes_par_seconde(self, mock_get):
+        """Le débit global est borné par requetes_par_seconde quel que soit le nombre de workers"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'results': [{'siren': '987654321'}]}
+        df_test = pd.DataFrame({
+            'Nom d\'usage': [f'Entreprise {i}' for i in range(6)],
+            'Code Postal': ['75001'] * 6,
+            'Num Siren': [''] * 6
+        })
+        
+        debut = time.monotonic()
+        with patch('builtins.print'):
+            enrichir_sirens(df_test, verbose=False, workers=6, requetes_par_seconde=20)
+        duree = time.monotonic() - debut
+        
+        # 6 appels espacés de 50 ms : au moins 250 ms entre le premier et le dernier
+        self.assertGreaterEqual(duree, 0.25)
+        self.assertEqual(mock_get.call_count, 6)
+    
+    def test_workers_invalide(self):
+        """Un nombre de workers nul est refusé"""
+        with self.assertRaises(ValueError):
+            enrichir_sirens(pd.DataFrame({'Nom d\'usage': ['A'], 'Code Postal': ['75001'], 'Num Siren': ['']}),
+                            verbose=False, workers=0)
+
+try:
+    from aiohttp import web
+    from enrichissement_async import enrichir_sirens_async, recherche_entreprise_async, creer_session_async
+except ImportError:
+    web = None
+
+@unittest.skipIf(web is None, "aiohttp non installé")
+class TestEnrichissementAsync(unittest.IsolatedAsyncioTestCase):
+    """Tests du mode asynchrone contre un serveur local"""
+    
+    async def asyncSetUp(self):
+        self.appels = []
+        
+        async def search(request):
+            self.appels.append(request.query['q'])
+            if request.query['q'] == 'Inconnue':
+                return web.json_response({'results': []})
+            return web.json_response({'results': [{
+                'siren': f"SIREN-{request.query['q']}",
+                'nom_complet': request.query['q'],
+                'siege': {'code_postal': request.query['code_postal']}
+            }]})
+        
+        app = web.Application()
+        app.router.add_get('/search', search)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.api_base = f'http://127.0.0.1:{port}'
+    
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+    
+    async def test_recherche_entreprise_async(self):
+        """Recherche unitaire asynchrone"""
+        async with creer_session_async() as session:
+            with patch('builtins.print'):
+                siren = await recherche_entreprise_async(session, self.api_base, 'Test', '75001')
+                absent = await recherche_entreprise_async(session, self.api_base, 'Inconnue', '75001')
+        self.assertEqual(siren, 'SIREN-Test')
+        self.assertIsNone(absent)
+    
+    async def test_enrichir_sirens_async(self):
+        """Enrichissement asynchrone complet, aligné sur l'index d'origine"""
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'Inconnue', 'D'],
+            'Code Postal': ['75001', '69000', '13000', '33000'],
+            'Num Siren': ['', '123456789', '', '']
+        }, index=[10, 11, 12, 13])
+        
+        with patch('builtins.print'):
+            df_enrichi = await enrichir_sirens_async(df_test, verbose=False, concurrence=3,
+                                                     requetes_par_seconde=1000, api_base=self.api_base)
+        
+        self.assertEqual(list(df_enrichi['Num Siren']), ['SIREN-A', '123456789', '', 'SIREN-D'])
+        self.assertEqual(sorted(self.appels), ['A', 'D', 'Inconnue'])
+    
+    async def test_cache_hors_boucle(self):
+        """Le cache SQLite est lu et écrit hors du thread de la boucle d'événements"""
+        df_test = pd.DataFrame({'Nom d\'usage': ['A', 'B'], 'Code Postal': ['75001'] * 2, 'Num Siren': ['', '']})
+        threads = []
+        with CacheRecherche(':memory:') as cache:
+            cache.ecrire('A', '75001', 'SIREN-CACHE', _espace_api(self.api_base, 0.0))
+            lire, ecrire = cache.lire, cache.ecrire
+            
+            def lire_trace(*args):
+                threads.append(threading.current_thread())
+                return lire(*args)
+            
+            def ecrire_trace(*args):
+                threads.append(threading.current_thread())
+                return ecrire(*args)
+            
+            with patch.object(cache, 'lire', lire_trace), patch.object(cache, 'ecrire', ecrire_trace):
+                df_enrichi = await enrichir_sirens_async(df_test, verbose=False, cache=cache,
+                                                         requetes_par_seconde=1000, api_base=self.api_base)
+        
+        self.assertEqual(list(df_enrichi['Num Siren']), ['SIREN-CACHE', 'SIREN-B'])
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.current_thread(), threads)
+
+class TestDeduplication(unittest.TestCase):
+    """Tests du regroupement des recherches identiques"""
+    
+    def setUp(self):
+        self.df_test = pd.DataFrame({
+            'Nom d\'usage': ['Société A', 'SOCIETE A', 'B', 'société a.', 'B'],
+            'Code Postal': ['75001', '75001', '69000', '75001', '13000'],
+            'Num Siren': [''] * 5
+        })
+    
+    @patch('main.recherche_entreprise')
+    def test_une_recherche_par_cle(self, mock_recherche):
+        """Une seule recherche par (nom, code postal) normalisé, résultat reporté sur chaque ligne"""
+        mock_recherche.side_effect = lambda api, nom, cp, **kwargs: f"SIREN-{cp}"
+        
+        df_enrichi = enrichir_sirens(self.df_test, verbose=False)
+        
+        self.assertEqual(mock_recherche.call_count, 3)
+        self.assertEqual(list(df_enrichi['Num Siren']),
+                         ['SIREN-75001', 'SIREN-75001', 'SIREN-69000', 'SIREN-75001', 'SIREN-13000'])
+    
+    @patch('main.recherche_entreprise')
+    def test_sans_deduplication(self, mock_recherche):
+        """dedupliquer=False conserve une recherche par ligne"""
+        mock_recherche.return_value = '987654321'
+        enrichir_sirens(self.df_test, verbose=False, dedupliquer=False)
+        self.assertEqual(mock_recherche.call_count, 5)
+
+class TestCacheRecherche(unittest.TestCase):
+    """Tests du cache persistant des recherches"""
+    
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        self.chemin = os.path.join(self.dossier.name, 'cache.sqlite')
+    
+    def tearDown(self):
+        self.dossier.cleanup()
+    
+    def test_acces_enregistres_par_lots(self):
+        """Une lecture n'ouvre pas de transaction ; sa date est écrite au plus tard à la fermeture"""
+        with CacheRecherche(self.chemin) as cache:
+            cache.ecrire('A', '75001', '111111111')
+            cache.ecrire('B', '75001', '222222222')
+            time.sleep(0.01)
+            self.assertEqual(cache.lire('A', '75001'), '111111111')
+            self.assertFalse(cache._connexion.in_transaction)
+        
+        with CacheRecherche(self.chemin) as cache:
+            acces = dict(cache._connexion.execute("SELECT cle, acces FROM recherches"))
+        self.assertGreater(acces[cle_recherche('A', '75001')], acces[cle_recherche('B', '75001')])
+    
+    def test_cle_normalisee(self):
+        """Accents, casse, ponctuation et espaces n'influent pas sur la clé"""
+        self.assertEqual(cle_recherche(' Société  Générale, S.A. ', '75009'),
+                         cle_recherche('SOCIETE GENERALE S A', '75009 '))
+    
+    def test_persistance_et_statistiques(self):
+        """Les résultats survivent à la réouverture, les négatifs sont distingués des absents"""
+        with CacheRecherche(self.chemin) as cache:
+            self.assertIs(cache.lire('A', '75001'), ABSENT)
+            cache.ecrire('A', '75001', '123456789')
+            cache.ecrire('B', '69000', None)
+        
+        with CacheRecherche(self.chemin) as cache:
+            self.assertEqual(cache.lire('a', '75001'), '123456789')
+            self.assertIsNone(cache.lire('B', '69000'))
+            self.assertEqual(cache.statistiques()['hits'], 2)
+            self.assertEqual(cache.statistiques()['hits_negatifs'], 1)
+    
+    def test_ttl_negatif(self):
+        """Les résultats négatifs expirent selon leur propre TTL"""
+        with CacheRecherche(self.chemin, ttl=3600, ttl_negatif=-1) as cache:
+            cache.ecrire('A', '75001', '123456789')
+            cache.ecrire('B', '69000', None)
+            self.assertEqual(cache.lire('A', '75001'), '123456789')
+            self.assertIs(cache.lire('B', '69000'), ABSENT)
+    
+    def test_eviction_taille_max(self):
+        """Au-delà de taille_max, les entrées les moins récemment lues sont supprimées"""
+        with CacheRecherche(self.chemin, taille_max=50) as cache:
+            for i in range(100):
+                cache.ecrire(f'Entreprise {i}', '75001', str(i))
+            self.assertEqual(len(cache), 50)
+            self.assertEqual(cache.lire('Entreprise 99', '75001'), '99')
+    
+    @patch('main.recherche_entreprise')
+    def test_enrichir_sirens_avec_cache(self, mock_recherche):
+        """Une seconde exécution est servie par le cache sans appel API"""
+        mock_recherche.return_value = '987654321'
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B'],
+            'Code Postal': ['75001', '69000'],
+            'Num Siren': ['', '']
+        })
+        
+        with CacheRecherche(self.chemin) as cache:
+            enrichir_sirens(df_test, verbose=False, cache=cache)
+            df_enrichi = enrichir_sirens(df_test, verbose=False, cache=cache)
+        
+        self.assertEqual(mock_recherche.call_count, 2)
+        self.assertEqual(list(df_enrichi['Num Siren']), ['987654321', '987654321'])
+    
+    @patch('main.requests.Session.get')
+    def test_cache_separe_par_score_min(self, mock_get):
+        """Un résultat mis en cache sous un score minimal n'est pas resservi sous un autre"""
+        mock_get.return_value = TestReessais._reponse(200, [{'siren': '111111111', 'nom_complet': 'GARE ROUTIERE'}])
+        df_test = pd.DataFrame({'Nom d\'usage': ['Pharmacie Centrale'], 'Code Postal': ['75001'], 'Num Siren': ['']})
+        
+        with CacheRecherche(self.chemin) as cache:
+            permissif = enrichir_sirens(df_test, verbose=False, cache=cache, score_min=0.0)
+            strict = enrichir_sirens(df_test, verbose=False, cache=cache, score_min=0.5)
+            self.assertEqual(mock_get.call_count, 2)
+            strict_en_cache = enrichir_sirens(df_test, verbose=False, cache=cache, score_min=0.5)
+            permissif_en_cache = enrichir_sirens(df_test, verbose=False, cache=cache, score_min=0.0)
+        
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(list(permissif['Num Siren']), ['111111111'])
+        self.assertEqual(list(permissif_en_cache['Num Siren']), ['111111111'])
+        self.assertEqual(list(strict['Num Siren']), [''])
+        self.assertEqual(list(strict_en_cache['Num Siren']), [''])
+
+class TestCacheMemoire(unittest.TestCase):
+    """Tests du cache mémoire du processus et de la coalescence des recherches"""
+    
+    def test_lru_et_ttl(self):
+        """Les entrées les moins récemment lues sont évincées, les négatifs expirent"""
+        memoire = CacheMemoire(taille_max=2, ttl_negatif=0)
+        memoire.ecrire('A', '75001', '111111111')
+        memoire.ecrire('B', '75001', '222222222')
+        self.assertEqual(memoire.lire('a', '75001'), '111111111')
+        memoire.ecrire('C', '75001', None)
+        
+        self.assertIs(memoire.lire('B', '75001'), ABSENT)
+        self.assertEqual(memoire.lire('A', '75001'), '111111111')
+        self.assertIs(memoire.lire('C', '75001'), ABSENT)
+        self.assertIs(memoire.lire('A', '75001', espace='index'), ABSENT)
+    
+    def test_recherches_simultanees_coalescees(self):
+        """Les appelants simultanés d'une même clé attendent la recherche en vol"""
+        memoire = CacheMemoire()
+        appels = []
+        
+        def rechercher():
+            appels.append(1)
+            time.sleep(0.2)
+            return {'siren': '111111111'}
+        
+        resultats = []
+        threads = [threading.Thread(target=lambda: resultats.append(memoire.obtenir('A', '75001', rechercher)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(appels), 1)
+        self.assertEqual(sorted(recherche for _, recherche in resultats), [False] * 7 + [True])
+        self.assertTrue(all(valeur == {'siren': '111111111'} for valeur, _ in resultats))
+        self.assertEqual(memoire.statistiques()['hits'] + memoire.statistiques()['coalescees'], 7)
+    
+    def test_echec_transmis_non_memorise(self):
+        """Un échec est transmis aux appelants en attente mais pas mémorisé"""
+        memoire = CacheMemoire()
+        demarre = threading.Event()
+        
+        def rechercher():
+            demarre.set()
+            time.sleep(0.2)
+            raise requests.ConnectionError("indisponible")
+        
+        erreurs = []
+        
+        def attendre():
+            demarre.wait()
+            try:
+                memoire.obtenir('A', '75001', lambda: '999999999')
+            except requests.ConnectionError as e:
+                erreurs.append(e)
+        
+        thread = threading.Thread(target=attendre)
+        thread.start()
+        with self.assertRaises(requests.ConnectionError):
+            memoire.obtenir('A', '75001', rechercher)
+        thread.join()
+        
+        self.assertEqual(len(erreurs), 1)
+        self.assertEqual(memoire.obtenir('A', '75001', lambda: '111111111'), ('111111111', True))
+    
+    def test_delai_depasse_relance_par_les_suivants(self):
+        """Le dépassement de délai du premier appelant n'est pas imposé aux autres"""
+        memoire = CacheMemoire()
+        demarre = threading.Event()
+        
+        def rechercher():
+            demarre.set()
+            time.sleep(0.2)
+            raise DelaiDepasse("budget épuisé")
+        
+        resultats = []
+        
+        def attendre():
+            demarre.wait()
+            resultats.append(memoire.obtenir('A', '75001', lambda: '111111111'))
+        
+        thread = threading.Thread(target=attendre)
+        thread.start()
+        with self.assertRaises(DelaiDepasse):
+            memoire.obtenir('A', '75001', rechercher)
+        thread.join()
+        
+        self.assertEqual(resultats, [('111111111', True)])
+    
+    def test_attente_bornee_par_l_echeance(self):
+        """Un appelant en attente d'une recherche identique abandonne à sa propre échéance"""
+        memoire = CacheMemoire()
+        demarre, liberer = threading.Event(), threading.Event()
+        
+        def rechercher():
+            demarre.set()
+            liberer.wait()
+            return '111111111'
+        
+        backend = BackendMemoire(memoire, BackendFactice({'A': '999999999'}, 'api'), echeance=time.monotonic() + 0.1)
+        with ThreadPoolExecutor(1) as pool:
+            premier = pool.submit(memoire.obtenir, 'A', '75001', rechercher)
+            demarre.wait()
+            debut = time.monotonic()
+            with self.assertRaises(DelaiDepasse):
+                backend.rechercher('A', '75001')
+            self.assertLess(time.monotonic() - debut, 1.0)
+            liberer.set()
+            self.assertEqual(premier.result(), ('111111111', True))
+    
+    def test_enrichissements_simultanes(self):
+        """Deux enrichissements simultanés des mêmes entreprises : une recherche par entreprise"""
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B'],
+            'Code Postal': ['75001', '75001'],
+            'Num Siren': ['', '']
+        })
+        
+        class BackendLent(BackendFactice):
+            def rechercher(self, nom, code_postal):
+                time.sleep(0.1)
+                return super().rechercher(nom, code_postal)
+        
+        backend = BackendLent({'A': '111111111'}, 'api')
+        memoire = CacheMemoire()
+        resultats = []
+        threads = [threading.Thread(target=lambda: resultats.append(
+            enrichir_sirens(df_test.copy(), verbose=False, workers=2, backend=backend, memoire=memoire)))
+            for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(sorted(backend.appels), ['A', 'B'])
+        for df_enrichi in resultats:
+            self.assertEqual(list(df_enrichi['Num Siren']), ['111111111', ''])
+
+class TestReprise(unittest.TestCase):
+    """Tests du journal de reprise"""
+    
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        self.chemin = os.path.join(self.dossier.name, 'reprise.jsonl')
+        self.df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'C', 'D'],
+            'Code Postal': ['75001', '69000', '13000', '33000'],
+            'Num Siren': [''] * 4
+        })
+    
+    def tearDown(self):
+        self.dossier.cleanup()
+    
+    def test_journal_tolere_ligne_tronquee(self):
+        """Une dernière ligne incomplète (arrêt brutal) est ignorée à la reprise"""
+        with JournalReprise(self.chemin) as journal:
+            journal.ecrire('A', '75001', '111111111')
+            journal.ecrire('B', '69000', None)
+        with open(self.chemin, 'a', encoding='utf-8') as f:
+            f.write('{"cle": "C|130')
+        
+        with JournalReprise(self.chemin, resume=True) as journal:
+            self.assertEqual(len(journal), 2)
+            self.assertEqual(journal.lire('a', '75001'), '111111111')
+            self.assertIsNone(journal.lire('B', '69000'))
+            self.assertIs(journal.lire('C', '13000'), ABSENT)
+    
+    @patch('main.recherche_entreprise')
+    def test_reprise_sans_rappel_api(self, mock_recherche):
+        """Après un arrêt en cours de route, la reprise ne refait que les recherches manquantes"""
+        def plantage_sur_c(api, nom, cp, **kwargs):
+            if nom == 'C':
+                raise KeyboardInterrupt
+            return f'SIREN-{nom}'
+        mock_recherche.side_effect = plantage_sur_c
+        
+        with self.assertRaises(KeyboardInterrupt):
+            enrichir_sirens(self.df_test, verbose=False, journal=self.chemin)
+        
+        mock_recherche.reset_mock()
+        mock_recherche.side_effect = lambda api, nom, cp, **kwargs: f'SIREN-{nom}'
+        df_enrichi = enrichir_sirens(self.df_test, verbose=False, journal=self.chemin, resume=True)
+        
+        self.assertEqual([appel.args[1] for appel in mock_recherche.call_args_list], ['C', 'D'])
+        self.assertEqual(list(df_enrichi['Num Siren']), ['SIREN-A', 'SIREN-B', 'SIREN-C', 'SIREN-D'])
+    
+    def test_resume_sans_journal(self):
+        """resume=True sans journal est refusé"""
+        with self.assertRaises(ValueError):
+            enrichir_sirens(self.df_test, verbose=False, resume=True)
+
+class TestEnrichissementParBlocs(unittest.TestCase):
+    """Tests du traitement CSV par blocs"""
+    
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        self.entree = os.path.join(self.dossier.name, 'entree.csv')
+        self.sortie = os.path.join(self.dossier.name, 'sortie.csv')
+        with open(self.entree, 'w', encoding='utf-8-sig') as f:
+            f.write('Nom d\'usage;Code Postal;Num Siren\n')
+            for i in range(25):
+                f.write(f'Entreprise {i};{75000 + i:05d};{"123456789" if i % 3 == 0 else ""}\n')
+    
+    def tearDown(self):
+        self.dossier.cleanup()
+    
+    def test_entree_sans_ligne(self):
+        """Un fichier réduit à son en-tête est refusé sans créer de sortie"""
+        with open(self.entree, 'w', encoding='utf-8-sig') as f:
+            f.write('Nom d\'usage;Code Postal;Num Siren\n')
+        
+        with self.assertRaises(ValueError):
+            enrichir_csv_par_blocs(self.entree, self.sortie, verbose=False)
+        self.assertFalse(os.path.exists(self.sortie))
+    
+    def test_lecteur_ferme_sur_erreur(self):
+        """Une erreur pendant l'enrichissement ne laisse pas le fichier d'entrée ouvert"""
+        with open(self.entree, 'w', encoding='utf-8-sig') as f:
+            f.write('a;b\n1;2\n')
+        
+        with warnings.catch_warnings(record=True) as avertissements:
+            warnings.simplefilter('always', ResourceWarning)
+            with self.assertRaises(ValueError):
+                enrichir_csv_par_blocs(self.entree, self.sortie, verbose=False)
+            gc.collect()
+        self.assertFalse([a for a in avertissements if issubclass(a.category, ResourceWarning)])
+    
+    @patch('main.recherche_entreprise')
+    def test_sortie_identique_et_ordonnee(self, mock_recherche):
+        """Le fichier produit par blocs contient toutes les lignes, dans l'ordre, avec un seul en-tête"""
+        mock_recherche.side_effect = lambda api, nom, cp, **kwargs: f'SIREN-{cp}'
+        
+        with patch('builtins.print'):
+            chemin = enrichir_csv_par_blocs(self.entree, self.sortie, taille_bloc=10)
+        
+        with open(chemin, 'rb') as f:
+            contenu = f.read()
+        self.assertTrue(contenu.startswith(b'\xef\xbb\xbf'))
+        self.assertEqual(contenu.count(b'\xef\xbb\xbf'), 1)
+        
+        df = pd.read_csv(chemin, sep=';', encoding='utf-8-sig', dtype=str)
+        self.assertEqual(len(df), 25)
+        self.assertEqual(list(df['Nom d\'usage']), [f'Entreprise {i}' for i in range(25)])
+        self.assertEqual(df['Code Postal'].iloc[0], '75000')
+        for i in range(25):
+            attendu = '123456789' if i % 3 == 0 else f'SIREN-{75000 + i:05d}'
+            self.assertEqual(df['Num Siren'].iloc[i], attendu)
+    
+    def test_fichier_inexistant(self):
+        """Un fichier d'entrée absent est signalé"""
+        with self.assertRaises(FileNotFoundError):
+            enrichir_csv_par_blocs('inexistant.csv', self.sortie)
+    
+    @patch('main.recherche_entreprise')
+    def test_sortie_excel_en_flux(self, mock_recherche):
+        """Une sortie .xlsx reçoit les blocs au fil de l'eau ; trop grande, elle passe en CSV"""
+        mock_recherche.side_effect = lambda api, nom, cp, **kwargs: f'SIREN-{cp}'
+        sortie_excel = os.path.join(self.dossier.name, 'sortie.xlsx')
+        
+        chemin = enrichir_csv_par_blocs(self.entree, sortie_excel, taille_bloc=10, verbose=False)
+        df = pd.read_excel(chemin, dtype=str)
+        self.assertEqual(chemin, sortie_excel)
+        self.assertEqual(len(df), 25)
+        self.assertEqual(df['Num Siren'].iloc[1], 'SIREN-75001')
+        
+        with patch('export_excel.LIGNES_MAX_EXCEL', 20):
+            chemin = enrichir_csv_par_blocs(self.entree, sortie_excel, taille_bloc=10, verbose=False)
+        self.assertEqual(chemin, os.path.join(self.dossier.name, 'sortie.csv'))
+        self.assertEqual(len(pd.read_csv(chemin, sep=';', encoding='utf-8-sig')), 25)
+
+class TestExportExcel(unittest.TestCase):
+    """Tests de l'export Excel en flux"""
+    
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'C'],
+            'Code Postal': ['75001', None, '13000'],
+            'Score': [1.0, float('nan'), 0.5],
+        })
+    
+    def tearDown(self):
+        self.dossier.cleanup()
+    
+    def test_blocs_successifs(self):
+        """Les blocs forment une seule feuille, avec un seul en-tête et des cellules vides pour NaN"""
+        chemin = os.path.join(self.dossier.name, 'sortie.xlsx')
+        with ClasseurEnFlux(chemin) as classeur:
+            classeur.ecrire_bloc(self.df.iloc[:2])
+            classeur.ecrire_bloc(self.df.iloc[2:])
+        
+        relu = pd.read_excel(chemin, dtype={'Code Postal': str})
+        self.assertEqual(list(relu.columns), list(self.df.columns))
+        self.assertEqual(list(relu['Nom d\'usage']), ['A', 'B', 'C'])
+        self.assertTrue(pd.isna(relu['Code Postal'].iloc[1]))
+        self.assertEqual(relu['Score'].iloc[2], 0.5)
+    
+    def test_limite_de_lignes(self):
+        """Au-delà de la limite d'une feuille : erreur explicite, ou CSV pour sauvegarder_excel"""
+        chemin = os.path.join(self.dossier.name, 'sortie.xlsx')
+        with patch('export_excel.LIGNES_MAX_EXCEL', 3):
+            with self.assertRaises(LimiteExcelDepassee):
+                with ClasseurEnFlux(chemin) as classeur:
+                    classeur.ecrire_bloc(self.df)
+            self.assertFalse(os.path.exists(chemin))
+            
+            with patch('builtins.print'):
+                chemin_sauvegarde = sauvegarder_excel(self.df, chemin)
+        self.assertEqual(chemin_sauvegarde, os.path.join(self.dossier.name, 'sortie.csv'))
+        self.assertEqual(len(pd.read_csv(chemin_sauvegarde, sep=';', encoding='utf-8-sig')), 3)
+    
+    def test_compter_lignes_csv(self):
+        """Lignes de données comptées sans parser, avec ou sans retour final"""
+        chemin = os.path.join(self.dossier.name, 'entree.csv')
+        for contenu, attendu in (('a;b\n1;2\n3;4\n', 2), ('a;b\n1;2\n3;4', 2), ('a;b\n', 0), ('', 0)):
+            with open(chemin, 'w') as f:
+                f.write(contenu)
+            self.assertEqual(compter_lignes_csv(chemin), attendu)
+
+@unittest.skipIf(format_colonnaire.pa is None, "pyarrow non installé")
+class TestFormatColonnaire(unittest.TestCase):
+    """Tests de l'entrée et de la sortie Parquet/Arrow"""
+    
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        # Colonnes numériques, comme dans un Parquet produit sans schéma
+        self.df = pd.DataFrame({
+            'Nom d\'usage': ['ALPHA', 'BETA', 'GAMMA'],
+            'Code Postal': [1000, 75001, None],
+            'Num Siren': [None, None, 12345678.0],
+        })
+    
+    def tearDown(self):
+        self.dossier.cleanup()
+    
+    def test_normaliser_types(self):
+        """Codes postaux et SIREN numériques en texte, zéros de tête restaurés"""
+        df = normaliser_types(self.df.copy())
+        self.assertEqual(list(df['Code Postal']), ['01000', '75001', None])
+        self.assertEqual(list(df['Num Siren']), [None, None, '012345678'])
+    
+    @patch('main.recherche_entreprise')
+    def test_siren_zero_numerique_manquant(self, mock_recherche):
+        """Un SIREN numérique à 0 compte comme manquant et la ligne est enrichie"""
+        mock_recherche.return_value = '987654321'
+        chemin = os.path.join(self.dossier.name, 'zero.parquet')
+        pd.DataFrame({'Nom d\'usage': ['ALPHA', 'BETA'], 'Code Postal': ['75001', '75001'],
+                      'Num Siren': [0, 123456789]}).to_parquet(chemin)
+        
+        self.assertEqual(list(lire_colonnaire(chemin)['Num Siren']), [None, '123456789'])
+        df = enrichir_sirens(chemin, verbose=False)
+        self.assertEqual(mock_recherche.call_count, 1)
+        self.assertEqual(list(df['Num Siren']), ['987654321', '123456789'])
+    
+    @patch('main.recherche_entreprise')
+    def test_enrichir_parquet(self, mock_recherche):
+        """Un fichier Parquet et une table Arrow s'enrichissent comme un CSV"""
+        mock_recherche.return_value = "123456789"
+        chemin = os.path.join(self.dossier.name, 'entree.parquet')
+        self.df.to_parquet(chemin)
+        
+        df = enrichir_sirens(chemin, verbose=False)
+        self.assertEqual(list(df['Num Siren']), ['123456789', '123456789', '012345678'])
+        self.assertEqual(df['Code Postal'].iloc[0], '01000')
+        
+        table = format_colonnaire.pa.Table.from_pandas(self.df)
+        self.assertEqual(list(enrichir_sirens(table, verbose=False)['Num Siren']), list(df['Num Siren']))
+    
+    def test_sauvegarde_conserve_le_texte(self):
+        """Parquet et Arrow relus avec des SIREN et codes postaux en texte"""
+        for extension in ('.parquet', '.arrow'):
+            chemin = os.path.join(self.dossier.name, 'sortie' + extension)
+            with patch('builtins.print'):
+                sauvegarder_colonnaire(self.df, chemin)
+            relu = pd.read_parquet(chemin) if extension == '.parquet' else pd.read_feather(chemin)
+            self.assertEqual(list(relu['Code Postal'].fillna('')), ['01000', '75001', ''])
+            self.assertEqual(relu['Num Siren'].iloc[2], '012345678')
+    
+    def test_flux_schema_fixe(self):
+        """Un bloc où une colonne est vide garde le schéma du premier ; erreur : pas de fichier partiel"""
+        chemin = os.path.join(self.dossier.name, 'sortie.parquet')
+        with ColonnaireEnFlux(chemin) as sortie:
+            sortie.ecrire_bloc(pd.DataFrame({'Nom': [None], 'Num Siren': [None]}))
+            sortie.ecrire_bloc(pd.DataFrame({'Nom': ['A'], 'Num Siren': ['123456789']}))
+        self.assertEqual(list(lire_colonnaire(chemin)['Num Siren']), [None, '123456789'])
+        
+        with self.assertRaises(RuntimeError):
+            with ColonnaireEnFlux(chemin) as sortie:
+                sortie.ecrire_bloc(self.df)
+                raise RuntimeError("interruption")
+        self.assertFalse(os.path.exists(chemin))
+    
+    @patch('main.recherche_entreprise')
+    def test_blocs_parquet(self, mock_recherche):
+        """Parquet en entrée, Arrow en sortie, bloc par bloc, ordre conservé"""
+        mock_recherche.return_value = "123456789"
+        entree = os.path.join(self.dossier.name, 'entree.parquet')
+        sortie = os.path.join(self.dossier.name, 'sortie.arrow')
+        self.df.to_parquet(entree)
+        
+        self.assertEqual(enrichir_csv_par_blocs(entree, sortie, taille_bloc=2, verbose=False), sortie)
+        relu = lire_colonnaire(sortie)
+        self.assertEqual(list(relu['Nom d\'usage']), ['ALPHA', 'BETA', 'GAMMA'])
+        self.assertEqual(list(relu['Num Siren']), ['123456789', '123456789', '012345678'])
+    
+    @patch('main.recherche_entreprise')
+    def test_csv_vers_parquet_colonne_vide_au_debut(self, mock_recherche):
+        """Une colonne vide dans le premier bloc d'un CSV ne fige pas un type numérique"""
+        mock_recherche.return_value = "123456789"
+        entree = os.path.join(self.dossier.name, 'entree.csv')
+        sortie = os.path.join(self.dossier.name, 'sortie.parquet')
+        pd.DataFrame({'Nom d\'usage': ['ALPHA', 'BETA'], 'Code Postal': ['75001', '75002'],
+                      'Num Siren': ['', ''], 'Commentaire': ['', 'client historique']}).to_csv(
+            entree, sep=';', index=False, encoding='utf-8-sig')
+        
+        enrichir_csv_par_blocs(entree, sortie, taille_bloc=1, verbose=False)
+        relu = lire_colonnaire(sortie)
+        self.assertEqual(list(relu['Commentaire'].fillna('')), ['', 'client historique'])
+        self.assertEqual(list(relu['Num Siren']), ['123456789', '123456789'])
+
+class TestFormatColonnaireSansPyarrow(unittest.TestCase):
+    """Sans pyarrow, les fonctions colonnaires l'indiquent explicitement"""
+    
+    def test_import_error(self):
+        with patch('format_colonnaire.pa', None):
+            with self.assertRaises(ImportError):
+                lire_colonnaire('entree.parquet')
+            with self.assertRaises(ImportError):
+                ColonnaireEnFlux('sortie.parquet')
+
+try:
+    from streamlit.testing.v1 import AppTest
+except ImportError:  # pragma: no cover - streamlit optionnel pour les tests
+    AppTest = None
+
+@unittest.skipIf(AppTest is None, "streamlit non installé")
+class TestApplications(unittest.TestCase):
+    """Chargement des scripts Streamlit de bout en bout"""
+    
+    def test_app_advanced(self):
+        """La page d'accueil s'affiche et le cache se vide sans erreur"""
+        application = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                     'app_advanced.py'), default_timeout=30)
+        application.run()
+        self.assertFalse(application.exception)
+        
+        bouton = next(bouton for bouton in application.sidebar.button if 'Vider le cache' in bouton.label)
+        bouton.click().run()
+        self.assertFalse(application.exception)
+    
+    def test_app(self):
+        application = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'),
+                                        default_timeout=30)
+        application.run()
+        self.assertFalse(application.exception)
+
+class TestTravaux(unittest.TestCase):
+    """Tests des enrichissements en arrière-plan"""
+    
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'Nom d\'usage': [f'ENTREPRISE {i % 4}' for i in range(10)],
+            'Code Postal': ['75001'] * 10,
+            'Num Siren': [''] * 10,
+        })
+    
+    @patch('main.recherche_entreprise')
+    def test_progression(self, mock_recherche):
+        """La progression part de 0 et atteint le total des recherches"""
+        mock_recherche.return_value = "123456789"
+        etapes = []
+        enrichir_sirens(self.df, verbose=False, progression=lambda faites, total: etapes.append((faites, total)))
+        self.assertEqual(etapes[0], (0, 4))
+        self.assertEqual(etapes[-1], (4, 4))
+        self.assertEqual(len(etapes), 5)
+    
+    def test_verbose_transmis(self):
+        """verbose est désactivé par défaut dans un travail, et transmis s'il est demandé"""
+        for options, attendu in (({}, False), ({'verbose': True}, True)):
+            with patch('travaux.enrichir_sirens', side_effect=lambda df, **kwargs: df) as mock_enrichir:
+                TravailEnrichissement(self.df, taille_bloc=10, **options).executer()
+            self.assertIs(mock_enrichir.call_args.kwargs['verbose'], attendu)
+    
+    @patch('main.recherche_entreprise')
+    def test_travail_par_blocs(self, mock_recherche):
+        """Résultat complet dans l'ordre, une recherche par entreprise malgré les blocs"""
+        mock_recherche.return_value = "123456789"
+        travail = TravailEnrichissement(self.df, taille_bloc=3)
+        travail.executer()
+        
+        etat = travail.etat_courant()
+        self.assertEqual(etat['etat'], TERMINE)
+        self.assertEqual(etat['fraction'], 1.0)
+        self.assertEqual(list(travail.resultat.index), list(range(10)))
+        self.assertTrue((travail.resultat['Num Siren'] == '123456789').all())
+        self.assertEqual(mock_recherche.call_count, 4)
+        self.assertEqual(travail.resultat.attrs['metriques']['lignes']['trouvees'], 10)
+    
+    @patch('main.recherche_entreprise')
+    def test_annulation_resultat_partiel(self, mock_recherche):
+        """Après annulation, seuls les blocs terminés sont disponibles"""
+        self.df['Nom d\'usage'] = [f'ENTREPRISE {i}' for i in range(10)]
+        travail = TravailEnrichissement(self.df, taille_bloc=5)
+        
+        def recherche(*args, **kwargs):
+            if mock_recherche.call_count == 7:
+                travail.annuler()
+            return "123456789"
+        mock_recherche.side_effect = recherche
+        travail.executer()
+        
+        self.assertEqual(travail.etat_courant()['etat'], ANNULE)
+        self.assertEqual(len(travail.resultat_partiel()), 5)
+        self.assertIsNone(travail.resultat)
+        complet = travail.resultat_complet()
+        self.assertEqual(list(complet.index), list(range(10)))
+        self.assertEqual(list(complet['Num Siren'].fillna('')), ['123456789'] * 5 + [''] * 5)
+        self.assertEqual(list(complet[COLONNE_STATUT].iloc[5:]), [STATUT_NON_TRAITE] * 5)
+    
+    def test_un_client_par_travail(self):
+        """Tous les blocs d'un travail utilisent le même client, fermé à la fin"""
+        clients = []
+        
+        def enrichir(df, **options):
+            clients.append(options['client'])
+            return df
+        
+        with patch('travaux.enrichir_sirens', side_effect=enrichir), \
+                patch.object(ClientAPI, 'fermer', autospec=True) as fermer:
+            TravailEnrichissement(self.df, taille_bloc=3, limiteur=LimiteurDebit(1000)).executer()
+        
+        self.assertEqual(len(clients), 4)
+        self.assertEqual(len({id(client) for client in clients}), 1)
+        fermer.assert_called_once_with(clients[0])
+    
+    @patch('main.recherche_entreprise')
+    def test_registre(self, mock_recherche):
+        """Le registre exécute les travaux en arrière-plan et conserve les échecs"""
+        mock_recherche.return_value = "123456789"
+        registre = RegistreTravaux(max_travaux=1)
+        try:
+            identifiant = registre.soumettre(self.df)
+            # Pool d'un seul thread : attendre une tâche vide, c'est attendre le travail
+            registre._pool.submit(lambda: None).result(timeout=5)
+            with patch('travaux.enrichir_sirens', side_effect=RuntimeError("panne")):
+                en_echec = registre.soumettre(self.df)
+                registre._pool.submit(lambda: None).result(timeout=5)
+            self.assertEqual(registre.obtenir(identifiant).etat, TERMINE)
+            self.assertEqual(registre.obtenir(en_echec).etat_courant()['erreur'], "panne")
+            self.assertEqual(registre.obtenir(en_echec).etat, ECHEC)
+            self.assertIsNone(registre.obtenir('inconnu'))
+            
+            registre.duree_conservation = 0
+            registre.nettoyer()
+            self.assertEqual(len(registre), 0)
+        finally:
+            registre.fermer()
+        
+        with self.assertRaises(ValueError):
+            registre.soumettre(self.df.drop(columns=['Num Siren']))
+
+class TestIndexSirene(unittest.TestCase):
+    """Tests de l'index local construit depuis un stock SIRENE synthétique"""
+    
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        self.stock = os.path.join(self.dossier.name, 'StockEtablissement.csv')
+        self.unites = os.path.join(self.dossier.name, 'StockUniteLegale.csv')
+        self.chemin_index = os.path.join(self.dossier.name, 'sirene.sqlite')
+        # Colonnes du stock réel : les établissements ne portent pas la dénomination de l'entreprise
+        pd.DataFrame({
+            'siren': ['111111111', '111111111', '222222222', '333333333', '444444444'],
+            'nic': ['00011', '00029', '00014', '00017', '00010'],
+            'siret': ['11111111100011', '11111111100029', '22222222200014', '33333333300017', '44444444400010'],
+            'etatAdministratifEtablissement': ['A', 'A', 'A', 'A', 'F'],
+            'etablissementSiege': ['true', 'false', 'true', 'true', 'true'],
+            'codePostalEtablissement': ['75001', '69000', '75001', '13000', '33000'],
+            'libelleCommuneEtablissement': ['PARIS 1', 'LYON', 'PARIS 1', 'MARSEILLE', 'BORDEAUX'],
+            'enseigne1Etablissement': [None, None, 'Café de la Gare', None, None],
+            'enseigne2Etablissement': [None] * 5,
+            'enseigne3Etablissement': [None] * 5,
+            'denominationUsuelleEtablissement': [None, None, None, 'Boulangerie du Port', None],
+        }).to_csv(self.stock, index=False)
+        pd.DataFrame({
+            'siren': ['111111111', '222222222', '333333333', '444444444', '555555555'],
+            'etatAdministratifUniteLegale': ['A', 'A', 'A', 'C', 'A'],
+            'denominationUniteLegale': ['Société Générale', 'SARL Gare Exploitation', None, 'Fermée SARL',
+                                        'Sans Établissement'],
+            'sigleUniteLegale': ['SG', None, None, None, None],
+            'nomUniteLegale': [None, None, 'MARTIN', None, None],
+        }).to_csv(self.unites, index=False)
+        construire_index(self.stock, self.chemin_index, taille_bloc=2, verbose=False, fichier_unites=self.unites)
+    
+    def tearDown(self):
+        self.dossier.cleanup()
+    
+    def test_correspondance_exacte_et_plein_texte(self):
+        """Nom normalisé exact, puis tous les mots du nom dans le même code postal"""
+        with IndexSirene(self.chemin_index) as index:
+            self.assertEqual(index.rechercher('societe generale', '75001'), '111111111')
+            self.assertEqual(index.rechercher('CAFE DE LA GARE', '75001'), '222222222')
+            self.assertEqual(index.rechercher('Boulangerie Port', '13000'), '333333333')
+            self.assertIsNone(index.rechercher('Boulangerie Port', '75001'))
+            self.assertIsNone(index.rechercher('Fermée SARL', '33000'))
+            self.assertEqual(index.statistiques(), {'hits_exacts': 2, 'hits_plein_texte': 1, 'misses': 2})
+            self.assertEqual(index.rechercher('SG', '69000'), '111111111')
+            self.assertEqual(index.rechercher('SARL Gare Exploitation', '75001'), '222222222')
+            resultat = index.rechercher_details('Boulangerie Port', '13000')
+            self.assertEqual((resultat.siren, resultat.nom, resultat.source), ('333333333', 'BOULANGERIE DU PORT', 'index'))
+            self.assertLess(resultat.score, 1.0)
+    
+    @patch('main.recherche_entreprise')
+    def test_enrichir_sirens_sans_reseau(self, mock_recherche):
+        """Avec un index, enrichir_sirens n'appelle jamais l'API"""
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['Société Générale', 'Café de la Gare', 'Inconnue'],
+            'Code Postal': ['69000', '75001', '75001'],
+            'Num Siren': ['', '', '']
+        })
+        
+        with IndexSirene(self.chemin_index, en_memoire=True) as index:
+            df_enrichi = enrichir_sirens(df_test, verbose=False, workers=2, index=index)
+        
+        mock_recherche.assert_not_called()
+        self.assertEqual(list(df_enrichi['Num Siren']), ['111111111', '222222222', ''])
+    
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, "pyarrow non installé")
+    def test_stock_parquet_par_blocs(self):
+        """Un stock Parquet est lu par lots, sans chargement complet, et donne le même index"""
+        stock_parquet = os.path.join(self.dossier.name, 'StockEtablissement.parquet')
+        pd.read_csv(self.stock, dtype=str).to_parquet(stock_parquet, row_group_size=2)
+        chemin_index = os.path.join(self.dossier.name, 'sirene_parquet.sqlite')
+        
+        with patch('pandas.read_parquet') as lecture_complete:
+            entrees = construire_index(stock_parquet, chemin_index, taille_bloc=2, verbose=False,
+                                       fichier_unites=self.unites)
+        lecture_complete.assert_not_called()
+        
+        reference = construire_index(self.stock, os.path.join(self.dossier.name, 'reference.sqlite'),
+                                     verbose=False, fichier_unites=self.unites)
+        self.assertEqual(entrees, reference)
+        with IndexSirene(chemin_index) as index:
+            self.assertEqual(index.rechercher('CAFE DE LA GARE', '75001'), '222222222')
+    
+    def test_sans_stock_unites_legales(self):
+        """Sans le stock des unités légales, seuls enseignes et noms usuels sont indexés"""
+        chemin_index = os.path.join(self.dossier.name, 'etablissements.sqlite')
+        construire_index(self.stock, chemin_index, verbose=False)
+        with IndexSirene(chemin_index) as index:
+            self.assertEqual(index.rechercher('CAFE DE LA GARE', '75001'), '222222222')
+            self.assertIsNone(index.rechercher('SG', '69000'))
+        
+        with self.assertRaises(ValueError):
+            construire_index(self.stock, chemin_index, verbose=False, fichier_unites=self.stock)
+
+class TestCorrespondance(unittest.TestCase):
+    """Tests du re-classement des candidats par similarité de nom"""
+    
+    def test_score_similarite(self):
+        """Noms identiques à 1, faute de frappe proche, nom différent loin"""
+        self.assertEqual(score_similarite('Boulangerie du Port', 'BOULANGERIE DU PORT'), 1.0)
+        proche = score_similarite('Boulangerie du Port', 'BOULANGERIE DU PROT SARL')
+        eloigne = score_similarite('Boulangerie du Port', 'PHARMACIE DU PORT')
+        self.assertGreater(proche, eloigne)
+        self.assertEqual(score_similarite('Boulangerie', ''), 0.0)
+    
+    def test_meilleur_candidat(self):
+        """Le candidat le plus ressemblant l'emporte, le premier à égalité"""
+        self.assertEqual(meilleur_candidat('Café de la Gare', [['HOTEL DE LA GARE'], ['SARL CAFE DE LA GARE']])[0], 1)
+        self.assertEqual(meilleur_candidat('X', [[], []]), (0, 0.0))
+        self.assertEqual(meilleur_candidat('X', []), (None, 0.0))
+    
+    @patch('main.requests.get')
+    def test_recherche_entreprise_reclasse_les_resultats(self, mock_get):
+        """Le bon candidat est retenu même s'il n'est pas le premier résultat de l'API"""
+        mock_get.return_value.json.return_value = {'results': [
+            {'siren': '111111111', 'nom_complet': 'GARE ROUTIERE'},
+            {'siren': '222222222', 'nom_complet': 'SOCIETE EXPLOITATION', 'siege': {
+                'code_postal': '75001', 'liste_enseignes': ['CAFE DE LA GARE']}},
+        ]}
+        
+        with patch('builtins.print'):
+            resultat = recherche_entreprise('http://api.test', 'Café de la Gare', '75001', details=True)
+            ecarte = recherche_entreprise('http://api.test', 'Pharmacie Centrale', '75001', score_min=0.5)
+        
+        self.assertEqual(resultat.siren, '222222222')
+        self.assertEqual(resultat.score, 1.0)
+        self.assertIsNone(ecarte)
+        self.assertEqual(mock_get.call_count, 2)
+
+class TestResultatsDetailles(unittest.TestCase):
+    """Tests des résultats détaillés et des colonnes supplémentaires"""
+    
+    def setUp(self):
+        self.df_test = pd.DataFrame({
+            'Nom d\'usage': ['Café de la Gare', 'Inconnue'],
+            'Code Postal': ['75001', '75001'],
+            'Num Siren': ['', '']
+        })
+        self.reponse = {'results': [{
+            'siren': '222222222',
+            'nom_complet': 'CAFE DE LA GARE',
+            'activite_principale': '56.30Z',
+            'siege': {'code_postal': '75001', 'adresse': '1 RUE DE LA GARE 75001 PARIS'},
+        }]}
+    
+    @patch('main.requests.Session.get')
+    def test_colonnes_details_en_un_appel(self, mock_get):
+        """Les informations de l'entreprise viennent de la même réponse que le SIREN"""
+        mock_get.return_value.json.side_effect = [self.reponse, {'results': []}]
+        mock_get.return_value.status_code = 200
+        
+        with CacheRecherche(':memory:') as cache:
+            df_enrichi = enrichir_sirens(self.df_test.copy(), verbose=False, cache=cache, details=True)
+            self.assertEqual(mock_get.call_count, 2)
+            self.assertEqual(df_enrichi.loc[0, 'Nom trouvé'], 'CAFE DE LA GARE')
+            self.assertEqual(df_enrichi.loc[0, 'CP siège'], '75001')
+            self.assertEqual(df_enrichi.loc[0, 'Code NAF'], '56.30Z')
+            self.assertEqual(df_enrichi.loc[0, 'Adresse siège'], '1 RUE DE LA GARE 75001 PARIS')
+            self.assertEqual(df_enrichi.loc[0, 'Score correspondance'], 1.0)
+            self.assertEqual(df_enrichi.loc[0, 'Source SIREN'], 'api')
+            self.assertTrue(pd.isna(df_enrichi.loc[1, 'Nom trouvé']))
+            
+            # Relance : détails restitués par le cache, sans appel
+            df_relance = enrichir_sirens(self.df_test.copy(), verbose=False, cache=cache, details=True)
+            self.assertEqual(mock_get.call_count, 2)
+            self.assertEqual(df_relance.loc[0, 'Code NAF'], '56.30Z')
+            self.assertEqual(df_relance.loc[0, 'Source SIREN'], 'cache')
+    
+    @patch('main.recherche_entreprise')
+    def test_sans_details_colonnes_inchangees(self, mock_recherche):
+        """Sans details=True, aucune colonne n'est ajoutée"""
+        mock_recherche.return_value = '123456789'
+        df_enrichi = enrichir_sirens(self.df_test.copy(), verbose=False)
+        self.assertEqual(list(df_enrichi.columns), ['Nom d\'usage', 'Code Postal', 'Num Siren'])
+    
+    def test_journal_ancien_format(self):
+        """Un journal contenant seulement des SIRENs reste relisible"""
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'reprise.jsonl')
+            with open(chemin, 'w', encoding='utf-8') as f:
+                f.write('{"cle": "A|75001", "siren": "111111111"}\n')
+            with JournalReprise(chemin, resume=True) as journal:
+                self.assertEqual(journal.lire('A', '75001'), '111111111')
+                journal.ecrire('B', '75001', ResultatRecherche('222222222', 'api', 0.9, nom='B').en_dict())
+            with JournalReprise(chemin, resume=True) as journal:
+                self.assertEqual(ResultatRecherche.depuis_memoire(journal.lire('B', '75001'), 'journal'),
+                                 ResultatRecherche('222222222', 'journal', 0.9, nom='B'))
+
+class TestMetriques(unittest.TestCase):
+    """Tests des métriques d'enrichissement"""
+    
+    @patch('main.sleep')
+    def test_client_alimente_les_metriques(self, mock_sleep):
+        """Statut, latence et nouvelle tentative de chaque requête sont comptés"""
+        metriques = MetriquesEnrichissement()
+        client = ClientAPI(metriques=metriques)
+        reponses = [TestReessais._reponse(429, headers={'Retry-After': '2'}),
+                    TestReessais._reponse(200, [{'siren': '123456789'}])]
+        
+        with patch.object(client.session, 'get', side_effect=reponses):
+            recherche_entreprise('http://api.test', 'Test', '75001', client=client)
+        
+        resume = metriques.resume()
+        self.assertEqual(resume['requetes'], 2)
+        self.assertEqual(resume['requetes_par_statut'], {'429': 1, '200': 1})
+        self.assertEqual(resume['reponses_429'], 1)
+        self.assertEqual(resume['reessais'], 1)
+        self.assertEqual(resume['attente_reessais_s'], 2.0)
+        self.assertIsNotNone(resume['latence_p95_ms'])
+    
+    @patch('main.requests.Session.get')
+    def test_resume_joint_au_dataframe(self, mock_get):
+        """Le résumé accompagne le DataFrame ; les hits du cache sont comptés"""
+        mock_get.return_value = TestReessais._reponse(200, [{'siren': '123456789'}])
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'A'],
+            'Code Postal': ['75001', '75001', '75001'],
+            'Num Siren': ['', '', '']
+        })
+        metriques = MetriquesEnrichissement()
+        
+        with CacheRecherche(':memory:') as cache:
+            cache.ecrire('B', '75001', None, _espace_api(BASE_URL, 0.0))
+            df_enrichi = enrichir_sirens(df_test, verbose=False, cache=cache, metriques=metriques)
+        
+        resume = df_enrichi.attrs['metriques']
+        self.assertEqual(resume['requetes'], 1)
+        self.assertEqual(resume['taux_hit'], {'cache': 0.5})
+        self.assertEqual(resume['lignes'], {'traitees': 3, 'a_enrichir': 3, 'trouvees': 2, 'echecs': 0, 'hors_delai': 0})
+        
+        texte = metriques.format_prometheus()
+        self.assertIn('siren_requetes_total{statut="200"} 1', texte)
+        self.assertIn('siren_requete_duree_secondes_bucket{le="+Inf"} 1', texte)
+        self.assertIn('siren_lectures_memoire_total{source="cache",resultat="hit"} 1', texte)
+    
+    def test_export_prometheus(self):
+        """Fichier pour le collecteur textfile et point d'accès HTTP /metrics"""
+        metriques = MetriquesEnrichissement()
+        metriques.observer_requete(0.2, 200)
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'siren.prom')
+            metriques.ecrire_prometheus(chemin)
+            with open(chemin, encoding='utf-8') as f:
+                self.assertEqual(f.read(), metriques.format_prometheus())
+        
+        serveur = servir_prometheus(metriques, port=0, adresse='127.0.0.1')
+        try:
+            reponse = requests.get(f'http://127.0.0.1:{serveur.server_port}/metrics', timeout=5)
+        finally:
+            serveur.shutdown()
+            serveur.server_close()
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('siren_requete_duree_secondes_count 1', reponse.text)
+
+class TestBenchmark(unittest.TestCase):
+    """Tests du banc de performance et de son serveur API factice"""
+    
+    def test_serveur_factice(self):
+        """Réponses déterministes au format de l'API, 429 à la demande"""
+        with ServeurAPIFactice(latence=0, taux_sans_resultat=0) as serveur:
+            siren = recherche_entreprise(serveur.url, 'Entreprise Test 1', '75001')
+            self.assertEqual(recherche_entreprise(serveur.url, 'Entreprise Test 1', '75001'), siren)
+            self.assertEqual(len(siren), 9)
+        with ServeurAPIFactice(latence=0, taux_429=1.0) as serveur:
+            reponse = requests.get(f'{serveur.url}/search?q=A&code_postal=75001', timeout=5)
+            self.assertEqual(reponse.status_code, 429)
+            self.assertEqual(serveur.reponses_429, 1)
+    
+    def test_mesures_par_mode(self):
+        """Une mesure par (taille, mode) ; le mode cache ne rappelle pas l'API"""
+        mesures = executer_benchmark(tailles=(30,), latence=0, taux_429=0.1, workers=4)
+        
+        self.assertEqual([mesure['mode'] for mesure in mesures], list(MODES))
+        for mesure in mesures:
+            self.assertEqual(mesure['lignes'], 30)
+            self.assertGreater(mesure['lignes_par_seconde'], 0)
+            json.dumps(mesure)
+        par_mode = {mesure['mode']: mesure for mesure in mesures}
+        self.assertEqual(par_mode['cache']['requetes'], 0)
+        self.assertGreater(par_mode['sequentiel']['requetes'], 0)
+        self.assertEqual(par_mode['sequentiel']['reessais'], par_mode['sequentiel']['reponses_429'])
+
+class TestTraitementLot(unittest.TestCase):
+    """Tests du traitement par lots en ligne de commande"""
+    
+    def setUp(self):
+        self.dossier = tempfile.TemporaryDirectory()
+        self.fichiers = []
+        for numero in range(3):
+            chemin = os.path.join(self.dossier.name, f'region{numero}.csv')
+            generer_donnees(20, graine=numero).to_csv(chemin, sep=';', index=False, encoding='utf-8-sig')
+            self.fichiers.append(chemin)
+    
+    def tearDown(self):
+        self.dossier.cleanup()
+    
+    def test_lister_fichiers(self):
+        """Dossiers et motifs glob développés, sorties précédentes et doublons exclus"""
+        open(os.path.join(self.dossier.name, 'region0_avec_sirens.csv'), 'w').close()
+        open(os.path.join(self.dossier.name, 'notes.txt'), 'w').close()
+        
+        fichiers = traitement_lot.lister_fichiers([self.dossier.name, os.path.join(self.dossier.name, '*.csv')])
+        self.assertEqual(fichiers, [os.path.abspath(chemin) for chemin in self.fichiers])
+        self.assertEqual(traitement_lot.chemin_sortie('/a/b.csv', format_sortie='parquet'), '/a/b_avec_sirens.parquet')
+    
+    def test_traitement_parallele(self):
+        """Fichiers enrichis en parallèle, cache partagé, code de sortie non nul sur erreur"""
+        with open(os.path.join(self.dossier.name, 'invalide.csv'), 'w') as f:
+            f.write('a;b\n1;2\n')
+        cache = os.path.join(self.dossier.name, 'cache.sqlite')
+        with ServeurAPIFactice(latence=0, taux_sans_resultat=0) as serveur:
+            options = ['--processus', '2', '--debit', '1000', '--cache', cache, '--api-base', serveur.url]
+            with patch('builtins.print'):
+                code = traitement_lot.main([self.dossier.name] + options)
+            self.assertEqual(code, traitement_lot.ECHEC_FICHIER)
+            requetes = serveur.requetes
+            self.assertGreater(requetes, 0)
+            
+            for chemin in self.fichiers:
+                sortie = pd.read_csv(traitement_lot.chemin_sortie(chemin), sep=';', encoding='utf-8-sig', dtype=str)
+                self.assertEqual(len(sortie), 20)
+                self.assertTrue(sortie['Num Siren'].notna().all())
+            self.assertFalse(os.path.exists(os.path.join(self.dossier.name, 'invalide_avec_sirens.csv')))
+            
+            # Second passage : sorties existantes ignorées, puis refaites depuis le cache
+            bilans = traitement_lot.traiter_fichiers(self.fichiers, cache=cache, api_base=serveur.url)
+            self.assertEqual({bilan['statut'] for bilan in bilans}, {'ignore'})
+            bilans = traitement_lot.traiter_fichiers(self.fichiers, cache=cache, api_base=serveur.url, ecraser=True)
+            self.assertEqual(traitement_lot.resumer(bilans)['ok'], 3)
+            self.assertEqual(serveur.requetes, requetes)
+        
+        with patch('builtins.print'):
+            self.assertEqual(traitement_lot.main([os.path.join(self.dossier.name, '*.xml')]),
+                             traitement_lot.AUCUN_FICHIER)
+    
+    def test_fichier_incomplet_repris(self):
+        """Des recherches en échec rendent le fichier incomplet : code non nul, repris au passage suivant"""
+        fichier = self.fichiers[0]
+        sortie = traitement_lot.chemin_sortie(fichier)
+        with ServeurAPIFactice(latence=0, taux_429=1.0) as serveur:
+            with patch('builtins.print'):
+                code = traitement_lot.main([fichier, '--debit', '1000', '--api-base', serveur.url])
+        self.assertEqual(code, traitement_lot.FICHIER_INCOMPLET)
+        self.assertTrue(os.path.exists(traitement_lot.chemin_marqueur(sortie)))
+        
+        with ServeurAPIFactice(latence=0, taux_sans_resultat=0) as serveur:
+            bilans = traitement_lot.traiter_fichiers([fichier], requetes_par_seconde=1000, api_base=serveur.url)
+            self.assertEqual(bilans[0]['statut'], 'ok')
+            self.assertFalse(os.path.exists(traitement_lot.chemin_marqueur(sortie)))
+            self.assertTrue(pd.read_csv(sortie, sep=';', encoding='utf-8-sig', dtype=str)['Num Siren'].notna().all())
+            bilans = traitement_lot.traiter_fichiers([fichier], api_base=serveur.url)
+        self.assertEqual(bilans[0]['statut'], 'ignore')
+
+class TestJournalisation(unittest.TestCase):
+    """Tests de la journalisation des recherches"""
+    
+    def setUp(self):
+        self.reponse = MagicMock()
+        self.reponse.json.return_value = {'results': [{'siren': '123456789', 'nom_complet': 'TEST'}]}
+    
+    def tearDown(self):
+        configurer_journalisation()
+    
+    @patch('main.requests.get')
+    def test_aucune_sortie_par_defaut(self, mock_get):
+        """Sans niveau DEBUG, une recherche réussie n'écrit rien"""
+        mock_get.return_value = self.reponse
+        configurer_journalisation('WARNING', console=False)
+        with patch('builtins.print') as mock_print, \
+                patch.object(logging.getLogger('siren.recherche'), 'handle') as mock_handle:
+            self.assertEqual(recherche_entreprise('http://api.test', 'Test', '75001'), '123456789')
+        mock_print.assert_not_called()
+        mock_handle.assert_not_called()
+    
+    @patch('main.requests.get')
+    def test_sortie_json_lines(self, mock_get):
+        """Au niveau DEBUG, chaque message est une ligne JSON avec ses champs"""
+        mock_get.return_value = self.reponse
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'recherches.jsonl')
+            configurer_journalisation('DEBUG', fichier_json=chemin, console=False)
+            recherche_entreprise('http://api.test', 'Test', '75001')
+            configurer_journalisation()
+            
+            with open(chemin, encoding='utf-8') as f:
+                entrees = [json.loads(ligne) for ligne in f]
+        match = [e for e in entrees if e.get('siren')]
+        self.assertEqual(len(match), 1)
+        self.assertEqual(match[0]['niveau'], 'DEBUG')
+        self.assertEqual(match[0]['logger'], 'siren.recherche')
+        self.assertEqual(match[0]['terme'], 'Test')
+
+class BackendFactice(BackendBase):
+    """Backend de test : dictionnaire nom → SIREN, noms en échec"""
+    
+    def __init__(self, sirens, source, echecs=()):
+        self.sirens = sirens
+        self.source = source
+        self.echecs = set(echecs)
+        self.appels = []
+    
+    def rechercher(self, nom, code_postal):
+        self.appels.append(nom)
+        if nom in self.echecs:
+            raise requests.ConnectionError("indisponible")
+        siren = self.sirens.get(nom)
+        return ResultatRecherche(siren, self.source) if siren else None
+
+class TestBackends(unittest.TestCase):
+    """Tests des backends de recherche interchangeables"""
+    
+    def test_cascade_premier_resultat(self):
+        """La cascade s'arrête au premier backend qui trouve"""
+        local = BackendFactice({'A': '111111111'}, 'index')
+        distant = BackendFactice({'A': '999999999', 'B': '222222222'}, 'api')
+        cascade = BackendCascade([local, distant])
+        
+        self.assertEqual(cascade.rechercher('A', '75001'), ResultatRecherche('111111111', 'index'))
+        self.assertEqual(cascade.rechercher('B', '75001'), ResultatRecherche('222222222', 'api'))
+        self.assertIsNone(cascade.rechercher('C', '75001'))
+        self.assertEqual(distant.appels, ['B', 'C'])
+    
+    def test_cascade_echec_sans_resultat(self):
+        """Un échec est relevé si aucun autre backend n'a trouvé"""
+        cascade = BackendCascade([BackendFactice({}, 'api', echecs={'A', 'B'}),
+                                  BackendFactice({'B': '222222222'}, 'index')])
+        
+        resultats = cascade.rechercher_lot([('A', '75001'), ('B', '75001')])
+        self.assertIsInstance(resultats[0], requests.ConnectionError)
+        self.assertEqual(resultats[1], ResultatRecherche('222222222', 'index'))
+    
+    def test_cache_devant_backend(self):
+        """Le cache répond aux recherches connues et mémorise les nouvelles, pas les échecs"""
+        interne = BackendFactice({'A': '111111111'}, 'api', echecs={'C'})
+        with CacheRecherche(':memory:') as cache:
+            backend = BackendCache(cache, interne)
+            resultats = backend.rechercher_lot([('A', '75001'), ('B', '75001'), ('C', '75001')])
+            self.assertEqual(resultats[:2], [ResultatRecherche('111111111', 'api'), None])
+            self.assertIsInstance(resultats[2], requests.ConnectionError)
+            
+            self.assertEqual(backend.rechercher('A', '75001'), ResultatRecherche('111111111', 'cache'))
+            self.assertIsNone(backend.rechercher('B', '75001'))
+            self.assertIs(cache.lire('C', '75001'), ABSENT)
+            self.assertEqual(interne.appels, ['A', 'B', 'C'])
+    
+    @patch('main.recherche_entreprise')
+    def test_enrichir_sirens_backend_personnalise(self, mock_recherche):
+        """Un backend fourni remplace l'API ; ses échecs restent à relancer"""
+        df_test = pd.DataFrame({
+            'Nom d\'usage': ['A', 'B', 'C'],
+            'Code Postal': ['75001', '75001', '75001'],
+            'Num Siren': ['', '', '']
+        })
+        backend = BackendFactice({'A': '111111111'}, 'test', echecs={'C'})
+        
+        df_enrichi = enrichir_sirens(df_test, verbose=False, workers=2, backend=backend)
+        
+        mock_recherche.assert_not_called()
+        self.assertEqual(list(df_enrichi['Num Siren']), ['111111111', '', ''])
+        self.assertEqual(sorted(backend.appels), ['A', 'B', 'C'])
+
 class TestIntegration(unittest.TestCase):
     """Tests d'intégration"""
     
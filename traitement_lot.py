@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Enrichissement par lots de nombreux fichiers, sans interface.
+
+Les fichiers (chemins, motifs glob ou dossiers) sont répartis entre les
+processus d'un pool ; tous consomment un seul budget d'appels API
+(`LimiteurInterProcessus`) et partagent le même cache SQLite. Chaque
+fichier est enrichi par blocs (`enrichir_csv_par_blocs`) et le résultat
+écrit à côté de l'original. Le code de sortie est non nul si un fichier
+a échoué ou reste incomplet (recherches en échec), pour les tâches
+planifiées (cron) ; un fichier incomplet est repris au passage suivant.
+
+    python traitement_lot.py exports/regions/ "archives/**/*.csv" --processus 4 --cache cache_sirens.sqlite
+"""
+
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, Optional
+
+from cache_recherche import CacheRecherche
+from format_colonnaire import EXTENSIONS_ARROW, EXTENSIONS_PARQUET
+from limiteur import DEBIT_MAX_API, LimiteurDebit, LimiteurInterProcessus
+from main import BASE_URL, BackendAPI, ClientAPI, enrichir_csv_par_blocs
+from metriques import MetriquesEnrichissement
+
+# Extensions des fichiers recherchés dans les dossiers
+EXTENSIONS_ENTREE = (".csv",) + EXTENSIONS_PARQUET + EXTENSIONS_ARROW
+
+SUFFIXE_SORTIE = "_avec_sirens"
+
+# Suffixe du marqueur posé à côté d'une sortie dont des recherches ont échoué
+SUFFIXE_INCOMPLET = ".incomplet"
+
+# Codes de sortie
+SUCCES = 0
+ECHEC_FICHIER = 1
+AUCUN_FICHIER = 2
+FICHIER_INCOMPLET = 3
+
+# État propre à chaque processus du pool, posé par `_initialiser_processus`
+_processus: Dict = {}
+
+def lister_fichiers(entrees: Iterable[str], suffixe: str = SUFFIXE_SORTIE) -> List[str]:
+    """
+    Fichiers à enrichir désignés par des chemins, motifs glob ou dossiers
+    (fichiers CSV, Parquet et Arrow du dossier, sans récursion)
+
+    Les fichiers déjà produits par un traitement (nom terminé par `suffixe`)
+    sont ignorés ; chaque fichier n'apparaît qu'une fois, dans l'ordre.
+    """
+    fichiers = []
+    for entree in entrees:
+        if os.path.isdir(entree):
+            candidats = sorted(os.path.join(entree, nom) for nom in os.listdir(entree))
+        elif any(caractere in entree for caractere in "*?["):
+            candidats = sorted(glob.glob(entree, recursive=True))
+        else:
+            candidats = [entree]
+        for chemin in candidats:
+            racine, extension = os.path.splitext(chemin)
+            if (os.path.isfile(chemin) and extension.lower() in EXTENSIONS_ENTREE
+                    and not racine.endswith(suffixe)):
+                fichiers.append(os.path.abspath(chemin))
+    return list(dict.fromkeys(fichiers))
+
+def chemin_sortie(fichier: str, suffixe: str = SUFFIXE_SORTIE, format_sortie: Optional[str] = None) -> str:
+    """
+    Fichier enrichi écrit à côté de l'original : `nom<suffixe>.<ext>`, au
+    format d'entrée si `format_sortie` (extension sans point) est absent
+    """
+    racine, extension = os.path.splitext(fichier)
+    return f"{racine}{suffixe}.{format_sortie}" if format_sortie else f"{racine}{suffixe}{extension}"
+
+def chemin_marqueur(sortie: str) -> str:
+    """
+    Marqueur d'une sortie incomplète : tant qu'il existe, la sortie n'est pas
+    considérée comme produite et le fichier est enrichi de nouveau
+    """
+    return sortie + SUFFIXE_INCOMPLET
+
+def _initialiser_processus(limiteur: LimiteurDebit, chemin_cache: Optional[str], api_base: str,
+                           workers: int, score_min: float, relance_quantile: Optional[float] = None):
+    """Client HTTP et cache ouverts une fois par processus, réutilisés pour tous ses fichiers"""
+    client = ClientAPI(taille_pool=max(10, workers), limiteur=limiteur, relance_quantile=relance_quantile)
+    _processus["backend"] = BackendAPI(client, api_base=api_base, score_min=score_min)
+    _processus["cache"] = CacheRecherche(chemin_cache) if chemin_cache else None
+
+def enrichir_fichier(fichier: str, sortie: str, taille_bloc: int = 50_000, workers: int = 1,
+                     details: bool = False) -> dict:
+    """
+    Enrichit un fichier dans un processus du pool
+
+    Une sortie dont des recherches ont échoué (ou n'ont pu être faites à
+    temps) est écrite, mais marquée incomplète (`chemin_marqueur`).
+
+    Returns:
+        Bilan du fichier : fichier, sortie, statut ("ok", "incomplet" ou
+        "erreur"), lignes, trouvees, echecs, hors_delai, requetes, duree_s
+        et erreur
+    """
+    metriques = MetriquesEnrichissement()
+    bilan = {"fichier": fichier, "sortie": sortie, "statut": "ok", "erreur": None}
+    debut = monotonic()
+    try:
+        bilan["sortie"] = enrichir_csv_par_blocs(
+            fichier, sortie, taille_bloc=taille_bloc, verbose=False, workers=workers,
+            backend=_processus["backend"], cache=_processus["cache"], details=details, metriques=metriques,
+        )
+    except Exception as e:
+        bilan["statut"] = "erreur"
+        bilan["erreur"] = f"{type(e).__name__}: {e}"
+        # Pas de sortie partielle : elle serait ignorée au prochain passage
+        partielles = {sortie}
+        if sortie.lower().endswith(".xlsx"):
+            partielles.add(os.path.splitext(sortie)[0] + ".csv")
+        partielles.add(chemin_marqueur(sortie))
+        for partielle in partielles:
+            if os.path.exists(partielle):
+                os.remove(partielle)
+    resume = metriques.resume()
+    bilan.update(lignes=resume["lignes"]["traitees"], trouvees=resume["lignes"]["trouvees"],
+                 echecs=resume["lignes"]["echecs"], hors_delai=resume["lignes"]["hors_delai"],
+                 requetes=resume["requetes"], duree_s=round(monotonic() - debut, 3))
+    if bilan["statut"] == "ok":
+        if bilan["echecs"] or bilan["hors_delai"]:
+            bilan["statut"] = "incomplet"
+            with open(chemin_marqueur(sortie), "w", encoding="utf-8") as f:
+                f.write(f"{bilan['echecs']} recherche(s) en échec, {bilan['hors_delai']} hors délai\n")
+        elif os.path.exists(chemin_marqueur(sortie)):
+            os.remove(chemin_marqueur(sortie))
+    return bilan
+
+def traiter_fichiers(fichiers: List[str], processus: int = 2, workers: int = 1,
+                     requetes_par_seconde: float = DEBIT_MAX_API, cache: Optional[str] = None,
+                     suffixe: str = SUFFIXE_SORTIE, format_sortie: Optional[str] = None,
+                     ecraser: bool = False, taille_bloc: int = 50_000, score_min: float = 0.0,
+                     details: bool = False, api_base: str = BASE_URL,
+                     relance_quantile: Optional[float] = None,
+                     rapporter: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    Enrichit des fichiers en parallèle, dans `processus` processus
+
+    Args:
+        fichiers: Fichiers à enrichir (voir `lister_fichiers`)
+        processus: Nombre de fichiers traités simultanément
+        workers: Recherches simultanées dans chaque processus
+        requetes_par_seconde: Budget d'appels API commun à tous les processus
+        cache: Fichier du cache SQLite partagé (aucun cache si None)
+        suffixe, format_sortie: Nom des fichiers produits (voir `chemin_sortie`)
+        ecraser: Refaire les fichiers dont la sortie existe déjà (ignorés sinon,
+            sauf si elle est marquée incomplète)
+        taille_bloc: Lignes lues et enrichies à la fois dans chaque fichier
+        score_min, details: Voir `enrichir_sirens`
+        api_base: URL de l'API (serveur de test, proxy...)
+        relance_quantile: Doubler les requêtes plus lentes que ce quantile
+            des latences récentes (voir `ClientAPI`)
+        rapporter: Appelée avec le bilan de chaque fichier dès qu'il est prêt
+
+    Returns:
+        Bilans des fichiers, dans l'ordre de `fichiers` ; statut "ignore"
+        pour une sortie déjà présente
+    """
+    if processus < 1:
+        raise ValueError("processus doit être supérieur ou égal à 1")
+    bilans = {}
+    a_traiter = []
+    for fichier in fichiers:
+        sortie = chemin_sortie(fichier, suffixe, format_sortie)
+        if os.path.exists(sortie) and not os.path.exists(chemin_marqueur(sortie)) and not ecraser:
+            bilans[fichier] = {"fichier": fichier, "sortie": sortie, "statut": "ignore", "erreur": None}
+            if rapporter is not None:
+                rapporter(bilans[fichier])
+        else:
+            a_traiter.append((fichier, sortie))
+
+    if a_traiter:
+        limiteur = LimiteurInterProcessus(requetes_par_seconde)
+        with ProcessPoolExecutor(max_workers=min(processus, len(a_traiter)), initializer=_initialiser_processus,
+                                 initargs=(limiteur, cache, api_base, workers, score_min, relance_quantile)) as pool:
+            futures = {pool.submit(enrichir_fichier, fichier, sortie, taille_bloc, workers, details): fichier
+                       for fichier, sortie in a_traiter}
+            for future in as_completed(futures):
+                try:
+                    bilan = future.result()
+                except Exception as e:
+                    # Processus du pool interrompu (mémoire, signal...)
+                    fichier = futures[future]
+                    bilan = {"fichier": fichier, "sortie": chemin_sortie(fichier, suffixe, format_sortie),
+                             "statut": "erreur", "erreur": f"{type(e).__name__}: {e}"}
+                bilans[futures[future]] = bilan
+                if rapporter is not None:
+                    rapporter(bilan)
+    return [bilans[fichier] for fichier in fichiers]
+
+def resumer(bilans: List[dict]) -> dict:
+    """Totaux d'un traitement par lots"""
+    traites = [bilan for bilan in bilans if bilan["statut"] != "ignore"]
+    return {
+        "fichiers": len(bilans),
+        "ok": sum(bilan["statut"] == "ok" for bilan in bilans),
+        "erreurs": sum(bilan["statut"] == "erreur" for bilan in bilans),
+        "incomplets": sum(bilan["statut"] == "incomplet" for bilan in bilans),
+        "ignores": len(bilans) - len(traites),
+        "lignes": sum(bilan.get("lignes", 0) for bilan in traites),
+        "trouvees": sum(bilan.get("trouvees", 0) for bilan in traites),
+        "echecs": sum(bilan.get("echecs", 0) for bilan in traites),
+        "requetes": sum(bilan.get("requetes", 0) for bilan in traites),
+    }
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Enrichissement SIREN de nombreux fichiers en parallèle")
+    parser.add_argument("entrees", nargs="+", help="Fichiers, motifs glob (\"dossier/**/*.csv\") ou dossiers")
+    parser.add_argument("--processus", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Fichiers traités simultanément")
+    parser.add_argument("--workers", type=int, default=1, help="Recherches simultanées par processus")
+    parser.add_argument("--debit", type=float, default=DEBIT_MAX_API,
+                        help="Budget d'appels API par seconde, commun à tous les processus")
+    parser.add_argument("--cache", help="Cache SQLite partagé des recherches (ex. cache_sirens.sqlite)")
+    parser.add_argument("--suffixe", default=SUFFIXE_SORTIE, help="Suffixe des fichiers produits")
+    parser.add_argument("--format", dest="format_sortie", choices=["csv", "xlsx", "parquet", "arrow"],
+                        help="Format des fichiers produits (celui de l'entrée par défaut)")
+    parser.add_argument("--ecraser", action="store_true", help="Refaire les fichiers déjà enrichis")
+    parser.add_argument("--taille-bloc", type=int, default=50_000, help="Lignes enrichies à la fois")
+    parser.add_argument("--score-min", type=float, default=0.0, help="Score de correspondance minimal (0 à 1)")
+    parser.add_argument("--details", action="store_true", help="Ajouter les colonnes de détail")
+    parser.add_argument("--api-base", default=BASE_URL, help="URL de l'API de recherche")
+    parser.add_argument("--relance", type=float, metavar="QUANTILE",
+                        help="Doubler les requêtes plus lentes que ce quantile des latences (ex. 0.95)")
+    args = parser.parse_args(arguments)
+
+    fichiers = lister_fichiers(args.entrees, args.suffixe)
+    if not fichiers:
+        print("Aucun fichier à enrichir", file=sys.stderr)
+        return AUCUN_FICHIER
+
+    def rapporter(bilan):
+        nom = os.path.basename(bilan["fichier"])
+        if bilan["statut"] == "ignore":
+            print(f"IGNORÉ  {nom} (sortie existante : {bilan['sortie']})")
+        elif bilan["statut"] == "erreur":
+            print(f"ERREUR  {nom} : {bilan['erreur']}", file=sys.stderr)
+        elif bilan["statut"] == "incomplet":
+            print(f"INCOMPLET {nom} : {bilan['trouvees']}/{bilan['lignes']} SIREN(s) trouvé(s), "
+                  f"{bilan['echecs']} échec(s), {bilan['hors_delai']} hors délai, repris au prochain "
+                  f"passage → {bilan['sortie']}", file=sys.stderr)
+        else:
+            print(f"OK      {nom} : {bilan['trouvees']}/{bilan['lignes']} SIREN(s) trouvé(s), "
+                  f"{bilan['echecs']} échec(s), {bilan['duree_s']:.1f} s → {bilan['sortie']}")
+
+    debut = monotonic()
+    bilans = traiter_fichiers(
+        fichiers, processus=args.processus, workers=args.workers, requetes_par_seconde=args.debit,
+        cache=args.cache, suffixe=args.suffixe, format_sortie=args.format_sortie, ecraser=args.ecraser,
+        taille_bloc=args.taille_bloc, score_min=args.score_min, details=args.details,
+        api_base=args.api_base, relance_quantile=args.relance, rapporter=rapporter,
+    )
+    total = resumer(bilans)
+    print(f"\n{total['fichiers']} fichier(s) : {total['ok']} enrichi(s), {total['incomplets']} incomplet(s), "
+          f"{total['erreurs']} en erreur, {total['ignores']} ignoré(s) | {total['lignes']} lignes, {total['trouvees']} SIREN(s) trouvé(s), "
+          f"{total['echecs']} recherche(s) en échec, {total['requetes']} requête(s) API "
+          f"en {monotonic() - debut:.1f} s")
+    if total["erreurs"]:
+        return ECHEC_FICHIER
+    return FICHIER_INCOMPLET if total["incomplets"] else SUCCES
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Enrichissements exécutés en arrière-plan, suivis via un registre de travaux.
+
+Dans Streamlit, un enrichissement lancé dans l'exécution du script bloque
+celle-ci et meurt à la moindre interaction (le script est ré-exécuté). Ici
+l'enrichissement est soumis à un registre propre au processus, qui
+l'exécute dans un thread ; l'interface ne conserve que l'identifiant du
+travail et interroge régulièrement sa progression (lignes traitées, temps
+restant estimé, résultats partiels), d'une réexécution à l'autre.
+
+    registre = registre_partage()
+    identifiant = registre.soumettre(df, limiteur=limiteur_partage())
+    travail = registre.obtenir(identifiant)
+    travail.etat_courant()          # progression, ETA...
+    travail.resultat_partiel()      # lignes déjà enrichies
+    travail.resultat_complet()      # toutes les lignes, enrichies ou non
+"""
+
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from cache_recherche import CacheRecherche
+from journalisation import obtenir_logger
+from limiteur import DEBIT_MAX_API, LimiteurDebit
+from main import COLONNE_STATUT, ClientAPI, enrichir_sirens, valider_dataframe
+from metriques import MetriquesEnrichissement
+
+logger = obtenir_logger("travaux")
+
+# États d'un travail
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ECHEC = "echec"
+ANNULE = "annule"
+ETATS_FINAUX = (TERMINE, ECHEC, ANNULE)
+
+# Statut des lignes d'un travail annulé que l'enrichissement n'a pas atteintes
+STATUT_NON_TRAITE = "non traité"
+
+class TravailAnnule(Exception):
+    """Levée dans le thread du travail pour interrompre l'enrichissement"""
+
+class TravailEnrichissement:
+    """
+    Un enrichissement en arrière-plan : le DataFrame est traité par blocs de
+    `taille_bloc` lignes, chaque bloc enrichi devenant aussitôt disponible
+    dans `resultat_partiel()`
+
+    Les blocs partagent un cache en mémoire (sauf si `cache=` est fourni) :
+    une entreprise présente dans plusieurs blocs n'est recherchée qu'une fois.
+    Ils partagent aussi un client HTTP (sauf si `client=`, `index=` ou
+    `backend=` est fourni), fermé à la fin du travail.
+    """
+
+    def __init__(self, df: pd.DataFrame, taille_bloc: int = 1000, **options):
+        """
+        Args:
+            df: Données à enrichir (copiées et validées dès la soumission)
+            taille_bloc: Nombre de lignes enrichies avant publication du bloc
+            **options: Options transmises à `enrichir_sirens` (limiteur,
+                workers, cache, index, score_min, details, metriques,
+                verbose pour le détail dans la console, désactivé par défaut...)
+        """
+        if taille_bloc < 1:
+            raise ValueError("taille_bloc doit être supérieur ou égal à 1")
+        self.identifiant = uuid.uuid4().hex
+        self.df = valider_dataframe(df.copy())
+        self.taille_bloc = taille_bloc
+        # Métriques cumulées sur tous les blocs
+        self.metriques = options.setdefault("metriques", MetriquesEnrichissement())
+        options.setdefault("verbose", False)
+        self.options = options
+        self.etat = EN_ATTENTE
+        self.erreur: Optional[BaseException] = None
+        self.resultat: Optional[pd.DataFrame] = None
+        self.lignes_total = len(df)
+        self.lignes_traitees = 0
+        self.debut: Optional[float] = None
+        self.fin: Optional[float] = None
+        self._blocs: List[pd.DataFrame] = []
+        self._progression_bloc = 0.0
+        self._annulation = threading.Event()
+        self._verrou = threading.Lock()
+
+    def _progression(self, terminees: int, total: int):
+        """Progression des recherches dans le bloc courant"""
+        if self._annulation.is_set():
+            raise TravailAnnule()
+        with self._verrou:
+            self._progression_bloc = terminees / total if total else 1.0
+
+    def executer(self):
+        """Exécute le travail dans le thread courant (appelé par le registre)"""
+        with self._verrou:
+            if self.etat != EN_ATTENTE:
+                return
+            self.etat = EN_COURS
+            self.debut = monotonic()
+        options = dict(self.options, progression=self._progression)
+        cache_local = None
+        if options.get("cache") is None:
+            cache_local = options["cache"] = CacheRecherche(":memory:")
+        client_local = all(options.get(option) is None for option in ("client", "index", "backend"))
+        if client_local:
+            limiteur = options.pop("limiteur", None) or LimiteurDebit(options.pop("requetes_par_seconde", DEBIT_MAX_API))
+            options["client"] = ClientAPI(taille_pool=max(10, options.get("workers", 1)), limiteur=limiteur)
+        try:
+            for debut in range(0, len(self.df), self.taille_bloc):
+                if self._annulation.is_set():
+                    raise TravailAnnule()
+                bloc = enrichir_sirens(self.df.iloc[debut:debut + self.taille_bloc], **options)
+                with self._verrou:
+                    self._blocs.append(bloc)
+                    self.lignes_traitees += len(bloc)
+                    self._progression_bloc = 0.0
+            resultat = pd.concat(self._blocs)
+            resultat.attrs["metriques"] = self.metriques.resume()
+            with self._verrou:
+                self.resultat = resultat
+                self.etat = TERMINE
+        except TravailAnnule:
+            with self._verrou:
+                self.etat = ANNULE
+        except Exception as e:
+            logger.warning("Travail %s en échec : %s", self.identifiant, e, exc_info=True)
+            with self._verrou:
+                self.erreur = e
+                self.etat = ECHEC
+        finally:
+            self.fin = monotonic()
+            if cache_local is not None:
+                cache_local.fermer()
+            if client_local:
+                options["client"].fermer()
+
+    def annuler(self):
+        """Demande l'arrêt du travail : les blocs déjà enrichis restent disponibles"""
+        self._annulation.set()
+        with self._verrou:
+            if self.etat == EN_ATTENTE:
+                self.etat = ANNULE
+                self.fin = monotonic()
+
+    @property
+    def fini(self) -> bool:
+        return self.etat in ETATS_FINAUX
+
+    def etat_courant(self) -> dict:
+        """
+        Instantané de la progression
+
+        Returns:
+            Dictionnaire : etat, lignes_traitees (lignes des blocs terminés
+            plus la part déjà recherchée du bloc courant), lignes_total,
+            fraction (0 à 1), duree_s, eta_s (None tant qu'inconnu) et erreur
+        """
+        with self._verrou:
+            lignes = self.lignes_traitees
+            if self.etat == EN_COURS:
+                bloc_courant = min(self.taille_bloc, self.lignes_total - lignes)
+                lignes += int(bloc_courant * self._progression_bloc)
+            elif self.etat == TERMINE:
+                lignes = self.lignes_total
+            fraction = lignes / self.lignes_total if self.lignes_total else float(self.etat == TERMINE)
+            duree = ((self.fin or monotonic()) - self.debut) if self.debut is not None else 0.0
+            eta = None
+            if self.etat == EN_COURS and 0 < fraction:
+                eta = duree * (1 - fraction) / fraction
+            return {
+                "etat": self.etat,
+                "lignes_traitees": lignes,
+                "lignes_total": self.lignes_total,
+                "fraction": fraction,
+                "duree_s": duree,
+                "eta_s": eta,
+                "erreur": str(self.erreur) if self.erreur is not None else None,
+            }
+
+    def resultat_partiel(self) -> pd.DataFrame:
+        """Lignes des blocs déjà enrichis (DataFrame vide aux colonnes d'origine si aucun)"""
+        with self._verrou:
+            if self.resultat is not None:
+                return self.resultat
+            blocs = list(self._blocs)
+        return pd.concat(blocs) if blocs else self.df.iloc[0:0]
+
+    def resultat_complet(self) -> pd.DataFrame:
+        """
+        Toutes les lignes soumises : celles des blocs déjà enrichis, puis les
+        suivantes telles qu'importées (statut « non traité ») ; identique au
+        résultat pour un travail terminé
+        """
+        with self._verrou:
+            if self.resultat is not None:
+                return self.resultat
+            blocs = list(self._blocs)
+            traitees = sum(len(bloc) for bloc in blocs)
+        restantes = self.df.iloc[traitees:].copy()
+        if len(restantes):
+            restantes[COLONNE_STATUT] = STATUT_NON_TRAITE
+            blocs.append(restantes)
+        return pd.concat(blocs) if blocs else self.df.iloc[0:0]
+
+class RegistreTravaux:
+    """
+    Registre thread-safe des travaux d'un processus, exécutés par un pool
+    de `max_travaux` threads (les suivants attendent leur tour)
+
+    Les travaux finis sont conservés `duree_conservation` secondes, le
+    temps que l'interface récupère leur résultat.
+    """
+
+    def __init__(self, max_travaux: int = 2, duree_conservation: float = 3600.0):
+        self.duree_conservation = duree_conservation
+        self._travaux: Dict[str, TravailEnrichissement] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_travaux, thread_name_prefix="enrichissement")
+        self._verrou = threading.Lock()
+
+    def soumettre(self, df: pd.DataFrame, taille_bloc: int = 1000, **options) -> str:
+        """
+        Soumet un enrichissement ; voir `TravailEnrichissement`
+
+        Returns:
+            Identifiant du travail
+        """
+        travail = TravailEnrichissement(df, taille_bloc, **options)
+        self.nettoyer()
+        with self._verrou:
+            self._travaux[travail.identifiant] = travail
+        self._pool.submit(travail.executer)
+        return travail.identifiant
+
+    def obtenir(self, identifiant: str) -> Optional[TravailEnrichissement]:
+        """Le travail, ou None s'il est inconnu ou déjà oublié"""
+        with self._verrou:
+            return self._travaux.get(identifiant)
+
+    def annuler(self, identifiant: str):
+        travail = self.obtenir(identifiant)
+        if travail is not None:
+            travail.annuler()
+
+    def nettoyer(self):
+        """Oublie les travaux finis depuis plus de `duree_conservation` secondes"""
+        limite = monotonic() - self.duree_conservation
+        with self._verrou:
+            for identifiant in [identifiant for identifiant, travail in self._travaux.items()
+                                if travail.fini and travail.fin is not None and travail.fin < limite]:
+                del self._travaux[identifiant]
+
+    def __len__(self) -> int:
+        with self._verrou:
+            return len(self._travaux)
+
+    def fermer(self, annuler: bool = True):
+        """Arrête le pool, en annulant d'abord les travaux en cours"""
+        if annuler:
+            with self._verrou:
+                travaux = list(self._travaux.values())
+            for travail in travaux:
+                travail.annuler()
+        self._pool.shutdown(wait=True)
+
+_registre_partage: Optional[RegistreTravaux] = None
+_verrou_registre = threading.Lock()
+
+def registre_partage(max_travaux: int = 2) -> RegistreTravaux:
+    """
+    Retourne le registre de travaux du processus (partagé par toutes les
+    sessions Streamlit), créé au premier appel
+    """
+    global _registre_partage
+    with _verrou_registre:
+        if _registre_partage is None:
+            _registre_partage = RegistreTravaux(max_travaux)
+        return _registre_partage